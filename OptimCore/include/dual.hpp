@@ -0,0 +1,155 @@
+/**
+ *	\file dual.hpp
+ *
+ *	Forward-mode automatic differentiation with dual numbers.
+ *	A Dual<N> carries a value and its derivatives with respect to N variables. Arithmetic and the
+ *	math functions below apply the chain rule, so running a computation on Dual<N> instead of float
+ *	gives its result and its gradient in one pass.
+ */
+
+#ifndef __DUAL_H__
+#define __DUAL_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include <math.h>
+#include <stdint.h>
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+template <uint32_t N>
+class Dual
+{
+    public:
+        float v;        /*!< Value */
+        float d[N];     /*!< Derivative of the value with respect to each variable */
+
+        Dual(float value = 0.0F) : v(value)
+        {
+            for (uint32_t i = 0 ; i < N ; i++)
+            {
+                d[i] = 0.0F;
+            }
+        }
+
+        //Variable number index, whose derivative with respect to itself is 1
+        static Dual variable(float value, uint32_t index)
+        {
+            Dual x(value);
+            x.d[index] = 1.0F;
+            return x;
+        }
+
+        //Result of a function f with value fv and derivative fd at this point: f(x)' = f'(x) * x'
+        inline Dual chain(float fv, float fd) const
+        {
+            Dual x(fv);
+            for (uint32_t i = 0 ; i < N ; i++)
+            {
+                x.d[i] = fd * d[i];
+            }
+            return x;
+        }
+
+        inline Dual & operator+=(const Dual & b)
+        {
+            v += b.v;
+            for (uint32_t i = 0 ; i < N ; i++)
+            {
+                d[i] += b.d[i];
+            }
+            return *this;
+        }
+};
+
+template <uint32_t N>
+inline Dual<N> operator+(const Dual<N> & a, const Dual<N> & b)
+{
+    Dual<N> x(a.v + b.v);
+    for (uint32_t i = 0 ; i < N ; i++)
+    {
+        x.d[i] = a.d[i] + b.d[i];
+    }
+    return x;
+}
+
+template <uint32_t N>
+inline Dual<N> operator-(const Dual<N> & a, const Dual<N> & b)
+{
+    Dual<N> x(a.v - b.v);
+    for (uint32_t i = 0 ; i < N ; i++)
+    {
+        x.d[i] = a.d[i] - b.d[i];
+    }
+    return x;
+}
+
+template <uint32_t N>
+inline Dual<N> operator-(const Dual<N> & a)
+{
+    return a.chain(-a.v, -1.0F);
+}
+
+template <uint32_t N>
+inline Dual<N> operator*(const Dual<N> & a, const Dual<N> & b)
+{
+    Dual<N> x(a.v * b.v);
+    for (uint32_t i = 0 ; i < N ; i++)
+    {
+        x.d[i] = a.d[i] * b.v + a.v * b.d[i];
+    }
+    return x;
+}
+
+template <uint32_t N>
+inline Dual<N> operator/(const Dual<N> & a, const Dual<N> & b)
+{
+    Dual<N> x(a.v / b.v);
+    for (uint32_t i = 0 ; i < N ; i++)
+    {
+        x.d[i] = (a.d[i] - x.v * b.d[i]) / b.v;
+    }
+    return x;
+}
+
+//Mixed operations with constants
+template <uint32_t N> inline Dual<N> operator+(const Dual<N> & a, float b) { return a.chain(a.v + b, 1.0F); }
+template <uint32_t N> inline Dual<N> operator+(float a, const Dual<N> & b) { return b.chain(a + b.v, 1.0F); }
+template <uint32_t N> inline Dual<N> operator-(const Dual<N> & a, float b) { return a.chain(a.v - b, 1.0F); }
+template <uint32_t N> inline Dual<N> operator-(float a, const Dual<N> & b) { return b.chain(a - b.v, -1.0F); }
+template <uint32_t N> inline Dual<N> operator*(const Dual<N> & a, float b) { return a.chain(a.v * b, b); }
+template <uint32_t N> inline Dual<N> operator*(float a, const Dual<N> & b) { return b.chain(a * b.v, a); }
+template <uint32_t N> inline Dual<N> operator/(const Dual<N> & a, float b) { return a.chain(a.v / b, 1.0F / b); }
+template <uint32_t N> inline Dual<N> operator/(float a, const Dual<N> & b) { return b.chain(a / b.v, -a / (b.v * b.v)); }
+
+//Math functions
+template <uint32_t N> inline Dual<N> sin(const Dual<N> & a) { return a.chain(sinf(a.v), cosf(a.v)); }
+template <uint32_t N> inline Dual<N> cos(const Dual<N> & a) { return a.chain(cosf(a.v), -sinf(a.v)); }
+template <uint32_t N> inline Dual<N> sqrt(const Dual<N> & a) { float s = sqrtf(a.v); return a.chain(s, (s > 0.0F) ? 0.5F / s : 0.0F); }
+template <uint32_t N> inline Dual<N> asin(const Dual<N> & a) { return a.chain(asinf(a.v), 1.0F / sqrtf(1.0F - a.v * a.v)); }
+template <uint32_t N> inline Dual<N> fabs(const Dual<N> & a) { return a.chain(fabsf(a.v), (a.v < 0.0F) ? -1.0F : 1.0F); }
+
+template <uint32_t N>
+inline Dual<N> tan(const Dual<N> & a)
+{
+    float t = tanf(a.v);
+    return a.chain(t, 1.0F + t * t);
+}
+
+template <uint32_t N>
+inline Dual<N> atan2(const Dual<N> & y, const Dual<N> & x)
+{
+    float r2 = x.v * x.v + y.v * y.v;
+    Dual<N> z(atan2f(y.v, x.v));
+    for (uint32_t i = 0 ; i < N ; i++)
+    {
+        z.d[i] = (x.v * y.d[i] - y.v * x.d[i]) / r2;
+    }
+    return z;
+}
+
+#endif // __DUAL_H__
@@ -27,9 +27,14 @@
 
 #include <math.h>
 #include <algorithm>
-#include <random>
 #include <iostream>
 #include <fstream>
+#include <stdio.h>
+#include <string.h>
+#include <memory>
+#include <vector>
+#include "trajectory.hpp"
+#include "turbulence.hpp"
 
 /*----------------------------------------------------------------------------
  *        Definitions
@@ -41,8 +46,7 @@
 #define M2FT 3.28084               /*!< Number of feet in a meter */
 #define RAD2DEG (180 / M_PI)       /*!< Number of degrees in a radian */
 #define DEG2RAD (M_PI / 180)       /*!< Number of radians in a degree */
-#define N_samples_max 18000        /*!< Maximum number of samples for each trajectory state */
-#define N_states 17                /*!< Number of states in trajectory */
+#define N_aero 26                  /*!< Number of aerodynamic coefficients */
 
 #ifdef __cplusplus
 extern "C" {
@@ -72,7 +76,7 @@ typedef struct
     float windVelocity;         /*!<  */
     float windHeading;          /*!<  */
     float windElevation;        /*!<  */
-    float turbulenceIntensity;  /*!<  */
+    float turbulenceIntensity;  /*!< RMS gust velocity [m/s], set with Model::setTurbulence */
     float servosResponseTime;   /*!<  */
     float engineResponseTime;   /*!<  */
     float initVelocity;         /*!<  */
@@ -211,21 +215,87 @@ typedef struct
     float vz;        /*!<  */
 } States_t;
 
+/**
+ * \brief Integration methods of Model::propagate.
+ */
+typedef enum
+{
+    INTEGRATOR_TRAPEZOIDAL = 0,    /*!< Euler on the first step, then trapezoidal rule with the rates of the previous step */
+    INTEGRATOR_RK4 = 1,            /*!< Classic fourth order Runge-Kutta */
+    INTEGRATOR_RK45 = 2            /*!< Dormand-Prince 5(4) with error control, sub-stepping inside each step */
+} Integrator_t;
+
 /*----------------------------------------------------------------------------
  *        Exported functions
  *----------------------------------------------------------------------------*/
 
+class ThreadPool;
+
 class Model
 {
     public:
         Model(float freq);
+        Model(const Model &) = delete;
+        Model & operator=(const Model &) = delete;
         ~Model();
         
         void init(const bool useInitialTrajectoryStates);
         uint16_t propagate(Controls_t controls, float dtime);
-        void loadTrajectory(std::string filePath, uint32_t N_samples);
-        void getTrajectorySample(float * buf, uint32_t idx);
-        float evaluate(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse);
+        bool loadTrajectory(std::string filePath, uint32_t N_samples);
+        void setTrajectory(std::shared_ptr<const Trajectory> trajectory);
+        bool getTrajectorySample(float * buf, uint32_t idx);
+        uint32_t simulate(const float * controls, uint32_t N_steps, uint32_t stride, States_t * states);
+        float evaluate(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                       float abortAbove = INFINITY, uint32_t * samplesUsed = NULL);
+        void evaluateBatch(const float * coeffs, uint32_t N_candidates, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                           float * fitness, float abortAbove = INFINITY, uint32_t * samplesUsed = NULL);
+        float evaluateWithGradient(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse, float * gradient);
+        void sweepGrid(AeroCoeffs_t aero, const uint32_t * paramIndices, const float * lower, const float * upper,
+                       const uint32_t * resolution, uint32_t N_params, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                       float * fitness);
+        bool addSegment(std::shared_ptr<const Trajectory> trajectory, uint32_t first, uint32_t N_samples);
+        void clearSegments();
+        float evaluateSegments(AeroCoeffs_t aero, bool useLinearVelocities);
+        void evaluateSegmentsBatch(const float * coeffs, uint32_t N_candidates, bool useLinearVelocities, float * fitness);
+        void setNumberOfThreads(uint32_t N_threads);
+        uint32_t getNumberOfThreads();
+        void setIntegrator(Integrator_t integrator, float tolerance = 1e-4F);
+        void setTurbulence(float intensity, uint64_t seed);
+
+        inline const Turbulence & getTurbulence()
+        {
+            return _turbulence;
+        }
+
+        inline Integrator_t getIntegrator()
+        {
+            return _integrator;
+        }
+
+        inline float getTolerance()
+        {
+            return _tolerance;
+        }
+
+        inline float getFrequency()
+        {
+            return _frequency;
+        }
+
+        inline std::shared_ptr<const Trajectory> getTrajectory()
+        {
+            return _trajectory;
+        }
+
+        inline uint32_t getNumberOfSamples()
+        {
+            return _N_samples;
+        }
+
+        inline uint32_t getNumberOfSegments()
+        {
+            return (uint32_t)_segments.size();
+        }
 
         inline void getStates(States_t * states)
         {
@@ -271,6 +341,27 @@ class Model
         }
 
     private:
+        /**
+         * \brief Part of a trajectory with the initial conditions that init(true) takes from its first sample.
+         */
+        typedef struct
+        {
+            std::shared_ptr<const Trajectory> trajectory;
+            Params_t params;
+            Controls_t controls;
+            Internals_t internals;
+            States_t states;
+        } Segment_t;
+
+        Model(const Model * parent);
+        void initFromTrajectory();
+        void propagateRungeKutta(float dtime);
+        void computeAirData(const States_t & states, float cr, float sr, float cp, float sp, float cy, float sy);
+        void computeRates(const States_t & states, States_t & rates);
+        void restoreInitialTrajectoryStates();
+        void synchronizeWorkers();
+        void useSegment(const Segment_t & segment);
+
         Params_t _params;
         AeroCoeffs_t _aero;
         Controls_t _controls;
@@ -279,7 +370,20 @@ class Model
         uint32_t _N_samples;
         bool _firstPropagationCompleted;
         float _frequency;
-        float *_trajectory = new float[N_states * N_samples_max]();
+        Integrator_t _integrator;
+        float _tolerance;                  /*!< Relative and absolute error allowed per substep by INTEGRATOR_RK45 */
+        float _substep;                    /*!< Last substep length accepted by INTEGRATOR_RK45, 0 before the first one */
+        Params_t _initialParams;           /*!< Snapshot of init(true) taken when the trajectory is loaded */
+        Controls_t _initialControls;       /*!< Snapshot of init(true) taken when the trajectory is loaded */
+        Internals_t _initialInternals;     /*!< Snapshot of init(true) taken when the trajectory is loaded */
+        States_t _initialStates;           /*!< Snapshot of init(true) taken when the trajectory is loaded */
+        std::shared_ptr<const Trajectory> _trajectory;   /*!< Trajectory in use, shared with workers and other models */
+        const float *_trajectoryData;                    /*!< Samples of _trajectory, state s of sample i at [s * _stride + i] */
+        uint32_t _stride;                                /*!< Distance between two states of a sample in _trajectoryData */
+        std::unique_ptr<ThreadPool> _threadPool;         /*!< Pool used by evaluateBatch, created by setNumberOfThreads */
+        std::vector<std::unique_ptr<Model>> _workers;    /*!< One private integration state per pool thread */
+        std::vector<Segment_t> _segments;                /*!< Segments scored together by evaluateSegments */
+        Turbulence _turbulence;                          /*!< Gusts added to the wind, restarted with the initial states */
 };
 
 #ifdef __cplusplus
@@ -0,0 +1,78 @@
+/**
+ *	\file laneModel.hpp
+ *
+ *	Structure-of-arrays version of \link Model \endlink used for fitness evaluation.
+ *	Each lane holds the states of one candidate set of aerodynamic coefficients. All lanes are
+ *	initialized from the same trajectory sample and are fed the same control sequence, so they
+ *	can be advanced in lockstep with loops that run over contiguous arrays of lanes.
+ *	Arithmetic is the same as in Model::propagate, so the fitness of each lane is identical to
+ *	the one returned by Model::evaluate for the same coefficients.
+ */
+
+#ifndef __LANE_MODEL_H__
+#define __LANE_MODEL_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include "dynamicModel.hpp"
+
+/*----------------------------------------------------------------------------
+ *        Definitions
+ *----------------------------------------------------------------------------*/
+
+#define N_lanes 16                 /*!< Maximum number of candidates advanced in lockstep */
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+class LaneModel
+{
+    public:
+        LaneModel(const Params_t & params, const Controls_t & controls, const Internals_t & internals,
+                  const States_t & states, float freq);
+
+        void evaluate(const AeroCoeffs_t * aero, uint32_t N_candidates, bool useLinearVelocities,
+                      int32_t numberOfSamplesToUse, const float * trajectory, uint32_t N_samples, uint32_t stride,
+                      float * fitness, float abortAbove = INFINITY, uint32_t * samplesUsed = NULL);
+
+    private:
+        void reset(const AeroCoeffs_t * aero);
+        void propagate(const Controls_t & controls, float dtime);
+
+        //Initial conditions shared by every lane
+        Params_t _params;
+        Controls_t _initialControls;
+        Internals_t _initialInternals;
+        States_t _initialStates;
+        float _frequency;
+        uint32_t _N;
+        bool _firstPropagationCompleted;
+
+        //Aerodynamic coefficients of each lane
+        alignas(64) float _Cd0[N_lanes], _K[N_lanes], _Cdb[N_lanes], _Cyb[N_lanes], _Cyda[N_lanes], _Cydr[N_lanes];
+        alignas(64) float _Cyp[N_lanes], _Cyr[N_lanes], _Cl0[N_lanes], _Cla[N_lanes], _Cllb[N_lanes], _Cllda[N_lanes];
+        alignas(64) float _Clldr[N_lanes], _Cllp[N_lanes], _Cllr[N_lanes], _Cmm0[N_lanes], _Cmma[N_lanes], _Cmmda[N_lanes];
+        alignas(64) float _Cmmde[N_lanes], _Cmmdr[N_lanes], _Cmmq[N_lanes], _Cnnb[N_lanes], _Cnnda[N_lanes], _Cnndr[N_lanes];
+        alignas(64) float _Cnnp[N_lanes], _Cnnr[N_lanes];
+
+        //Controls of each lane
+        alignas(64) float _da[N_lanes], _de[N_lanes], _dr[N_lanes], _dt[N_lanes];
+
+        //States of each lane
+        alignas(64) float _roll[N_lanes], _pitch[N_lanes], _yaw[N_lanes];
+        alignas(64) float _p[N_lanes], _q[N_lanes], _r[N_lanes];
+        alignas(64) float _posNorth[N_lanes], _posEast[N_lanes], _alt[N_lanes];
+        alignas(64) float _vx[N_lanes], _vy[N_lanes], _vz[N_lanes];
+
+        //Internal variables of each lane that are carried from one step to the next
+        alignas(64) float _V[N_lanes], _alpha[N_lanes], _beta[N_lanes], _TAS[N_lanes], _Xt[N_lanes];
+        alignas(64) float _vx_dot_old[N_lanes], _vy_dot_old[N_lanes], _vz_dot_old[N_lanes];
+        alignas(64) float _roll_dot_old[N_lanes], _pitch_dot_old[N_lanes], _yaw_dot_old[N_lanes];
+        alignas(64) float _p_dot_old[N_lanes], _q_dot_old[N_lanes], _r_dot_old[N_lanes];
+        alignas(64) float _posNorth_dot_old[N_lanes], _posEast_dot_old[N_lanes], _alt_dot_old[N_lanes];
+};
+
+#endif // __LANE_MODEL_H__
@@ -0,0 +1,66 @@
+/**
+ *	\file sensitivityModel.hpp
+ *
+ *	Version of \link Model \endlink that propagates, along with every state, its derivatives with
+ *	respect to the N_aero aerodynamic coefficients (forward-mode dual numbers, see dual.hpp).
+ *	The fitness is computed as in Model::evaluate, so a single integration gives the fitness and
+ *	its gradient. Derivatives are taken with respect to the coefficients as passed to
+ *	Model::setAeroCoeffs, that is, before parameter encoding.
+ */
+
+#ifndef __SENSITIVITY_MODEL_H__
+#define __SENSITIVITY_MODEL_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include "dynamicModel.hpp"
+#include "dual.hpp"
+
+/*----------------------------------------------------------------------------
+ *        Types
+ *----------------------------------------------------------------------------*/
+
+typedef Dual<N_aero> AeroDual_t;   /*!< Value and derivatives with respect to the aerodynamic coefficients */
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+class SensitivityModel
+{
+    public:
+        SensitivityModel(const Params_t & params, const Controls_t & controls, const Internals_t & internals,
+                         const States_t & states, float freq);
+
+        float evaluate(const AeroCoeffs_t & aero, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                       const float * trajectory, uint32_t N_samples, uint32_t stride, float * gradient);
+
+    private:
+        void reset(const AeroCoeffs_t & aero);
+        void propagate(const Controls_t & controls, float dtime);
+
+        Params_t _params;
+        Controls_t _initialControls;
+        Internals_t _initialInternals;
+        States_t _initialStates;
+        float _frequency;
+        bool _firstPropagationCompleted;
+
+        //Aerodynamic coefficients, each one seeded as a variable
+        AeroDual_t _Cd0, _K, _Cdb, _Cyb, _Cyda, _Cydr, _Cyp, _Cyr, _Cl0, _Cla, _Cllb, _Cllda, _Clldr;
+        AeroDual_t _Cllp, _Cllr, _Cmm0, _Cmma, _Cmmda, _Cmmde, _Cmmdr, _Cmmq, _Cnnb, _Cnnda, _Cnndr, _Cnnp, _Cnnr;
+
+        //Controls and thrust do not depend on the coefficients
+        Controls_t _controls;
+        float _Xt;
+
+        //States and internal variables carried from one step to the next
+        AeroDual_t _roll, _pitch, _yaw, _p, _q, _r, _vx, _vy, _vz;
+        AeroDual_t _V, _alpha, _beta, _TAS;
+        AeroDual_t _vx_dot_old, _vy_dot_old, _vz_dot_old, _roll_dot_old, _pitch_dot_old, _yaw_dot_old;
+        AeroDual_t _p_dot_old, _q_dot_old, _r_dot_old;
+};
+
+#endif // __SENSITIVITY_MODEL_H__
@@ -0,0 +1,62 @@
+/**
+ *	\file threadPool.hpp
+ *
+ *	Persistent pool of worker threads used to evaluate several candidates at once.
+ *	The thread calling \link ThreadPool::run \endlink takes part in the work as thread 0,
+ *	so a pool of size 1 runs everything in the calling thread without any synchronization.
+ */
+
+#ifndef __THREAD_POOL_H__
+#define __THREAD_POOL_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include <stdint.h>
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <functional>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+class ThreadPool
+{
+    public:
+        typedef std::function<void(uint32_t task, uint32_t thread)> Job_t;
+
+        ThreadPool(uint32_t N_threads);
+        ~ThreadPool();
+
+        void run(uint32_t N_tasks, const Job_t & job);
+
+        inline uint32_t size() const
+        {
+            return _N_threads;
+        }
+
+    private:
+        void stopThreads();
+        void workerLoop(uint32_t thread);
+        void processTasks(uint32_t thread);
+
+        uint32_t _N_threads;
+        std::vector<std::thread> _threads;
+        std::mutex _mutex;
+        std::condition_variable _startCondition;
+        std::condition_variable _doneCondition;
+        const Job_t * _job;
+        uint32_t _N_tasks;
+        std::atomic<uint32_t> _nextTask;
+        uint32_t _activeThreads;
+        uint64_t _generation;
+        bool _stop;
+};
+
+#endif // __THREAD_POOL_H__
@@ -0,0 +1,74 @@
+/**
+ *	\file trajectory.hpp
+ *
+ *	Reference trajectory used by \link Model \endlink to initialize and evaluate the integration.
+ *	Samples are stored state by state: state s of sample i is data()[s * stride() + i].
+ *	Trajectories are handed around as std::shared_ptr, so any number of models (and their worker
+ *	threads) can read the same dataset, which is released when the last of them lets it go.
+ *	The storage is sized to the trajectory, so there is no limit on the number of samples.
+ */
+
+#ifndef __TRAJECTORY_H__
+#define __TRAJECTORY_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include <stdint.h>
+#include <functional>
+#include <memory>
+#include <string>
+#include <vector>
+
+/*----------------------------------------------------------------------------
+ *        Definitions
+ *----------------------------------------------------------------------------*/
+
+#define N_states 17                /*!< Number of states in trajectory */
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+class Trajectory
+{
+    public:
+        typedef std::function<void()> Release_t;
+
+        static std::shared_ptr<Trajectory> readCsv(std::string filePath, uint32_t N_samples);
+        static std::shared_ptr<Trajectory> readNpy(std::string filePath, uint32_t N_samples);
+        static std::shared_ptr<Trajectory> wrap(const float * data, uint32_t N_samples, uint32_t stride, Release_t release);
+        static std::shared_ptr<Trajectory> slice(std::shared_ptr<const Trajectory> parent, uint32_t first, uint32_t N_samples);
+        ~Trajectory();
+
+        inline const float * data() const
+        {
+            return _data;
+        }
+
+        inline uint32_t size() const
+        {
+            return _N_samples;
+        }
+
+        inline uint32_t stride() const
+        {
+            return _stride;
+        }
+
+    private:
+        Trajectory();
+        Trajectory(const Trajectory &) = delete;
+        Trajectory & operator=(const Trajectory &) = delete;
+
+        std::vector<float> _storage;    /*!< Samples read from a CSV file */
+        const float * _data;
+        uint32_t _N_samples;
+        uint32_t _stride;
+        Release_t _release;             /*!< Called on destruction for buffers owned by somebody else */
+        void * _mapping;                /*!< Memory-mapped .npy file, if any */
+        size_t _mappingLength;
+};
+
+#endif // __TRAJECTORY_H__
@@ -0,0 +1,67 @@
+/**
+ *	\file turbulence.hpp
+ *
+ *	Dryden turbulence with a seedable generator owned by each model.
+ *	Gusts are a field frozen along the flight path: unit variance first order Gauss-Markov sequences over distance,
+ *	which is the Dryden spectrum of the longitudinal component and is used for all three components since their scale
+ *	lengths are equal above 2000 ft (MIL-F-8785C). Samples are generated \link TURBULENCE_BLOCK \endlink at a time and
+ *	read by distance travelled, so the gusts of a model only depend on its seed and its path.
+ */
+
+#ifndef __TURBULENCE_H__
+#define __TURBULENCE_H__
+
+/*----------------------------------------------------------------------------
+ *        Headers
+ *----------------------------------------------------------------------------*/
+
+#include <math.h>
+#include <stdint.h>
+#include <vector>
+
+/*----------------------------------------------------------------------------
+ *        Definitions
+ *----------------------------------------------------------------------------*/
+
+#define TURBULENCE_SCALE 533.4F     /*!< Scale length of the gusts [m] */
+#define TURBULENCE_SPACING 1.0F     /*!< Distance between two gust samples [m] */
+#define TURBULENCE_BLOCK 4096       /*!< Number of gust samples generated at a time */
+
+/*----------------------------------------------------------------------------
+ *        Exported functions
+ *----------------------------------------------------------------------------*/
+
+class Turbulence
+{
+    public:
+        Turbulence(float intensity = 0.0F, uint64_t seed = 0);
+
+        void setIntensity(float intensity);
+        void setSeed(uint64_t seed);
+        void reset();
+        void advance(float step, float change[3]);
+
+        inline float getIntensity() const
+        {
+            return _intensity;
+        }
+
+        inline uint64_t getSeed() const
+        {
+            return _seed;
+        }
+
+    private:
+        void refill();
+        float normal();
+
+        float _intensity;           /*!< RMS gust velocity [m/s] */
+        uint64_t _seed;
+        uint64_t _state;            /*!< splitmix64 state */
+        float _spareNormal;         /*!< Second output of the last Box-Muller transform, NAN if used */
+        std::vector<float> _block;  /*!< Unit gusts, component c of sample i at [c * (TURBULENCE_BLOCK + 1) + i] */
+        float _position;            /*!< Position in _block in samples, negative before the first block */
+        float _gust[3];             /*!< Last gust returned, north, east and up [m/s] */
+};
+
+#endif // __TURBULENCE_H__
@@ -1,41 +1,56 @@
 #include "dynamicModel.hpp"
+#include "threadPool.hpp"
+#include "laneModel.hpp"
+#include "sensitivityModel.hpp"
 
 //Constructor
-Model::Model(float freq) : _N_samples(0)
+Model::Model(float freq) : _N_samples(0), _integrator(INTEGRATOR_TRAPEZOIDAL), _tolerance(1e-4F), _trajectoryData(NULL), _stride(0)
 {
     this->init(false);
     _frequency = freq;
 }
 
+//Worker constructor: integrates its own states over the trajectory of its parent
+Model::Model(const Model * parent) : _N_samples(0), _integrator(parent->_integrator), _tolerance(parent->_tolerance),
+                                     _trajectoryData(NULL), _stride(0),
+                                     _turbulence(parent->_turbulence.getIntensity(), parent->_turbulence.getSeed())
+{
+    this->init(false);
+    _frequency = parent->_frequency;
+}
+
 void Model::init(const bool useInitialTrajectoryStates)
 {
     _internals = {0};
     _states = {0, 0, 0, 0, 0, 0, 0, 0, 900, 0, 0, 0};
     _params = {750, 9.8056, 1.225, 9.84, 7000, 7.87, 1.25, 3531.9, 2196.4, 4887.7, 0, 0, 0, 0, 0, 0, 0, 0, 100};
+    _params.turbulenceIntensity = _turbulence.getIntensity();
+    _turbulence.reset();
     _aero = {0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265};
     _controls = {0, 0, 0, 0};
 
     _firstPropagationCompleted = false;
+    _substep = 0.0F;
 
-    if (useInitialTrajectoryStates)
+    if (useInitialTrajectoryStates && (_N_samples > 0))
     {
         //Set initial variables with loaded trajectory as reference
-        _controls.da = _trajectory[1 * _N_samples];
-        _controls.de = _trajectory[2 * _N_samples];
-        _controls.dr = _trajectory[3 * _N_samples];
-        _controls.dt = _trajectory[4 * _N_samples];
-        _states.roll = _trajectory[5 * _N_samples];
-        _states.pitch = _trajectory[6 * _N_samples];
-        _states.yaw = _trajectory[7 * _N_samples];
-        _states.p = _trajectory[14 * _N_samples];
-        _states.q = _trajectory[15 * _N_samples];
-        _states.r = _trajectory[16 * _N_samples];
-        _states.posNorth = _trajectory[8 * _N_samples];
-        _states.posEast = _trajectory[9 * _N_samples];
-        _states.alt = - _trajectory[10 * _N_samples]; //Caution: negated value
-        _states.vx = _trajectory[11 * _N_samples];
-        _states.vy = _trajectory[12 * _N_samples];
-        _states.vz = _trajectory[13 * _N_samples];
+        _controls.da = _trajectoryData[1 * _stride];
+        _controls.de = _trajectoryData[2 * _stride];
+        _controls.dr = _trajectoryData[3 * _stride];
+        _controls.dt = _trajectoryData[4 * _stride];
+        _states.roll = _trajectoryData[5 * _stride];
+        _states.pitch = _trajectoryData[6 * _stride];
+        _states.yaw = _trajectoryData[7 * _stride];
+        _states.p = _trajectoryData[14 * _stride];
+        _states.q = _trajectoryData[15 * _stride];
+        _states.r = _trajectoryData[16 * _stride];
+        _states.posNorth = _trajectoryData[8 * _stride];
+        _states.posEast = _trajectoryData[9 * _stride];
+        _states.alt = - _trajectoryData[10 * _stride]; //Caution: negated value
+        _states.vx = _trajectoryData[11 * _stride];
+        _states.vy = _trajectoryData[12 * _stride];
+        _states.vz = _trajectoryData[13 * _stride];
         _internals.V = sqrtf(_states.vx * _states.vx + _states.vy * _states.vy + _states.vz * _states.vz);
         _internals.alpha = atan2f(_states.vz, _states.vx) - _params.incidence;
         _internals.beta = asinf(_states.vy / _internals.V);
@@ -74,7 +89,65 @@ void Model::init(const bool useInitialTrajectoryStates)
 
 Model::~Model()
 {
-    delete _trajectory;
+    _threadPool.reset(); // Join threads before releasing the workers they use
+}
+
+void Model::setNumberOfThreads(uint32_t N_threads)
+{
+    if (0 == N_threads)
+    {
+        N_threads = std::max(std::thread::hardware_concurrency(), 1U);
+    }
+    //Built aside, so that the model keeps its previous threads if the new ones cannot be started
+    std::vector<std::unique_ptr<Model>> workers;
+    for (uint32_t i = 0 ; i < N_threads ; i++)
+    {
+        workers.emplace_back(new Model(this));
+    }
+    std::unique_ptr<ThreadPool> threadPool(new ThreadPool(N_threads));
+    _threadPool = std::move(threadPool); // Joins the previous threads before releasing the workers they use
+    _workers = std::move(workers);
+}
+
+uint32_t Model::getNumberOfThreads()
+{
+    return _threadPool ? _threadPool->size() : 1;
+}
+
+void Model::synchronizeWorkers()
+{
+    for (std::unique_ptr<Model> & worker : _workers)
+    {
+        worker->_frequency = _frequency;
+        worker->_integrator = _integrator;
+        worker->_tolerance = _tolerance;
+        worker->_trajectory = _trajectory;
+        worker->_trajectoryData = _trajectoryData;
+        worker->_stride = _stride;
+        worker->_N_samples = _N_samples;
+        worker->_initialParams = _initialParams;
+        worker->_initialControls = _initialControls;
+        worker->_initialInternals = _initialInternals;
+        worker->_initialStates = _initialStates;
+        worker->_turbulence.setIntensity(_turbulence.getIntensity());
+        worker->_turbulence.setSeed(_turbulence.getSeed());
+    }
+}
+
+/**
+ * \brief Sets the RMS gust velocity [m/s] of the turbulence (0 disables it) and the seed of its gusts.
+ * Every evaluation restarts the gusts from the seed, so results do not depend on the thread that runs them.
+ */
+void Model::setTurbulence(float intensity, uint64_t seed)
+{
+    _turbulence.setIntensity(intensity);
+    _turbulence.setSeed(seed);
+    _params.turbulenceIntensity = intensity;
+    _initialParams.turbulenceIntensity = intensity;
+    for (Segment_t & segment : _segments)
+    {
+        segment.params.turbulenceIntensity = intensity;
+    }
 }
 
 uint16_t Model::propagate(Controls_t controls, float dtime)
@@ -92,6 +165,22 @@ uint16_t Model::propagate(Controls_t controls, float dtime)
         _controls.dt += (1.0F / (_frequency * _params.servosResponseTime)) * (controls.dt - _controls.dt);
     }
 
+    //Introduce turbulence
+    if (_params.turbulenceIntensity != 0.0F)
+    {
+        float change[3];
+        _turbulence.advance(_internals.TAS * dtime, change);
+        _internals.windNorth += change[0];
+        _internals.windEast += change[1];
+        _internals.windUp += change[2];
+    }
+
+    if (_integrator != INTEGRATOR_TRAPEZOIDAL)
+    {
+        this->propagateRungeKutta(dtime);
+        return 0;
+    }
+
     //Euler trigonometry variables
     float cr = cosf(_states.roll);
     float sr = sinf(_states.roll);
@@ -105,18 +194,6 @@ uint16_t Model::propagate(Controls_t controls, float dtime)
     float coeffA = _params.b / (2.0F * _internals.V);
     float coeffB = _params.c / (2.0F * _internals.V);
 
-    //Introduce turbulence
-    if (_params.turbulenceIntensity != 0.0F)
-    {
-        static std::mt19937 _gen;
-        static std::uniform_real_distribution<float> _dist(0, 1);
-        float turb = _params.turbulenceIntensity * 10.0F;
-        float turbulenceCoeff = 1.0F / std::max(std::min(-1.08F * _internals.TAS + 120.0F, 0.1F), 100.0F);
-        _internals.windNorth += turbulenceCoeff * (_dist(_gen) * turb - turb / 2.0F);
-        _internals.windEast += turbulenceCoeff * (_dist(_gen) * turb - turb / 2.0F);
-        _internals.windUp += turbulenceCoeff * (_dist(_gen) * turb - turb / 2.0F);
-    }
-
     //Force coefficients
     _internals.Cl = _aero.Cl0 + _aero.Cla * _internals.alpha;
     _internals.Cd = _aero.Cd0 + _aero.K * _internals.Cl * _internals.Cl + _aero.Cdb * std::abs(_internals.beta);
@@ -260,48 +337,340 @@ uint16_t Model::propagate(Controls_t controls, float dtime)
     return 0;
 }
 
-void Model::loadTrajectory(std::string filePath, uint32_t N_samples)
+void Model::setIntegrator(Integrator_t integrator, float tolerance)
+{
+    _integrator = integrator;
+    _tolerance = tolerance;
+    _substep = 0.0F;
+}
+
+/**
+ * \brief NED velocities, real velocity, true airspeed and aerodynamic angles of states, given the sines and cosines of
+ * its Euler angles.
+ */
+void Model::computeAirData(const States_t & states, float cr, float sr, float cp, float sp, float cy, float sy)
+{
+    //Linear velocities in NED axes
+    _internals.posNorth_dot = states.vx * cp * cy + states.vy * (-cr * sy + sr * sp * cy) + states.vz * (sr * sy + cr * sp * cy);
+    _internals.posEast_dot = states.vx * cp * sy + states.vy * (cr * cy + sr * sp * sy) + states.vz * (-sr * cy + cr * sp * sy);
+    _internals.alt_dot = states.vx * sp - states.vy * sr * cp - states.vz * cr * cp;
+
+    //Real velocity, true airspeed and aerodynamic angles
+    _internals.V = sqrtf(states.vx * states.vx + states.vy * states.vy + states.vz * states.vz);
+    _internals.TAS_North = _internals.posNorth_dot - _internals.windNorth;
+    _internals.TAS_East = _internals.posEast_dot - _internals.windEast;
+    _internals.TAS_Up = _internals.alt_dot - _internals.windUp;
+    _internals.TAS = sqrtf(_internals.TAS_North * _internals.TAS_North + _internals.TAS_East * _internals.TAS_East + _internals.TAS_Up * _internals.TAS_Up);
+    _internals.TAS_x = cp * cy * _internals.TAS_North + cp * sy * _internals.TAS_East - sp * (-_internals.TAS_Up);  //Transform from flat-Earth axes to body-axes
+    _internals.TAS_y = (sr * sp * cy - cr * sy) * _internals.TAS_North + (sr * sp * sy + cr * cy) * _internals.TAS_East + sr * cp * (-_internals.TAS_Up);
+    _internals.TAS_z = (cr * sp * cy + sr * sy) * _internals.TAS_North + (cr * sp * sy - sr * cy) * _internals.TAS_East + cr * cp * (-_internals.TAS_Up);
+    _internals.alpha = atan2f(_internals.TAS_z, _internals.TAS_x) - _params.incidence;
+    _internals.beta = asinf(_internals.TAS_y / _internals.TAS);
+}
+
+/**
+ * \brief Rates of states at the given states, for Runge-Kutta stages.
+ * Unlike the trapezoidal integrator, airspeed and aerodynamic angles are those of the given states. Forces,
+ * moments and rates are stored in _internals as well.
+ */
+void Model::computeRates(const States_t & states, States_t & rates)
 {
-    _N_samples = N_samples;
-    std::string lineString;
-    std::ifstream readStream;
-    readStream.open(filePath);
-    std::getline(readStream, lineString); // Reads first line since it is not needed
-    uint16_t lineNumber = 0;
-    for (;;)
-    {
-        lineString.clear();
-        std::getline(readStream, lineString); // Reads next line in file
-        if (lineString.empty())
+    //Euler trigonometry variables
+    float cr = cosf(states.roll);
+    float sr = sinf(states.roll);
+    float cp = cosf(states.pitch);
+    float sp = sinf(states.pitch);
+    float tp = tanf(states.pitch);
+    float cy = cosf(states.yaw);
+    float sy = sinf(states.yaw);
+
+    this->computeAirData(states, cr, sr, cp, sp, cy, sy);
+
+    //Auxiliary coefficients
+    float coeffA = _params.b / (2.0F * _internals.V);
+    float coeffB = _params.c / (2.0F * _internals.V);
+
+    //Force coefficients
+    _internals.Cl = _aero.Cl0 + _aero.Cla * _internals.alpha;
+    _internals.Cd = _aero.Cd0 + _aero.K * _internals.Cl * _internals.Cl + _aero.Cdb * std::abs(_internals.beta);
+    _internals.Cy = _aero.Cyb * _internals.beta + _aero.Cydr * _controls.dr + _aero.Cyda * _controls.da + coeffA * (_aero.Cyp * states.p + _aero.Cyr * states.r);
+
+    //Moment coefficients
+    _internals.Cll = _aero.Cllb * _internals.beta + _aero.Cllda * _controls.da + _aero.Clldr * _controls.dr + coeffA * (_aero.Cllp * states.p + _aero.Cllr * states.r);
+    _internals.Cmm = _aero.Cmm0 + _aero.Cmma * _internals.alpha + _aero.Cmmde * _controls.de + _aero.Cmmdr * _controls.dr + _aero.Cmmda * std::fabs(_controls.da) + coeffB*(_aero.Cmmq * states.q);
+    _internals.Cnn = _aero.Cnnb * _internals.beta + _aero.Cnnda * _controls.da + _aero.Cnndr * _controls.dr + coeffA * (_aero.Cnnp * states.p + _aero.Cnnr * states.r);
+
+    //Dynamic forces and moments
+    float qd_times_S = 0.5F * _params.rho * _internals.TAS * _internals.TAS * _params.S;
+    float qd_times_S_times_b = qd_times_S * _params.b;
+    float qd_times_S_times_c = qd_times_S * _params.c;
+    _internals.D = qd_times_S_times_b * _internals.Cd;
+    _internals.Y = qd_times_S_times_c * _internals.Cy;
+    _internals.L = qd_times_S_times_b * _internals.Cl;
+    _internals.LL = qd_times_S_times_b * _internals.Cll;
+    _internals.MM = qd_times_S_times_c * _internals.Cmm;
+    _internals.NN = qd_times_S_times_b * _internals.Cnn;
+
+    //Transform forces to body-axes
+    float ca = cosf(_internals.alpha);
+    float sa = sinf(_internals.alpha);
+    float cb = cosf(_internals.beta);
+    float sb = sinf(_internals.beta);
+    _internals.Xa = -ca * cb * _internals.D - ca * sb * _internals.Y + sa * _internals.L;
+    _internals.Ya = -sb * _internals.D + cb * _internals.Y;
+    _internals.Za = -sa * cb * _internals.D - sa * sb * _internals.Y - ca * _internals.L;
+
+    //Linear accelerations in body-axes
+    rates.vx = states.r * states.vy - states.q * states.vz - _params.g * sp + (_internals.Xa + _internals.Xt) / _params.m;
+    rates.vy = -states.r * states.vx + states.p * states.vz + _params.g * sr * cp + _internals.Ya / _params.m;
+    rates.vz = states.q * states.vx - states.p * states.vy + _params.g * cr * cp + _internals.Za / _params.m;
+
+    //Euler rates
+    rates.roll = states.p + tp * (states.q * sr + states.r * cr);
+    rates.pitch = states.q * cr - states.r * sr;
+    rates.yaw = (states.q * sr + states.r * cr) / cp;
+
+    //Angular accelerations in body-axes
+    float aux = _params.Ix * _params.Iz - _params.Ixz * _params.Ixz;
+    rates.p = (_params.Ixz * (_params.Ix - _params.Iy + _params.Iz) * states.p * states.q - (_params.Iz * (_params.Iz - _params.Iy) + _params.Ixz * _params.Ixz) * states.q * states.r + _params.Iz * _internals.LL + _params.Ixz * _internals.NN) / aux;
+    rates.q = ((_params.Iz - _params.Ix) * states.p * states.r - _params.Ixz * (states.p * states.p - states.r * states.r) + _internals.MM) / _params.Iy;
+    rates.r = (((_params.Ix - _params.Iy) * _params.Ix + _params.Ixz * _params.Ixz) * states.p * states.q - _params.Ixz * (_params.Ix - _params.Iy + _params.Iz) * states.q * states.r + _params.Ixz * _internals.LL + _params.Ix * _internals.NN) / aux;
+
+    //Position rates
+    rates.posNorth = _internals.posNorth_dot;
+    rates.posEast = _internals.posEast_dot;
+    rates.alt = _internals.alt_dot;
+
+    _internals.vx_dot = rates.vx;
+    _internals.vy_dot = rates.vy;
+    _internals.vz_dot = rates.vz;
+    _internals.roll_dot = rates.roll;
+    _internals.pitch_dot = rates.pitch;
+    _internals.yaw_dot = rates.yaw;
+    _internals.p_dot = rates.p;
+    _internals.q_dot = rates.q;
+    _internals.r_dot = rates.r;
+}
+
+//states + h * sum(b[j] * k[j]) for the N_k first stages
+static States_t combineStages(const States_t & states, float h, const float * b, const States_t * k, uint32_t N_k)
+{
+    static_assert(sizeof(States_t) == 12 * sizeof(float), "States_t must be packed as 12 floats");
+    States_t result = states;
+    float * y = (float *)&result;
+    for (uint32_t j = 0 ; j < N_k ; j++)
+    {
+        const float * kj = (const float *)&k[j];
+        for (uint32_t i = 0 ; i < 12 ; i++)
         {
-            break;
+            y[i] += h * b[j] * kj[i];
         }
-        std::string delimiter = ",";
-        size_t pos = 0;
-        uint16_t stateNumber = 0;
-        std::string token;
-        while ((pos = lineString.find(delimiter)) != std::string::npos)
+    }
+    return result;
+}
+
+/**
+ * \brief Advances dtime with the Runge-Kutta method selected by setIntegrator.
+ * INTEGRATOR_RK45 splits dtime in as many substeps as its error control needs, starting from the length
+ * accepted in the previous call.
+ */
+void Model::propagateRungeKutta(float dtime)
+{
+    //Thrust does not depend on states, so it is updated once per step
+    if (0.0F == _params.engineResponseTime)
+    {
+        _internals.Xt = _params.Tmax * _controls.dt;
+    }
+    else
+    {
+        _internals.Xt += (1.0F / (_frequency * _params.engineResponseTime)) * (_params.Tmax * _controls.dt - _internals.Xt);
+    }
+    _internals.rotor_rpm = _internals.Xt * 400 / _params.Tmax;
+
+    States_t initialStates = _states;
+    States_t k[7];
+    if (INTEGRATOR_RK4 == _integrator)
+    {
+        static const float a2[] = {0.5F};
+        static const float a3[] = {0.0F, 0.5F};
+        static const float a4[] = {0.0F, 0.0F, 1.0F};
+        static const float b[] = {1.0F / 6.0F, 1.0F / 3.0F, 1.0F / 3.0F, 1.0F / 6.0F};
+        this->computeRates(_states, k[0]);
+        this->computeRates(combineStages(_states, dtime, a2, k, 1), k[1]);
+        this->computeRates(combineStages(_states, dtime, a3, k, 2), k[2]);
+        this->computeRates(combineStages(_states, dtime, a4, k, 3), k[3]);
+        _states = combineStages(_states, dtime, b, k, 4);
+
+        //Stages leave the air data of the last one, which the next step needs at the accepted states
+        this->computeAirData(_states, cosf(_states.roll), sinf(_states.roll), cosf(_states.pitch), sinf(_states.pitch),
+                             cosf(_states.yaw), sinf(_states.yaw));
+    }
+    else
+    {
+        //Dormand-Prince coefficients, the last row gives the fifth order solution
+        static const float a[6][6] = {{1.0F / 5.0F},
+                                      {3.0F / 40.0F, 9.0F / 40.0F},
+                                      {44.0F / 45.0F, -56.0F / 15.0F, 32.0F / 9.0F},
+                                      {19372.0F / 6561.0F, -25360.0F / 2187.0F, 64448.0F / 6561.0F, -212.0F / 729.0F},
+                                      {9017.0F / 3168.0F, -355.0F / 33.0F, 46732.0F / 5247.0F, 49.0F / 176.0F, -5103.0F / 18656.0F},
+                                      {35.0F / 384.0F, 0.0F, 500.0F / 1113.0F, 125.0F / 192.0F, -2187.0F / 6784.0F, 11.0F / 84.0F}};
+        //Difference between the fifth and fourth order solutions
+        static const float e[7] = {71.0F / 57600.0F, 0.0F, -71.0F / 16695.0F, 71.0F / 1920.0F, -17253.0F / 339200.0F,
+                                   22.0F / 525.0F, -1.0F / 40.0F};
+        float minimumSubstep = dtime * 1e-3F;
+        float h = ((_substep > 0.0F) && (_substep < dtime)) ? _substep : dtime;
+        float elapsed = 0.0F;
+        this->computeRates(_states, k[0]);
+        while (elapsed < dtime)
         {
-            token = lineString.substr(0, pos); // Extract text from start until first delimiter is found
-            _trajectory[stateNumber * _N_samples + lineNumber] = std::stof(token);
-            lineString.erase(0, pos + delimiter.length()); // Delete this section from the string since it has already been parsed
-            stateNumber++;
+            h = std::min(h, dtime - elapsed);
+            for (uint32_t stage = 1 ; stage < 7 ; stage++)
+            {
+                this->computeRates(combineStages(_states, h, a[stage - 1], k, stage), k[stage]);
+            }
+            States_t candidate = combineStages(_states, h, a[5], k, 6);
+            States_t error = combineStages({0}, h, e, k, 7);
+
+            //Largest error relative to the tolerance, NaN if the integration diverged
+            float errorRatio = 0.0F;
+            const float * y0 = (const float *)&_states;
+            const float * y1 = (const float *)&candidate;
+            const float * err = (const float *)&error;
+            for (uint32_t i = 0 ; i < 12 ; i++)
+            {
+                float scale = _tolerance * (1.0F + std::max(std::fabs(y0[i]), std::fabs(y1[i])));
+                errorRatio = std::max(errorRatio, std::fabs(err[i]) / scale);
+            }
+            bool accepted = (errorRatio <= 1.0F) || (h <= minimumSubstep) || std::isnan(errorRatio);
+            if (accepted)
+            {
+                _states = candidate;
+                elapsed = (h >= dtime - elapsed) ? dtime : elapsed + h;
+                k[0] = k[6]; // Last stage is evaluated at the new states
+            }
+            float factor = (errorRatio > 0.0F) ? 0.9F * powf(errorRatio, -0.2F) : 5.0F;
+            h = std::max(h * std::min(5.0F, std::max(0.2F, factor)), minimumSubstep);
+            if (accepted && std::isnan(errorRatio))
+            {
+                break; // Diverged, no point in integrating further
+            }
         }
-        _trajectory[stateNumber * _N_samples + lineNumber] = std::stof(lineString);
-        lineNumber++;
+        _substep = h;
+    }
+
+    //Transform flat earth position to LLA
+    float sinLat = sinf(_internals.lat);
+    sinLat *= sinLat;
+    float RN = ER / sqrtf(1 - EFDMEFS * sinLat);
+    float RM = RN * ((1 - EFDMEFS) / (1 - EFDMEFS * sinLat));
+    _internals.lon += atan2f(1, RN * cosf(_internals.lat)) * (_states.posEast - initialStates.posEast);
+    _internals.lat += atan2f(1, RM) * (_states.posNorth - initialStates.posNorth);
+
+    //Real velocity
+    _internals.V = sqrtf(_states.vx * _states.vx + _states.vy * _states.vy + _states.vz * _states.vz);
+
+    //Accumulate time
+    _firstPropagationCompleted = true;
+    _internals.total_time += dtime;
+}
+
+bool Model::loadTrajectory(std::string filePath, uint32_t N_samples)
+{
+    bool isNpy = (filePath.size() >= 4) && (0 == filePath.compare(filePath.size() - 4, 4, ".npy"));
+    std::shared_ptr<const Trajectory> trajectory = isNpy ? Trajectory::readNpy(filePath, N_samples) : Trajectory::readCsv(filePath, N_samples);
+    if (!trajectory)
+    {
+        return false;
     }
+    this->setTrajectory(trajectory);
+    return true;
+}
+
+/**
+ * \brief Uses a trajectory without copying it.
+ * The trajectory stays alive as long as any model (or Python object) holds it, so it can be shared freely.
+ * Registered segments are removed, since they refer to the previous data.
+ */
+void Model::setTrajectory(std::shared_ptr<const Trajectory> trajectory)
+{
+    _trajectory = trajectory;
+    _trajectoryData = trajectory ? trajectory->data() : NULL;
+    _stride = trajectory ? trajectory->stride() : 0;
+    _N_samples = trajectory ? trajectory->size() : 0;
+    _segments.clear(); // Segments belong to the previous data
+    this->initFromTrajectory();
+}
+
+void Model::initFromTrajectory()
+{
     this->init(true); // useInitialTrajectoryStates = true
+
+    //Keep initial conditions so that evaluations do not need to run init(true) again
+    _initialParams = _params;
+    _initialControls = _controls;
+    _initialInternals = _internals;
+    _initialStates = _states;
+}
+
+void Model::restoreInitialTrajectoryStates()
+{
+    _params = _initialParams;
+    _controls = _initialControls;
+    _internals = _initialInternals;
+    _states = _initialStates;
+    _firstPropagationCompleted = false;
+    _substep = 0.0F;
+    _turbulence.reset();
 }
 
-void Model::getTrajectorySample(float * buf, uint32_t idx)
+bool Model::getTrajectorySample(float * buf, uint32_t idx)
 {
+    if (idx >= _N_samples)
+    {
+        return false;
+    }
     for (uint16_t i = 0 ; i < N_states ; i++)
     {
-        buf[i] = _trajectory[i * _N_samples + idx];
+        buf[i] = _trajectoryData[i * _stride + idx];
+    }
+    return true;
+}
+
+/**
+ * \brief Propagates the model from its current states through a sequence of controls, recording every state.
+ * controls holds da, de, dr and dt in rows of stride elements, N_steps columns. If it is NULL, the controls of
+ * the loaded trajectory are used, and at most its number of samples are integrated.
+ * states receives the current states followed by the states after each step, so it must hold N_steps + 1 rows.
+ * Returns the number of integrated steps.
+ */
+uint32_t Model::simulate(const float * controls, uint32_t N_steps, uint32_t stride, States_t * states)
+{
+    if (controls == NULL)
+    {
+        controls = &_trajectoryData[1 * _stride];
+        stride = _stride;
+        N_steps = std::min(N_steps, _N_samples);
     }
+    float dtime = 1.0F / _frequency;
+    states[0] = _states;
+    for (uint32_t i = 0 ; i < N_steps ; i++)
+    {
+        Controls_t stepControls = {controls[i], controls[stride + i], controls[2 * stride + i], controls[3 * stride + i]};
+        this->propagate(stepControls, dtime);
+        states[i + 1] = _states;
+    }
+    return N_steps;
 }
 
-float Model::evaluate(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse)
+/**
+ * \brief Mean error between the model and the loaded trajectory for the given coefficients.
+ * Integration stops as soon as the accumulated error proves that the fitness cannot be below abortAbove,
+ * in which case the partial fitness (a lower bound of the full one) is returned. A diverged integration
+ * (NaN or infinite error) stops immediately and returns INFINITY. samplesUsed, if given, receives the
+ * number of integrated samples.
+ */
+float Model::evaluate(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                      float abortAbove, uint32_t * samplesUsed)
 {
     if (numberOfSamplesToUse < 0)
     {
@@ -312,36 +681,283 @@ float Model::evaluate(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numbe
         numberOfSamplesToUse = _N_samples;
     }
     AeroCoeffs_t originalAero = _aero;
-    this->init(true); // useInitialTrajectoryStates = true
+    this->restoreInitialTrajectoryStates(); // Same as init(true) but without reading the trajectory again
     this->setAeroCoeffs(aero);
     float dt = 1.0F / _frequency;
     // float diffNorth, diffEast, diffDown = 0.0F;
     float diffVx, diffVy, diffVz = 0.0F;
     float diffp, diffq, diffr = 0.0F;
     float fitness = 0.0F;
-    for (int32_t i = 0 ; i < numberOfSamplesToUse ; i++)
+    float abortSum = abortAbove * numberOfSamplesToUse; // Accumulated error above which the mean cannot be below abortAbove
+    int32_t i = 0;
+    while (i < numberOfSamplesToUse)
     {
-        Controls_t controls = {_trajectory[1 * _N_samples + i],   //da
-                               _trajectory[2 * _N_samples + i],   //de
-                               _trajectory[3 * _N_samples + i],   //dr
-                               _trajectory[4 * _N_samples + i]};  //dt
+        Controls_t controls = {_trajectoryData[1 * _stride + i],   //da
+                               _trajectoryData[2 * _stride + i],   //de
+                               _trajectoryData[3 * _stride + i],   //dr
+                               _trajectoryData[4 * _stride + i]};  //dt
         this->propagate(controls, dt);
-        // diffNorth = (_states.posNorth - _trajectory[8 * _N_samples + i]);
-        // diffEast = (_states.posEast - _trajectory[9 * _N_samples + i]);
-        // diffDown = (-_states.alt - _trajectory[10 * _N_samples + i]);
+        // diffNorth = (_states.posNorth - _trajectoryData[8 * _stride + i]);
+        // diffEast = (_states.posEast - _trajectoryData[9 * _stride + i]);
+        // diffDown = (-_states.alt - _trajectoryData[10 * _stride + i]);
         // fitness += sqrtf(diffNorth * diffNorth + diffEast * diffEast + diffDown * diffDown);
         if (useLinearVelocities)
         {
-            diffVx = (_states.vx - _trajectory[11 * _N_samples + i]);
-            diffVy = (_states.vy - _trajectory[12 * _N_samples + i]);
-            diffVz = (_states.vz - _trajectory[13 * _N_samples + i]);
+            diffVx = (_states.vx - _trajectoryData[11 * _stride + i]);
+            diffVy = (_states.vy - _trajectoryData[12 * _stride + i]);
+            diffVz = (_states.vz - _trajectoryData[13 * _stride + i]);
             fitness += sqrtf(diffVx * diffVx + diffVy * diffVy + diffVz * diffVz);
         }
-        diffp = (_states.p - _trajectory[14 * _N_samples + i]);
-        diffq = (_states.q - _trajectory[15 * _N_samples + i]);
-        diffr = (_states.r - _trajectory[16 * _N_samples + i]);
+        diffp = (_states.p - _trajectoryData[14 * _stride + i]);
+        diffq = (_states.q - _trajectoryData[15 * _stride + i]);
+        diffr = (_states.r - _trajectoryData[16 * _stride + i]);
         fitness += sqrtf(diffp * diffp + diffq * diffq + diffr * diffr);
+        i++;
+        if (!(fitness <= abortSum)) // Also true for NaN
+        {
+            break;
+        }
     }
     _aero = originalAero;
+    if (samplesUsed != NULL)
+    {
+        samplesUsed[0] = i;
+    }
+    if (!std::isfinite(fitness))
+    {
+        return INFINITY; // Diverged
+    }
     return fitness / numberOfSamplesToUse;
 }
+
+/**
+ * \brief Fitness as returned by evaluate (without abort) and its gradient with respect to the N_aero coefficients,
+ * computed in a single integration. The trapezoidal integrator is always used and turbulence is not applied.
+ */
+float Model::evaluateWithGradient(AeroCoeffs_t aero, bool useLinearVelocities, int32_t numberOfSamplesToUse, float * gradient)
+{
+    SensitivityModel sensitivity(_initialParams, _initialControls, _initialInternals, _initialStates, _frequency);
+    return sensitivity.evaluate(aero, useLinearVelocities, numberOfSamplesToUse, _trajectoryData, _N_samples, _stride, gradient);
+}
+
+void Model::evaluateBatch(const float * coeffs, uint32_t N_candidates, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                          float * fitness, float abortAbove, uint32_t * samplesUsed)
+{
+    static_assert(sizeof(AeroCoeffs_t) == N_aero * sizeof(float), "AeroCoeffs_t must be packed as N_aero floats");
+    const AeroCoeffs_t * aero = (const AeroCoeffs_t *)coeffs; // Each row holds the coefficients of one candidate
+    uint32_t N_threads = this->getNumberOfThreads();
+
+    //Lanes do not model turbulence and only implement the trapezoidal integrator,
+    //so those candidates are integrated one by one
+    if ((_initialParams.turbulenceIntensity != 0.0F) || (_integrator != INTEGRATOR_TRAPEZOIDAL))
+    {
+        if (!_threadPool)
+        {
+            for (uint32_t i = 0 ; i < N_candidates ; i++)
+            {
+                fitness[i] = this->evaluate(aero[i], useLinearVelocities, numberOfSamplesToUse, abortAbove,
+                                            samplesUsed != NULL ? &samplesUsed[i] : NULL);
+            }
+            return;
+        }
+
+        //Every thread integrates with its own worker, all of them reading the same trajectory
+        this->synchronizeWorkers();
+        _threadPool->run(N_candidates, [&](uint32_t task, uint32_t thread)
+        {
+            fitness[task] = _workers[thread]->evaluate(aero[task], useLinearVelocities, numberOfSamplesToUse, abortAbove,
+                                                       samplesUsed != NULL ? &samplesUsed[task] : NULL);
+        });
+        return;
+    }
+
+    //Candidates are split in groups of lanes that are integrated in lockstep, keeping every thread busy
+    uint32_t lanesPerGroup = std::min((N_candidates + N_threads - 1) / N_threads, (uint32_t)N_lanes);
+    lanesPerGroup = std::max(lanesPerGroup, (uint32_t)1);
+    uint32_t N_groups = (N_candidates + lanesPerGroup - 1) / lanesPerGroup;
+    auto evaluateGroup = [&](uint32_t group, uint32_t thread)
+    {
+        uint32_t first = group * lanesPerGroup;
+        LaneModel lanes(_initialParams, _initialControls, _initialInternals, _initialStates, _frequency);
+        lanes.evaluate(&aero[first], std::min(lanesPerGroup, N_candidates - first), useLinearVelocities,
+                       numberOfSamplesToUse, _trajectoryData, _N_samples, _stride, &fitness[first], abortAbove,
+                       samplesUsed != NULL ? &samplesUsed[first] : NULL);
+    };
+    if (_threadPool)
+    {
+        _threadPool->run(N_groups, evaluateGroup);
+    }
+    else
+    {
+        for (uint32_t group = 0 ; group < N_groups ; group++)
+        {
+            evaluateGroup(group, 0);
+        }
+    }
+}
+/**
+ * \brief Fitness over a regular grid of N_params coefficients, the rest of them fixed to aero.
+ * Coefficient paramIndices[j] takes resolution[j] values evenly spaced from lower[j] to upper[j], both included.
+ * fitness receives one value per grid point in row-major order (the last coefficient varies fastest).
+ * Grid points are evaluated in chunks with evaluateBatch, so they are spread over the thread pool.
+ */
+void Model::sweepGrid(AeroCoeffs_t aero, const uint32_t * paramIndices, const float * lower, const float * upper,
+                      const uint32_t * resolution, uint32_t N_params, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                      float * fitness)
+{
+    const uint32_t N_chunk = 4096;
+    uint64_t N_points = 1;
+    for (uint32_t j = 0 ; j < N_params ; j++)
+    {
+        N_points *= resolution[j];
+    }
+    std::vector<AeroCoeffs_t> candidates(std::min(N_points, (uint64_t)N_chunk), aero);
+    for (uint64_t first = 0 ; first < N_points ; first += N_chunk)
+    {
+        uint32_t count = (uint32_t)std::min(N_points - first, (uint64_t)N_chunk);
+        for (uint32_t i = 0 ; i < count ; i++)
+        {
+            float * coeffs = (float *)&candidates[i];
+            uint64_t point = first + i;
+            for (int32_t j = (int32_t)N_params - 1 ; j >= 0 ; j--)
+            {
+                uint32_t step = (uint32_t)(point % resolution[j]);
+                point /= resolution[j];
+                float t = (resolution[j] > 1) ? (float)step / (resolution[j] - 1) : 0.0F;
+                coeffs[paramIndices[j]] = lower[j] + (upper[j] - lower[j]) * t;
+            }
+        }
+        this->evaluateBatch((const float *)candidates.data(), count, useLinearVelocities, numberOfSamplesToUse, &fitness[first]);
+    }
+}
+
+/**
+ * \brief Registers samples [first, first + N_samples) of trajectory as a segment for evaluateSegments.
+ * The segment starts from its own first sample, as init(true) does for a whole trajectory. trajectory NULL
+ * means the trajectory in use and N_samples 0 means up to its end. Returns false if first is out of range.
+ */
+bool Model::addSegment(std::shared_ptr<const Trajectory> trajectory, uint32_t first, uint32_t N_samples)
+{
+    if (!trajectory)
+    {
+        trajectory = _trajectory;
+    }
+    if (!trajectory || (first >= trajectory->size()))
+    {
+        return false;
+    }
+    if ((0 == N_samples) || (N_samples > trajectory->size() - first))
+    {
+        N_samples = trajectory->size() - first;
+    }
+    Model initializer(this);
+    initializer.setTrajectory(Trajectory::slice(trajectory, first, N_samples));
+    _segments.push_back({initializer._trajectory, initializer._initialParams, initializer._initialControls,
+                         initializer._initialInternals, initializer._initialStates});
+    return true;
+}
+
+void Model::clearSegments()
+{
+    _segments.clear();
+}
+
+void Model::useSegment(const Segment_t & segment)
+{
+    _trajectory = segment.trajectory;
+    _trajectoryData = segment.trajectory->data();
+    _stride = segment.trajectory->stride();
+    _N_samples = segment.trajectory->size();
+    _initialParams = segment.params;
+    _initialControls = segment.controls;
+    _initialInternals = segment.internals;
+    _initialStates = segment.states;
+}
+
+float Model::evaluateSegments(AeroCoeffs_t aero, bool useLinearVelocities)
+{
+    float fitness;
+    this->evaluateSegmentsBatch((const float *)&aero, 1, useLinearVelocities, &fitness);
+    return fitness;
+}
+
+/**
+ * \brief Mean error over all samples of all registered segments, for each candidate.
+ * Longer segments weigh more. Returns INFINITY if no segment is registered.
+ */
+void Model::evaluateSegmentsBatch(const float * coeffs, uint32_t N_candidates, bool useLinearVelocities, float * fitness)
+{
+    const AeroCoeffs_t * aero = (const AeroCoeffs_t *)coeffs;
+    uint32_t N_segments = (uint32_t)_segments.size();
+    if ((0 == N_candidates) || (0 == N_segments))
+    {
+        std::fill(fitness, fitness + N_candidates, INFINITY);
+        return;
+    }
+    uint32_t N_threads = this->getNumberOfThreads();
+    std::vector<float> segmentFitness((size_t)N_segments * N_candidates);
+
+    //Candidates of every segment are split in groups, and the groups of all segments are spread across threads
+    bool oneByOne = (_segments[0].params.turbulenceIntensity != 0.0F) || (_integrator != INTEGRATOR_TRAPEZOIDAL);
+    uint32_t lanesPerGroup = std::min(std::max(N_candidates * N_segments / N_threads, 1U), std::min(N_candidates, (uint32_t)N_lanes));
+    if (oneByOne)
+    {
+        lanesPerGroup = 1; // Same as in evaluateBatch, those candidates are integrated one by one
+    }
+    uint32_t groupsPerSegment = (N_candidates + lanesPerGroup - 1) / lanesPerGroup;
+    std::unique_ptr<Model> local;
+    if (oneByOne && !_threadPool)
+    {
+        local.reset(new Model(this));
+    }
+    else if (oneByOne)
+    {
+        this->synchronizeWorkers();
+    }
+    auto evaluateGroup = [&](uint32_t task, uint32_t thread)
+    {
+        uint32_t segmentNumber = task / groupsPerSegment;
+        const Segment_t & segment = _segments[segmentNumber];
+        uint32_t first = (task % groupsPerSegment) * lanesPerGroup;
+        float * result = &segmentFitness[(size_t)segmentNumber * N_candidates + first];
+        if (oneByOne)
+        {
+            Model * model = local ? local.get() : _workers[thread].get();
+            model->useSegment(segment);
+            result[0] = model->evaluate(aero[first], useLinearVelocities, -1);
+        }
+        else
+        {
+            LaneModel lanes(segment.params, segment.controls, segment.internals, segment.states, _frequency);
+            lanes.evaluate(&aero[first], std::min(lanesPerGroup, N_candidates - first), useLinearVelocities, -1,
+                           segment.trajectory->data(), segment.trajectory->size(), segment.trajectory->stride(), result);
+        }
+    };
+    if (_threadPool)
+    {
+        _threadPool->run(N_segments * groupsPerSegment, evaluateGroup);
+    }
+    else
+    {
+        for (uint32_t task = 0 ; task < N_segments * groupsPerSegment ; task++)
+        {
+            evaluateGroup(task, 0);
+        }
+    }
+
+    //Weight the mean error of each segment by its number of samples
+    uint64_t totalSamples = 0;
+    for (const Segment_t & segment : _segments)
+    {
+        totalSamples += segment.trajectory->size();
+    }
+    for (uint32_t i = 0 ; i < N_candidates ; i++)
+    {
+        float sum = 0.0F;
+        for (uint32_t segmentNumber = 0 ; segmentNumber < N_segments ; segmentNumber++)
+        {
+            sum += segmentFitness[(size_t)segmentNumber * N_candidates + i] * _segments[segmentNumber].trajectory->size();
+        }
+        fitness[i] = sum / totalSamples;
+    }
+}
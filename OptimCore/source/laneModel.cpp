@@ -0,0 +1,331 @@
+#include "laneModel.hpp"
+
+//Constructor
+LaneModel::LaneModel(const Params_t & params, const Controls_t & controls, const Internals_t & internals,
+                     const States_t & states, float freq) :
+    _params(params), _initialControls(controls), _initialInternals(internals), _initialStates(states),
+    _frequency(freq), _N(0), _firstPropagationCompleted(false)
+{
+}
+
+void LaneModel::reset(const AeroCoeffs_t * aero)
+{
+    for (uint32_t l = 0 ; l < _N ; l++)
+    {
+        _Cd0[l] = aero[l].Cd0;
+        _K[l] = aero[l].K;
+        _Cdb[l] = aero[l].Cdb;
+        _Cyb[l] = aero[l].Cyb;
+        _Cyda[l] = aero[l].Cyda;
+        _Cydr[l] = aero[l].Cydr;
+        _Cyp[l] = aero[l].Cyp;
+        _Cyr[l] = aero[l].Cyr;
+        _Cl0[l] = aero[l].Cl0;
+        _Cla[l] = aero[l].Cla * 100; // Parameter encoding, same as Model::setAeroCoeffs
+        _Cllb[l] = aero[l].Cllb;
+        _Cllda[l] = aero[l].Cllda;
+        _Clldr[l] = aero[l].Clldr;
+        _Cllp[l] = aero[l].Cllp;
+        _Cllr[l] = aero[l].Cllr;
+        _Cmm0[l] = aero[l].Cmm0;
+        _Cmma[l] = aero[l].Cmma;
+        _Cmmda[l] = aero[l].Cmmda;
+        _Cmmde[l] = aero[l].Cmmde;
+        _Cmmdr[l] = aero[l].Cmmdr;
+        _Cmmq[l] = aero[l].Cmmq * 100; // Parameter encoding, same as Model::setAeroCoeffs
+        _Cnnb[l] = aero[l].Cnnb;
+        _Cnnda[l] = aero[l].Cnnda;
+        _Cnndr[l] = aero[l].Cnndr;
+        _Cnnp[l] = aero[l].Cnnp;
+        _Cnnr[l] = aero[l].Cnnr;
+
+        _da[l] = _initialControls.da;
+        _de[l] = _initialControls.de;
+        _dr[l] = _initialControls.dr;
+        _dt[l] = _initialControls.dt;
+
+        _roll[l] = _initialStates.roll;
+        _pitch[l] = _initialStates.pitch;
+        _yaw[l] = _initialStates.yaw;
+        _p[l] = _initialStates.p;
+        _q[l] = _initialStates.q;
+        _r[l] = _initialStates.r;
+        _posNorth[l] = _initialStates.posNorth;
+        _posEast[l] = _initialStates.posEast;
+        _alt[l] = _initialStates.alt;
+        _vx[l] = _initialStates.vx;
+        _vy[l] = _initialStates.vy;
+        _vz[l] = _initialStates.vz;
+
+        _V[l] = _initialInternals.V;
+        _alpha[l] = _initialInternals.alpha;
+        _beta[l] = _initialInternals.beta;
+        _TAS[l] = _initialInternals.TAS;
+        _Xt[l] = _initialInternals.Xt;
+        _vx_dot_old[l] = _initialInternals.vx_dot_old;
+        _vy_dot_old[l] = _initialInternals.vy_dot_old;
+        _vz_dot_old[l] = _initialInternals.vz_dot_old;
+        _roll_dot_old[l] = _initialInternals.roll_dot_old;
+        _pitch_dot_old[l] = _initialInternals.pitch_dot_old;
+        _yaw_dot_old[l] = _initialInternals.yaw_dot_old;
+        _p_dot_old[l] = _initialInternals.p_dot_old;
+        _q_dot_old[l] = _initialInternals.q_dot_old;
+        _r_dot_old[l] = _initialInternals.r_dot_old;
+        _posNorth_dot_old[l] = _initialInternals.posNorth_dot_old;
+        _posEast_dot_old[l] = _initialInternals.posEast_dot_old;
+        _alt_dot_old[l] = _initialInternals.alt_dot_old;
+    }
+    _firstPropagationCompleted = false;
+}
+
+void LaneModel::propagate(const Controls_t & controls, float dtime)
+{
+    const uint32_t N = _N;
+    const Params_t & prm = _params;
+
+    //Controls
+    if (0.0F == prm.servosResponseTime)
+    {
+        for (uint32_t l = 0 ; l < N ; l++)
+        {
+            _da[l] = controls.da;
+            _de[l] = controls.de;
+            _dr[l] = controls.dr;
+            _dt[l] = controls.dt;
+        }
+    }
+    else
+    {
+        float servosGain = 1.0F / (_frequency * prm.servosResponseTime);
+        for (uint32_t l = 0 ; l < N ; l++)
+        {
+            _da[l] += servosGain * (controls.da - _da[l]);
+            _de[l] += servosGain * (controls.de - _de[l]);
+            _dr[l] += servosGain * (controls.dr - _dr[l]);
+            _dt[l] += servosGain * (controls.dt - _dt[l]);
+        }
+    }
+
+    //Euler and aerodynamic angles trigonometry variables (libm calls are kept out of the arithmetic loops)
+    alignas(64) float cr[N_lanes], sr[N_lanes], cp[N_lanes], sp[N_lanes], tp[N_lanes], cy[N_lanes], sy[N_lanes];
+    alignas(64) float ca[N_lanes], sa[N_lanes], cb[N_lanes], sb[N_lanes];
+    for (uint32_t l = 0 ; l < N ; l++)
+    {
+        cr[l] = cosf(_roll[l]);
+        sr[l] = sinf(_roll[l]);
+        cp[l] = cosf(_pitch[l]);
+        sp[l] = sinf(_pitch[l]);
+        tp[l] = tanf(_pitch[l]);
+        cy[l] = cosf(_yaw[l]);
+        sy[l] = sinf(_yaw[l]);
+        ca[l] = cosf(_alpha[l]);
+        sa[l] = sinf(_alpha[l]);
+        cb[l] = cosf(_beta[l]);
+        sb[l] = sinf(_beta[l]);
+    }
+
+    //Forces, moments, derivatives and states update
+    alignas(64) float posNorth_dot[N_lanes], posEast_dot[N_lanes], alt_dot[N_lanes];
+    const float aux = prm.Ix * prm.Iz - prm.Ixz * prm.Ixz;
+    for (uint32_t l = 0 ; l < N ; l++)
+    {
+        //Auxiliary coefficients
+        float coeffA = prm.b / (2.0F * _V[l]);
+        float coeffB = prm.c / (2.0F * _V[l]);
+
+        //Force coefficients
+        float Cl = _Cl0[l] + _Cla[l] * _alpha[l];
+        float Cd = _Cd0[l] + _K[l] * Cl * Cl + _Cdb[l] * std::abs(_beta[l]);
+        float Cy = _Cyb[l] * _beta[l] + _Cydr[l] * _dr[l] + _Cyda[l] * _da[l] + coeffA * (_Cyp[l] * _p[l] + _Cyr[l] * _r[l]);
+
+        //Moment coefficients
+        float Cll = _Cllb[l] * _beta[l] + _Cllda[l] * _da[l] + _Clldr[l] * _dr[l] + coeffA * (_Cllp[l] * _p[l] + _Cllr[l] * _r[l]);
+        float Cmm = _Cmm0[l] + _Cmma[l] * _alpha[l] + _Cmmde[l] * _de[l] + _Cmmdr[l] * _dr[l] + _Cmmda[l] * std::fabs(_da[l]) + coeffB*(_Cmmq[l] * _q[l]);
+        float Cnn = _Cnnb[l] * _beta[l] + _Cnnda[l] * _da[l] + _Cnndr[l] * _dr[l] + coeffA * (_Cnnp[l] * _p[l] + _Cnnr[l] * _r[l]);
+
+        //Auxiliary variables
+        float qd_times_S = 0.5*prm.rho * _TAS[l] * _TAS[l] * prm.S;
+        float qd_times_S_times_b = qd_times_S * prm.b;
+        float qd_times_S_times_c = qd_times_S * prm.c;
+
+        //Dynamic forces
+        float D = qd_times_S_times_b * Cd;
+        float Y = qd_times_S_times_c * Cy;
+        float L = qd_times_S_times_b * Cl;
+
+        //Dynamic moments
+        float LL = qd_times_S_times_b * Cll;
+        float MM = qd_times_S_times_c * Cmm;
+        float NN = qd_times_S_times_b * Cnn;
+
+        //Transform forces to body-axes
+        float Xa = -ca[l] * cb[l] * D - ca[l] * sb[l] * Y + sa[l] * L;
+        float Ya = -sb[l] * D + cb[l] * Y;
+        float Za = -sa[l] * cb[l] * D - sa[l] * sb[l] * Y - ca[l] * L;
+        if (0.0F == prm.engineResponseTime)
+        {
+            _Xt[l] = prm.Tmax * _dt[l];
+        }
+        else
+        {
+            _Xt[l] += (1.0F / (_frequency * prm.engineResponseTime)) * (prm.Tmax * _dt[l] - _Xt[l]);
+        }
+
+        //Linear accelerations in body-axes
+        float vx_dot = _r[l] * _vy[l] - _q[l] * _vz[l] - prm.g * sp[l] + (Xa + _Xt[l])/prm.m;
+        float vy_dot = -_r[l] * _vx[l] + _p[l] * _vz[l] + prm.g * sr[l] * cp[l] + Ya / prm.m;
+        float vz_dot = _q[l] * _vx[l] - _p[l] * _vy[l] + prm.g * cr[l] * cp[l] + Za / prm.m;
+
+        //Euler rates
+        float roll_dot = _p[l] + tp[l] * (_q[l] * sr[l] + _r[l] * cr[l]);
+        float pitch_dot = _q[l] * cr[l] - _r[l] * sr[l];
+        float yaw_dot = (_q[l] * sr[l] + _r[l] * cr[l]) / cp[l];
+
+        //Angular accelerations in body-axes
+        float p_dot = (prm.Ixz * (prm.Ix - prm.Iy + prm.Iz) * _p[l] * _q[l] - (prm.Iz * (prm.Iz - prm.Iy) + prm.Ixz * prm.Ixz) * _q[l] * _r[l] + prm.Iz * LL + prm.Ixz * NN) / aux;
+        float q_dot = ((prm.Iz - prm.Ix) * _p[l] * _r[l] - prm.Ixz * (_p[l] * _p[l] - _r[l] * _r[l]) + MM) / prm.Iy;
+        float r_dot = (((prm.Ix - prm.Iy) * prm.Ix + prm.Ixz * prm.Ixz) * _p[l] * _q[l] - prm.Ixz * (prm.Ix - prm.Iy + prm.Iz) * _q[l] * _r[l] + prm.Ixz * LL + prm.Ix * NN) / aux;
+
+        //Linear velocities in NED axes
+        posNorth_dot[l] = _vx[l] * cp[l] * cy[l] + _vy[l] * (-cr[l] * sy[l] + sr[l] * sp[l] * cy[l]) + _vz[l] * (sr[l] * sy[l] + cr[l] * sp[l] * cy[l]);
+        posEast_dot[l] = _vx[l] * cp[l] * sy[l] + _vy[l] * (cr[l] * cy[l] + sr[l] * sp[l] * sy[l]) + _vz[l] * (-sr[l] * cy[l] + cr[l] * sp[l] * sy[l]);
+        alt_dot[l] = _vx[l] * sp[l] - _vy[l] * sr[l] * cp[l] - _vz[l] * cr[l] * cp[l];
+
+        //Propagate states
+        if (_firstPropagationCompleted)
+        {
+            _vx[l] += (vx_dot + _vx_dot_old[l]) * 0.5F * dtime;
+            _vy[l] += (vy_dot + _vy_dot_old[l]) * 0.5F * dtime;
+            _vz[l] += (vz_dot + _vz_dot_old[l]) * 0.5F * dtime;
+            _roll[l] += (roll_dot + _roll_dot_old[l]) * 0.5F * dtime;
+            _pitch[l] += (pitch_dot + _pitch_dot_old[l]) * 0.5F * dtime;
+            _yaw[l] += (yaw_dot + _yaw_dot_old[l]) * 0.5F * dtime;
+            _p[l] += (p_dot + _p_dot_old[l]) * 0.5F * dtime;
+            _q[l] += (q_dot + _q_dot_old[l]) * 0.5F * dtime;
+            _r[l] += (r_dot + _r_dot_old[l]) * 0.5F * dtime;
+            _posNorth[l] += (posNorth_dot[l] + _posNorth_dot_old[l]) * 0.5F * dtime;
+            _posEast[l] += (posEast_dot[l] + _posEast_dot_old[l]) * 0.5F * dtime;
+            _alt[l] += (alt_dot[l] + _alt_dot_old[l]) * 0.5F * dtime;
+        }
+        else
+        {
+            _vx[l] += vx_dot * dtime;
+            _vy[l] += vy_dot * dtime;
+            _vz[l] += vz_dot * dtime;
+            _roll[l] += roll_dot * dtime;
+            _pitch[l] += pitch_dot * dtime;
+            _yaw[l] += yaw_dot * dtime;
+            _p[l] += p_dot * dtime;
+            _q[l] += q_dot * dtime;
+            _r[l] += r_dot * dtime;
+            _posNorth[l] += posNorth_dot[l] * dtime;
+            _posEast[l] += posEast_dot[l] * dtime;
+            _alt[l] += alt_dot[l] * dtime;
+        }
+
+        //Store old rates
+        _vx_dot_old[l] = vx_dot;
+        _vy_dot_old[l] = vy_dot;
+        _vz_dot_old[l] = vz_dot;
+        _roll_dot_old[l] = roll_dot;
+        _pitch_dot_old[l] = pitch_dot;
+        _yaw_dot_old[l] = yaw_dot;
+        _p_dot_old[l] = p_dot;
+        _q_dot_old[l] = q_dot;
+        _r_dot_old[l] = r_dot;
+        _posNorth_dot_old[l] = posNorth_dot[l];
+        _posEast_dot_old[l] = posEast_dot[l];
+        _alt_dot_old[l] = alt_dot[l];
+    }
+    _firstPropagationCompleted = true;
+
+    //Real velocity, true airspeed and aerodynamic angles
+    for (uint32_t l = 0 ; l < N ; l++)
+    {
+        _V[l] = sqrtf(_vx[l] * _vx[l] + _vy[l] * _vy[l] + _vz[l] * _vz[l]);
+        float TAS_North = posNorth_dot[l] - _initialInternals.windNorth;
+        float TAS_East = posEast_dot[l] - _initialInternals.windEast;
+        float TAS_Up = alt_dot[l] - _initialInternals.windUp;
+        _TAS[l] = sqrtf(TAS_North * TAS_North + TAS_East * TAS_East + TAS_Up * TAS_Up);
+        float TAS_x = cp[l] * cy[l] * TAS_North + cp[l] * sy[l] * TAS_East - sp[l] * (-TAS_Up);  //Transform from flat-Earth axes to body-axes
+        float TAS_y = (sr[l] * sp[l] * cy[l] - cr[l] * sy[l]) * TAS_North + (sr[l] * sp[l] * sy[l] + cr[l] * cy[l]) * TAS_East + sr[l] * cp[l] * (-TAS_Up);
+        float TAS_z = (cr[l] * sp[l] * cy[l] + sr[l] * sy[l]) * TAS_North + (cr[l] * sp[l] * sy[l] - sr[l] * cy[l]) * TAS_East + cr[l] * cp[l] * (-TAS_Up);
+        _alpha[l] = atan2f(TAS_z, TAS_x) - prm.incidence;
+        _beta[l] = asinf(TAS_y / _TAS[l]);
+    }
+}
+
+void LaneModel::evaluate(const AeroCoeffs_t * aero, uint32_t N_candidates, bool useLinearVelocities,
+                         int32_t numberOfSamplesToUse, const float * trajectory, uint32_t N_samples, uint32_t stride,
+                         float * fitness, float abortAbove, uint32_t * samplesUsed)
+{
+    if (numberOfSamplesToUse < 0)
+    {
+        numberOfSamplesToUse = N_samples;
+    }
+    else if ((uint32_t)numberOfSamplesToUse > N_samples)
+    {
+        numberOfSamplesToUse = N_samples;
+    }
+    _N = std::min(N_candidates, (uint32_t)N_lanes);
+    this->reset(aero);
+    float dt = 1.0F / _frequency;
+    alignas(64) float accumulated[N_lanes] = {0};
+    alignas(64) float partial[N_lanes] = {0};
+    uint32_t steps[N_lanes] = {0};
+    uint32_t N_running = _N;
+    float abortSum = abortAbove * numberOfSamplesToUse;
+    for (int32_t i = 0 ; (i < numberOfSamplesToUse) && (N_running > 0) ; i++)
+    {
+        Controls_t controls = {trajectory[1 * stride + i],   //da
+                               trajectory[2 * stride + i],   //de
+                               trajectory[3 * stride + i],   //dr
+                               trajectory[4 * stride + i]};  //dt
+        this->propagate(controls, dt);
+        if (useLinearVelocities)
+        {
+            float vx = trajectory[11 * stride + i];
+            float vy = trajectory[12 * stride + i];
+            float vz = trajectory[13 * stride + i];
+            for (uint32_t l = 0 ; l < _N ; l++)
+            {
+                float diffVx = (_vx[l] - vx);
+                float diffVy = (_vy[l] - vy);
+                float diffVz = (_vz[l] - vz);
+                accumulated[l] += sqrtf(diffVx * diffVx + diffVy * diffVy + diffVz * diffVz);
+            }
+        }
+        float p = trajectory[14 * stride + i];
+        float q = trajectory[15 * stride + i];
+        float r = trajectory[16 * stride + i];
+        for (uint32_t l = 0 ; l < _N ; l++)
+        {
+            float diffp = (_p[l] - p);
+            float diffq = (_q[l] - q);
+            float diffr = (_r[l] - r);
+            accumulated[l] += sqrtf(diffp * diffp + diffq * diffq + diffr * diffr);
+        }
+
+        //Aborted lanes keep being integrated along with the others but their error is frozen
+        for (uint32_t l = 0 ; l < _N ; l++)
+        {
+            if (0 == steps[l])
+            {
+                partial[l] = accumulated[l];
+                if (!(accumulated[l] <= abortSum)) // Also true for NaN
+                {
+                    steps[l] = i + 1;
+                    N_running--;
+                }
+            }
+        }
+    }
+    for (uint32_t l = 0 ; l < _N ; l++)
+    {
+        if (samplesUsed != NULL)
+        {
+            samplesUsed[l] = (0 == steps[l]) ? (uint32_t)std::max(numberOfSamplesToUse, (int32_t)0) : steps[l];
+        }
+        fitness[l] = std::isfinite(partial[l]) ? partial[l] / numberOfSamplesToUse : INFINITY;
+    }
+}
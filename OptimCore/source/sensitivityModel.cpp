@@ -0,0 +1,272 @@
+#include "sensitivityModel.hpp"
+
+//Constructor
+SensitivityModel::SensitivityModel(const Params_t & params, const Controls_t & controls, const Internals_t & internals,
+                                   const States_t & states, float freq) :
+    _params(params), _initialControls(controls), _initialInternals(internals), _initialStates(states),
+    _frequency(freq), _firstPropagationCompleted(false)
+{
+}
+
+void SensitivityModel::reset(const AeroCoeffs_t & aero)
+{
+    _Cd0 = AeroDual_t::variable(aero.Cd0, 0);
+    _K = AeroDual_t::variable(aero.K, 1);
+    _Cdb = AeroDual_t::variable(aero.Cdb, 2);
+    _Cyb = AeroDual_t::variable(aero.Cyb, 3);
+    _Cyda = AeroDual_t::variable(aero.Cyda, 4);
+    _Cydr = AeroDual_t::variable(aero.Cydr, 5);
+    _Cyp = AeroDual_t::variable(aero.Cyp, 6);
+    _Cyr = AeroDual_t::variable(aero.Cyr, 7);
+    _Cl0 = AeroDual_t::variable(aero.Cl0, 8);
+    _Cla = AeroDual_t::variable(aero.Cla, 9) * 100.0F; // Parameter encoding, same as Model::setAeroCoeffs
+    _Cllb = AeroDual_t::variable(aero.Cllb, 10);
+    _Cllda = AeroDual_t::variable(aero.Cllda, 11);
+    _Clldr = AeroDual_t::variable(aero.Clldr, 12);
+    _Cllp = AeroDual_t::variable(aero.Cllp, 13);
+    _Cllr = AeroDual_t::variable(aero.Cllr, 14);
+    _Cmm0 = AeroDual_t::variable(aero.Cmm0, 15);
+    _Cmma = AeroDual_t::variable(aero.Cmma, 16);
+    _Cmmda = AeroDual_t::variable(aero.Cmmda, 17);
+    _Cmmde = AeroDual_t::variable(aero.Cmmde, 18);
+    _Cmmdr = AeroDual_t::variable(aero.Cmmdr, 19);
+    _Cmmq = AeroDual_t::variable(aero.Cmmq, 20) * 100.0F; // Parameter encoding, same as Model::setAeroCoeffs
+    _Cnnb = AeroDual_t::variable(aero.Cnnb, 21);
+    _Cnnda = AeroDual_t::variable(aero.Cnnda, 22);
+    _Cnndr = AeroDual_t::variable(aero.Cnndr, 23);
+    _Cnnp = AeroDual_t::variable(aero.Cnnp, 24);
+    _Cnnr = AeroDual_t::variable(aero.Cnnr, 25);
+
+    _controls = _initialControls;
+    _Xt = _initialInternals.Xt;
+
+    _roll = _initialStates.roll;
+    _pitch = _initialStates.pitch;
+    _yaw = _initialStates.yaw;
+    _p = _initialStates.p;
+    _q = _initialStates.q;
+    _r = _initialStates.r;
+    _vx = _initialStates.vx;
+    _vy = _initialStates.vy;
+    _vz = _initialStates.vz;
+
+    _V = _initialInternals.V;
+    _alpha = _initialInternals.alpha;
+    _beta = _initialInternals.beta;
+    _TAS = _initialInternals.TAS;
+    _vx_dot_old = _initialInternals.vx_dot_old;
+    _vy_dot_old = _initialInternals.vy_dot_old;
+    _vz_dot_old = _initialInternals.vz_dot_old;
+    _roll_dot_old = _initialInternals.roll_dot_old;
+    _pitch_dot_old = _initialInternals.pitch_dot_old;
+    _yaw_dot_old = _initialInternals.yaw_dot_old;
+    _p_dot_old = _initialInternals.p_dot_old;
+    _q_dot_old = _initialInternals.q_dot_old;
+    _r_dot_old = _initialInternals.r_dot_old;
+    _firstPropagationCompleted = false;
+}
+
+void SensitivityModel::propagate(const Controls_t & controls, float dtime)
+{
+    const Params_t & prm = _params;
+
+    //Controls
+    if (0.0F == prm.servosResponseTime)
+    {
+        _controls = controls;
+    }
+    else
+    {
+        float servosGain = 1.0F / (_frequency * prm.servosResponseTime);
+        _controls.da += servosGain * (controls.da - _controls.da);
+        _controls.de += servosGain * (controls.de - _controls.de);
+        _controls.dr += servosGain * (controls.dr - _controls.dr);
+        _controls.dt += servosGain * (controls.dt - _controls.dt);
+    }
+
+    //Euler trigonometry variables
+    AeroDual_t cr = cos(_roll);
+    AeroDual_t sr = sin(_roll);
+    AeroDual_t cp = cos(_pitch);
+    AeroDual_t sp = sin(_pitch);
+    AeroDual_t tp = tan(_pitch);
+    AeroDual_t cy = cos(_yaw);
+    AeroDual_t sy = sin(_yaw);
+
+    //Auxiliary coefficients
+    AeroDual_t coeffA = prm.b / (2.0F * _V);
+    AeroDual_t coeffB = prm.c / (2.0F * _V);
+
+    //Force coefficients
+    AeroDual_t Cl = _Cl0 + _Cla * _alpha;
+    AeroDual_t Cd = _Cd0 + _K * Cl * Cl + _Cdb * fabs(_beta);
+    AeroDual_t Cy = _Cyb * _beta + _Cydr * _controls.dr + _Cyda * _controls.da + coeffA * (_Cyp * _p + _Cyr * _r);
+
+    //Moment coefficients
+    AeroDual_t Cll = _Cllb * _beta + _Cllda * _controls.da + _Clldr * _controls.dr + coeffA * (_Cllp * _p + _Cllr * _r);
+    AeroDual_t Cmm = _Cmm0 + _Cmma * _alpha + _Cmmde * _controls.de + _Cmmdr * _controls.dr + _Cmmda * fabsf(_controls.da) + coeffB * (_Cmmq * _q);
+    AeroDual_t Cnn = _Cnnb * _beta + _Cnnda * _controls.da + _Cnndr * _controls.dr + coeffA * (_Cnnp * _p + _Cnnr * _r);
+
+    //Auxiliary variables. Dynamic pressure is computed in double precision as in Model::propagate, so that the
+    //fitness is the same as the one of Model::evaluate to the last bit
+    AeroDual_t qd_times_S = _TAS.chain(0.5 * prm.rho * _TAS.v * _TAS.v * prm.S, prm.rho * _TAS.v * prm.S);
+    AeroDual_t qd_times_S_times_b = qd_times_S * prm.b;
+    AeroDual_t qd_times_S_times_c = qd_times_S * prm.c;
+
+    //Dynamic forces
+    AeroDual_t D = qd_times_S_times_b * Cd;
+    AeroDual_t Y = qd_times_S_times_c * Cy;
+    AeroDual_t L = qd_times_S_times_b * Cl;
+
+    //Dynamic moments
+    AeroDual_t LL = qd_times_S_times_b * Cll;
+    AeroDual_t MM = qd_times_S_times_c * Cmm;
+    AeroDual_t NN = qd_times_S_times_b * Cnn;
+
+    //Aerodynamic angles trigonometry variables
+    AeroDual_t ca = cos(_alpha);
+    AeroDual_t sa = sin(_alpha);
+    AeroDual_t cb = cos(_beta);
+    AeroDual_t sb = sin(_beta);
+
+    //Transform forces to body-axes
+    AeroDual_t Xa = -ca * cb * D - ca * sb * Y + sa * L;
+    AeroDual_t Ya = -sb * D + cb * Y;
+    AeroDual_t Za = -sa * cb * D - sa * sb * Y - ca * L;
+    if (0.0F == prm.engineResponseTime)
+    {
+        _Xt = prm.Tmax * _controls.dt;
+    }
+    else
+    {
+        _Xt += (1.0F / (_frequency * prm.engineResponseTime)) * (prm.Tmax * _controls.dt - _Xt);
+    }
+
+    //Linear accelerations in body-axes
+    AeroDual_t vx_dot = _r * _vy - _q * _vz - prm.g * sp + (Xa + _Xt) / prm.m;
+    AeroDual_t vy_dot = -_r * _vx + _p * _vz + prm.g * sr * cp + Ya / prm.m;
+    AeroDual_t vz_dot = _q * _vx - _p * _vy + prm.g * cr * cp + Za / prm.m;
+
+    //Euler rates
+    AeroDual_t roll_dot = _p + tp * (_q * sr + _r * cr);
+    AeroDual_t pitch_dot = _q * cr - _r * sr;
+    AeroDual_t yaw_dot = (_q * sr + _r * cr) / cp;
+
+    //Angular accelerations in body-axes
+    float aux = prm.Ix * prm.Iz - prm.Ixz * prm.Ixz;
+    AeroDual_t p_dot = (prm.Ixz * (prm.Ix - prm.Iy + prm.Iz) * _p * _q - (prm.Iz * (prm.Iz - prm.Iy) + prm.Ixz * prm.Ixz) * _q * _r + prm.Iz * LL + prm.Ixz * NN) / aux;
+    AeroDual_t q_dot = ((prm.Iz - prm.Ix) * _p * _r - prm.Ixz * (_p * _p - _r * _r) + MM) / prm.Iy;
+    AeroDual_t r_dot = (((prm.Ix - prm.Iy) * prm.Ix + prm.Ixz * prm.Ixz) * _p * _q - prm.Ixz * (prm.Ix - prm.Iy + prm.Iz) * _q * _r + prm.Ixz * LL + prm.Ix * NN) / aux;
+
+    //Linear velocities in NED axes (positions do not feed back into the dynamics, so they are not integrated)
+    AeroDual_t posNorth_dot = _vx * cp * cy + _vy * (-cr * sy + sr * sp * cy) + _vz * (sr * sy + cr * sp * cy);
+    AeroDual_t posEast_dot = _vx * cp * sy + _vy * (cr * cy + sr * sp * sy) + _vz * (-sr * cy + cr * sp * sy);
+    AeroDual_t alt_dot = _vx * sp - _vy * sr * cp - _vz * cr * cp;
+
+    //Propagate states
+    if (_firstPropagationCompleted)
+    {
+        _vx += (vx_dot + _vx_dot_old) * (0.5F * dtime);
+        _vy += (vy_dot + _vy_dot_old) * (0.5F * dtime);
+        _vz += (vz_dot + _vz_dot_old) * (0.5F * dtime);
+        _roll += (roll_dot + _roll_dot_old) * (0.5F * dtime);
+        _pitch += (pitch_dot + _pitch_dot_old) * (0.5F * dtime);
+        _yaw += (yaw_dot + _yaw_dot_old) * (0.5F * dtime);
+        _p += (p_dot + _p_dot_old) * (0.5F * dtime);
+        _q += (q_dot + _q_dot_old) * (0.5F * dtime);
+        _r += (r_dot + _r_dot_old) * (0.5F * dtime);
+    }
+    else
+    {
+        _vx += vx_dot * dtime;
+        _vy += vy_dot * dtime;
+        _vz += vz_dot * dtime;
+        _roll += roll_dot * dtime;
+        _pitch += pitch_dot * dtime;
+        _yaw += yaw_dot * dtime;
+        _p += p_dot * dtime;
+        _q += q_dot * dtime;
+        _r += r_dot * dtime;
+    }
+
+    //Store old rates
+    _firstPropagationCompleted = true;
+    _vx_dot_old = vx_dot;
+    _vy_dot_old = vy_dot;
+    _vz_dot_old = vz_dot;
+    _roll_dot_old = roll_dot;
+    _pitch_dot_old = pitch_dot;
+    _yaw_dot_old = yaw_dot;
+    _p_dot_old = p_dot;
+    _q_dot_old = q_dot;
+    _r_dot_old = r_dot;
+
+    //Real velocity
+    _V = sqrt(_vx * _vx + _vy * _vy + _vz * _vz);
+
+    //True Airspeed
+    AeroDual_t TAS_North = posNorth_dot - _initialInternals.windNorth;
+    AeroDual_t TAS_East = posEast_dot - _initialInternals.windEast;
+    AeroDual_t TAS_Up = alt_dot - _initialInternals.windUp;
+    _TAS = sqrt(TAS_North * TAS_North + TAS_East * TAS_East + TAS_Up * TAS_Up);
+    AeroDual_t TAS_x = cp * cy * TAS_North + cp * sy * TAS_East - sp * (-TAS_Up);  //Transform from flat-Earth axes to body-axes
+    AeroDual_t TAS_y = (sr * sp * cy - cr * sy) * TAS_North + (sr * sp * sy + cr * cy) * TAS_East + sr * cp * (-TAS_Up);
+    AeroDual_t TAS_z = (cr * sp * cy + sr * sy) * TAS_North + (cr * sp * sy - sr * cy) * TAS_East + cr * cp * (-TAS_Up);
+
+    //Aerodynamic angles
+    _alpha = atan2(TAS_z, TAS_x) - prm.incidence;
+    _beta = asin(TAS_y / _TAS);
+}
+
+/**
+ * \brief Same fitness as Model::evaluate, with its derivative with respect to each coefficient written to gradient.
+ * A diverged integration returns INFINITY and a zero gradient.
+ */
+float SensitivityModel::evaluate(const AeroCoeffs_t & aero, bool useLinearVelocities, int32_t numberOfSamplesToUse,
+                                 const float * trajectory, uint32_t N_samples, uint32_t stride, float * gradient)
+{
+    if (numberOfSamplesToUse < 0)
+    {
+        numberOfSamplesToUse = N_samples;
+    }
+    else if ((uint32_t)numberOfSamplesToUse > N_samples)
+    {
+        numberOfSamplesToUse = N_samples;
+    }
+    this->reset(aero);
+    float dt = 1.0F / _frequency;
+    AeroDual_t fitness;
+    for (int32_t i = 0 ; i < numberOfSamplesToUse ; i++)
+    {
+        Controls_t controls = {trajectory[1 * stride + i],   //da
+                               trajectory[2 * stride + i],   //de
+                               trajectory[3 * stride + i],   //dr
+                               trajectory[4 * stride + i]};  //dt
+        this->propagate(controls, dt);
+        if (useLinearVelocities)
+        {
+            AeroDual_t diffVx = _vx - trajectory[11 * stride + i];
+            AeroDual_t diffVy = _vy - trajectory[12 * stride + i];
+            AeroDual_t diffVz = _vz - trajectory[13 * stride + i];
+            fitness += sqrt(diffVx * diffVx + diffVy * diffVy + diffVz * diffVz);
+        }
+        AeroDual_t diffp = _p - trajectory[14 * stride + i];
+        AeroDual_t diffq = _q - trajectory[15 * stride + i];
+        AeroDual_t diffr = _r - trajectory[16 * stride + i];
+        fitness += sqrt(diffp * diffp + diffq * diffq + diffr * diffr);
+        if (!std::isfinite(fitness.v))
+        {
+            break; // Diverged
+        }
+    }
+    if (!std::isfinite(fitness.v))
+    {
+        std::fill(gradient, gradient + N_aero, 0.0F);
+        return INFINITY;
+    }
+    for (uint32_t j = 0 ; j < N_aero ; j++)
+    {
+        gradient[j] = fitness.d[j] / numberOfSamplesToUse;
+    }
+    return fitness.v / numberOfSamplesToUse;
+}
@@ -0,0 +1,102 @@
+#include "threadPool.hpp"
+
+//Constructor
+ThreadPool::ThreadPool(uint32_t N_threads) : _N_threads(std::max(N_threads, (uint32_t)1)), _job(NULL), _N_tasks(0),
+                                             _nextTask(0), _activeThreads(0), _generation(0), _stop(false)
+{
+    //Calling thread is thread 0, so only N_threads - 1 threads are spawned
+    try
+    {
+        for (uint32_t i = 1 ; i < _N_threads ; i++)
+        {
+            _threads.emplace_back(&ThreadPool::workerLoop, this, i);
+        }
+    }
+    catch (...)
+    {
+        //Threads already spawned must be joined before the exception destroys them
+        this->stopThreads();
+        throw;
+    }
+}
+
+ThreadPool::~ThreadPool()
+{
+    this->stopThreads();
+}
+
+void ThreadPool::stopThreads()
+{
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+        _stop = true;
+    }
+    _startCondition.notify_all();
+    for (std::thread & thread : _threads)
+    {
+        thread.join();
+    }
+}
+
+void ThreadPool::run(uint32_t N_tasks, const Job_t & job)
+{
+    if (_threads.empty() || N_tasks < 2)
+    {
+        for (uint32_t i = 0 ; i < N_tasks ; i++)
+        {
+            job(i, 0);
+        }
+        return;
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+        _job = &job;
+        _N_tasks = N_tasks;
+        _nextTask = 0;
+        _activeThreads = (uint32_t)_threads.size();
+        _generation++;
+    }
+    _startCondition.notify_all();
+
+    processTasks(0);
+
+    //Wait until every worker has finished its last task
+    std::unique_lock<std::mutex> lock(_mutex);
+    _doneCondition.wait(lock, [this] { return _activeThreads == 0; });
+    _job = NULL;
+}
+
+void ThreadPool::workerLoop(uint32_t thread)
+{
+    uint64_t lastGeneration = 0;
+    for (;;)
+    {
+        {
+            std::unique_lock<std::mutex> lock(_mutex);
+            _startCondition.wait(lock, [this, lastGeneration] { return _stop || _generation != lastGeneration; });
+            if (_stop)
+            {
+                return;
+            }
+            lastGeneration = _generation;
+        }
+
+        processTasks(thread);
+
+        {
+            std::lock_guard<std::mutex> lock(_mutex);
+            _activeThreads--;
+        }
+        _doneCondition.notify_one();
+    }
+}
+
+void ThreadPool::processTasks(uint32_t thread)
+{
+    //Tasks are handed out one by one so that slow candidates do not stall a whole thread
+    for (uint32_t task = _nextTask++ ; task < _N_tasks ; task = _nextTask++)
+    {
+        (*_job)(task, thread);
+    }
+}
@@ -0,0 +1,180 @@
+#include "trajectory.hpp"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <algorithm>
+#include <fstream>
+#ifndef _WIN32
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+//Constructor
+Trajectory::Trajectory() : _data(NULL), _N_samples(0), _stride(0), _mapping(NULL), _mappingLength(0)
+{
+}
+
+Trajectory::~Trajectory()
+{
+#ifndef _WIN32
+    if (_mapping != NULL)
+    {
+        munmap(_mapping, _mappingLength);
+    }
+#endif
+    if (_release)
+    {
+        _release();
+    }
+}
+
+/**
+ * \brief Reads a CSV log with a header line and one sample per line.
+ * Reads at most N_samples lines (all of them if N_samples is 0). Returns NULL if the file cannot be opened.
+ */
+std::shared_ptr<Trajectory> Trajectory::readCsv(std::string filePath, uint32_t N_samples)
+{
+    std::ifstream readStream(filePath);
+    if (!readStream.is_open())
+    {
+        return NULL;
+    }
+    std::string lineString;
+    std::getline(readStream, lineString); // Reads first line since it is not needed
+
+    //Samples are parsed line by line and transposed once the number of samples is known
+    std::vector<float> rows;
+    uint32_t lineNumber = 0;
+    while ((0 == N_samples) || (lineNumber < N_samples))
+    {
+        lineString.clear();
+        std::getline(readStream, lineString); // Reads next line in file
+        if (lineString.empty())
+        {
+            break;
+        }
+        const char * cursor = lineString.c_str();
+        for (uint32_t stateNumber = 0 ; stateNumber < N_states ; stateNumber++)
+        {
+            char * end;
+            rows.push_back(strtof(cursor, &end));
+            cursor = (',' == *end) ? end + 1 : end; // Skip delimiter
+        }
+        lineNumber++;
+    }
+
+    std::shared_ptr<Trajectory> trajectory(new Trajectory());
+    trajectory->_N_samples = lineNumber;
+    trajectory->_stride = lineNumber;
+    trajectory->_storage.resize((size_t)N_states * lineNumber);
+    for (uint32_t i = 0 ; i < lineNumber ; i++)
+    {
+        for (uint32_t stateNumber = 0 ; stateNumber < N_states ; stateNumber++)
+        {
+            trajectory->_storage[(size_t)stateNumber * lineNumber + i] = rows[(size_t)i * N_states + stateNumber];
+        }
+    }
+    trajectory->_data = trajectory->_storage.data();
+    return trajectory;
+}
+
+/**
+ * \brief Opens a NumPy .npy file holding a C-ordered little endian float32 array of shape (N_states, N).
+ * The file is memory-mapped where the platform allows it, otherwise it is read at once.
+ * Only the first N_samples columns are used (all of them if N_samples is 0). Returns NULL if the file
+ * cannot be read or does not hold such an array.
+ */
+std::shared_ptr<Trajectory> Trajectory::readNpy(std::string filePath, uint32_t N_samples)
+{
+    std::ifstream readStream(filePath, std::ios::binary);
+    char magic[8];
+    if (!readStream.read(magic, 8) || (0 != memcmp(magic, "\x93NUMPY", 6)))
+    {
+        return NULL;
+    }
+    unsigned char lengthBytes[4] = {0};
+    if (1 == magic[6])
+    {
+        readStream.read((char *)lengthBytes, 2); // Version 1.0 uses a 16 bit little endian length
+    }
+    else
+    {
+        readStream.read((char *)lengthBytes, 4);
+    }
+    uint32_t headerLength = lengthBytes[0] | (lengthBytes[1] << 8) | (lengthBytes[2] << 16) | ((uint32_t)lengthBytes[3] << 24);
+    std::string header(headerLength, ' ');
+    if (!readStream.read(&header[0], headerLength))
+    {
+        return NULL;
+    }
+    if ((std::string::npos == header.find("'<f4'")) || (std::string::npos == header.find("'fortran_order': False")))
+    {
+        return NULL; // Only little endian float32 arrays in C order are supported
+    }
+    size_t shapeStart = header.find("'shape': (");
+    unsigned long rows = 0;
+    unsigned long columns = 0;
+    if ((std::string::npos == shapeStart) ||
+        (2 != sscanf(header.c_str() + shapeStart, "'shape': (%lu, %lu)", &rows, &columns)) || (N_states != rows))
+    {
+        return NULL;
+    }
+    size_t dataOffset = (size_t)readStream.tellg();
+    size_t dataLength = (size_t)N_states * columns * sizeof(float);
+
+    std::shared_ptr<Trajectory> trajectory(new Trajectory());
+    trajectory->_N_samples = ((0 == N_samples) || (N_samples > columns)) ? (uint32_t)columns : N_samples;
+    trajectory->_stride = (uint32_t)columns;
+#ifndef _WIN32
+    int fd = open(filePath.c_str(), O_RDONLY);
+    struct stat fileStatus;
+    if ((fd >= 0) && (0 == fstat(fd, &fileStatus)) && ((size_t)fileStatus.st_size >= dataOffset + dataLength))
+    {
+        void * mapping = mmap(NULL, dataOffset + dataLength, PROT_READ, MAP_SHARED, fd, 0);
+        close(fd);
+        if (MAP_FAILED != mapping)
+        {
+            trajectory->_mapping = mapping;
+            trajectory->_mappingLength = dataOffset + dataLength;
+            trajectory->_data = (const float *)((const char *)mapping + dataOffset);
+            return trajectory;
+        }
+    }
+    else if (fd >= 0)
+    {
+        close(fd);
+    }
+#endif
+    trajectory->_storage.resize((size_t)N_states * columns);
+    if (!readStream.read((char *)trajectory->_storage.data(), dataLength))
+    {
+        return NULL;
+    }
+    trajectory->_data = trajectory->_storage.data();
+    return trajectory;
+}
+
+/**
+ * \brief Uses a buffer owned by somebody else without copying it.
+ * release (if any) is called once no model uses the trajectory anymore.
+ */
+std::shared_ptr<Trajectory> Trajectory::wrap(const float * data, uint32_t N_samples, uint32_t stride, Release_t release)
+{
+    std::shared_ptr<Trajectory> trajectory(new Trajectory());
+    trajectory->_data = data;
+    trajectory->_N_samples = N_samples;
+    trajectory->_stride = stride;
+    trajectory->_release = release;
+    return trajectory;
+}
+
+/**
+ * \brief Samples [first, first + N_samples) of parent, without copying them.
+ * The slice keeps parent alive. The caller checks that the range lies inside parent.
+ */
+std::shared_ptr<Trajectory> Trajectory::slice(std::shared_ptr<const Trajectory> parent, uint32_t first, uint32_t N_samples)
+{
+    return Trajectory::wrap(parent->data() + first, N_samples, parent->stride(), [parent]() {});
+}
@@ -0,0 +1,104 @@
+#include "turbulence.hpp"
+
+//Constructor
+Turbulence::Turbulence(float intensity, uint64_t seed) : _intensity(intensity), _seed(seed), _block(3 * (TURBULENCE_BLOCK + 1))
+{
+    this->reset();
+}
+
+void Turbulence::setIntensity(float intensity)
+{
+    _intensity = intensity;
+    this->reset();
+}
+
+void Turbulence::setSeed(uint64_t seed)
+{
+    _seed = seed;
+    this->reset();
+}
+
+/**
+ * \brief Restarts the gust sequence of the seed. Nothing is generated until the next \link advance \endlink, so a
+ * reset before every evaluation is cheap.
+ */
+void Turbulence::reset()
+{
+    _state = _seed;
+    _spareNormal = NAN;
+    _position = -1.0F;
+    _gust[0] = _gust[1] = _gust[2] = 0.0F;
+}
+
+/**
+ * \brief Moves step meters along the path and returns in change how much the gusts (north, east and up) changed,
+ * to be added to the wind. The first call after a reset returns the initial gusts.
+ */
+void Turbulence::advance(float step, float change[3])
+{
+    if (_position < 0.0F)
+    {
+        //Stationary initial gusts, kept as the last sample of the block the first refill continues from
+        for (uint32_t c = 0 ; c < 3 ; c++)
+        {
+            _block[c * (TURBULENCE_BLOCK + 1) + TURBULENCE_BLOCK] = this->normal();
+        }
+        this->refill();
+        _position = 0.0F;
+    }
+    _position += step / TURBULENCE_SPACING;
+    while (_position >= TURBULENCE_BLOCK)
+    {
+        this->refill();
+        _position -= TURBULENCE_BLOCK;
+    }
+    uint32_t i = (uint32_t)_position;
+    float f = _position - i;
+    for (uint32_t c = 0 ; c < 3 ; c++)
+    {
+        const float * samples = &_block[c * (TURBULENCE_BLOCK + 1)];
+        float gust = _intensity * ((1.0F - f) * samples[i] + f * samples[i + 1]);
+        change[c] = gust - _gust[c];
+        _gust[c] = gust;
+    }
+}
+
+void Turbulence::refill()
+{
+    float a = expf(-TURBULENCE_SPACING / TURBULENCE_SCALE);
+    float b = sqrtf(1.0F - a * a);
+    for (uint32_t c = 0 ; c < 3 ; c++)
+    {
+        float * samples = &_block[c * (TURBULENCE_BLOCK + 1)];
+        samples[0] = samples[TURBULENCE_BLOCK]; //Continue from the last sample of the previous block
+        for (uint32_t i = 0 ; i < TURBULENCE_BLOCK ; i++)
+        {
+            samples[i + 1] = a * samples[i] + b * this->normal();
+        }
+    }
+}
+
+float Turbulence::normal()
+{
+    //Box-Muller over splitmix64, which is fast and gives the same sequence on every platform, unlike std distributions
+    if (!isnan(_spareNormal))
+    {
+        float x = _spareNormal;
+        _spareNormal = NAN;
+        return x;
+    }
+    uint64_t z[2];
+    for (uint32_t k = 0 ; k < 2 ; k++)
+    {
+        _state += 0x9E3779B97F4A7C15ULL;
+        z[k] = _state;
+        z[k] = (z[k] ^ (z[k] >> 30)) * 0xBF58476D1CE4E5B9ULL;
+        z[k] = (z[k] ^ (z[k] >> 27)) * 0x94D049BB133111EBULL;
+        z[k] ^= z[k] >> 31;
+    }
+    double u1 = ((z[0] >> 11) + 1) * (1.0 / 9007199254740992.0); //(0, 1]
+    double u2 = (z[1] >> 11) * (1.0 / 9007199254740992.0);       //[0, 1)
+    double r = sqrt(-2.0 * log(u1));
+    _spareNormal = (float)(r * sin(2.0 * M_PI * u2));
+    return (float)(r * cos(2.0 * M_PI * u2));
+}
@@ -12,8 +12,10 @@ from plotly.subplots import make_subplots
 import pandas as pd
 import base64
 import datetime
-import io
+from concurrent.futures import ThreadPoolExecutor
 from optimize_cpp_cmaes import Optimizer
+from optimization_jobs import JobManager
+from utils.trajectory_io import TrajectoryStore
 import plotly.express as px
 import numpy as np
 
@@ -23,11 +25,152 @@ external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
-traj_data = pd.DataFrame()
-traj_filepath = ""
-n_samples = 0
+traj_data = None # TrajectoryStore of the uploaded log
+job_logs = {} # TrajectoryStore each job was submitted with, which may no longer be traj_data when it finishes
 
 optimizer = Optimizer()
+jobs = JobManager(processes=2) # Optimizations run in these processes, away from the requests of every user
+
+# Figures are built from these tables: (column, scale, axis title) of the controls and (column, axis title) of the states
+CONTROL_ROWS = [('da', 200, 'da (%)'), ('de', 200, 'de (%)'), ('dr', 200, 'dr (%)'), ('dt', 100, 'dt (%)')]
+STATE_ROWS = [('roll', 'φ (°)'), ('pitch', 'θ (°)'), ('yaw', 'ψ (°)'), ('vx', 'vx (m/s)'), ('vy', 'vy (m/s)'),
+              ('vz', 'vz (m/s)'), ('p', 'p (°/s)'), ('q', 'q (°/s)'), ('r', 'r (°/s)')]
+MAX_POINTS_2D = 4000 # Points per time series after decimation
+MAX_POINTS_3D = 5000
+EXPORT_SVG = False # Also write every figure to images/ as SVG, in a background thread
+
+figure_cache = {} # Base figures of the loaded trajectory as dicts, cleared on every upload
+export_executor = ThreadPoolExecutor(max_workers=1)
+
+def to_degrees(df):
+    return df.apply(lambda x: np.rad2deg(x) if (x.name == 'roll' or x.name == 'pitch' or x.name == 'yaw' or x.name == 'p' or x.name == 'q' or x.name == 'r') else x)
+
+def decimate(x, y, max_points=MAX_POINTS_2D):
+    # Min/max decimation: keeps the lowest and highest sample of every bucket, so that peaks survive
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= max_points:
+        return x, y
+    size = int(np.ceil(len(y) / (max_points // 2)))
+    buckets = len(y) // size
+    head = y[:buckets * size].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    idx = np.unique(np.concatenate([head.argmin(axis=1) + offsets, head.argmax(axis=1) + offsets,
+                                    np.arange(buckets * size, len(y))]))
+    return x[idx], y[idx]
+
+def stride(values, max_points=MAX_POINTS_3D):
+    values = np.asarray(values)
+    return values[::int(np.ceil(len(values) / max_points))]
+
+def trajectory_figure(reference, solution=False):
+    # 3D path of the reference, plus an empty solution trace that patch_solution fills in
+    fig_3D = go.Figure()
+    fig_3D.add_trace(
+        go.Scatter3d(
+            x=stride(reference['posNorth']),
+            y=stride(reference['posEast']),
+            z=-stride(reference['posDown']),
+            mode='lines',
+            line={"color": 'black'},
+            legendgroup=1,
+            hovertext="Real",
+            showlegend=True,
+            name="Real"
+        )
+    )
+    if solution:
+        fig_3D.add_trace(
+            go.Scatter3d(
+                x=[],
+                y=[],
+                z=[],
+                mode='lines',
+                line={"color": 'black', "dash": 'dash'},
+                legendgroup=1,
+                hovertext="Optim",
+                showlegend=True,
+                opacity=0.5,
+                name="Solution",
+                meta='posNorth'
+            )
+        )
+    fig_3D.add_trace(
+        go.Scatter3d(
+            name="",
+            visible=True,
+            showlegend=False,
+            opacity=0,
+            hoverinfo='none',
+            x=[reference['posNorth'][0],reference['posNorth'][0]],
+            y=[reference['posEast'][0],reference['posEast'][0]],
+            z=[800,980]
+        )
+    )
+    fig_3D.update_layout(
+        margin=dict(l=25, r=25, t=25, b=25),
+        scene=dict(
+            xaxis=dict(
+                title="North (m)"
+            ),
+            yaxis=dict(
+                title="East (m)"
+            ),
+            zaxis=dict(
+                title="Altitude (m)"
+            ),
+            aspectmode="data",
+            camera=dict(
+                projection=dict(
+                    type="orthographic"
+                )
+            ),
+            ),
+        paper_bgcolor="White",
+        title_text="3D trajectory",
+    )
+    return fig_3D.to_dict()
+
+def states_figure(time, controls, reference, solution=False):
+    # Controls of a log and states of the reference over its time vector, plus empty solution traces that
+    # patch_solution fills in
+    fig_2D = make_subplots(rows=13, cols=1, 
+                shared_xaxes=True, 
+                vertical_spacing=0.02)
+    for row, (name, scale, title) in enumerate(CONTROL_ROWS, start=1):
+        x, y = decimate(time, controls[name] * scale)
+        fig_2D.add_trace(go.Scattergl(name=name, showlegend=False, x=x, y=y, line=dict(shape='linear', color="black", dash='solid')), row=row, col=1)
+        fig_2D.update_yaxes(title_text=title, row=row, col=1)
+    for row, (name, title) in enumerate(STATE_ROWS, start=len(CONTROL_ROWS) + 1):
+        x, y = decimate(time[:len(reference['roll'])], reference[name][:len(time)])
+        fig_2D.add_trace(go.Scattergl(name='Real' if name == 'roll' else name, showlegend=(name == 'roll'), x=x, y=y, line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=row, col=1)
+        if solution:
+            fig_2D.add_trace(go.Scattergl(name='Solution' if name == 'roll' else name + '_optim', showlegend=(name == 'roll'), x=[], y=[], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5, meta=name), row=row, col=1)
+        fig_2D.update_yaxes(title_text=title, row=row, col=1)
+    fig_2D.update_layout(height=1000, width=800, title_text="2D trajectories")
+    fig_2D.update_xaxes(title_text="Time (s)", row=13, col=1)
+    return fig_2D.to_dict()
+
+def patch_solution(figure, solution, time=None, three_dimensional=False):
+    # Copy of a cached figure where only the solution traces, tagged with the column they show in meta, are replaced
+    data = list(figure['data'])
+    for idx, trace in enumerate(data):
+        if 'meta' not in trace:
+            continue
+        trace = dict(trace)
+        if three_dimensional:
+            trace['x'] = stride(solution['posNorth'])
+            trace['y'] = stride(solution['posEast'])
+            trace['z'] = -stride(solution['posDown'])
+        else:
+            trace['x'], trace['y'] = decimate(time[:len(solution)], solution[trace['meta']][:len(time)])
+        data[idx] = trace
+    return dict(figure, data=data)
+
+def export_svg(figure, path):
+    # kaleido takes seconds for long logs, so it runs off the request thread
+    if EXPORT_SVG:
+        export_executor.submit(lambda: go.Figure(figure).write_image(path))
 
 app.layout = html.Div(children=[
     html.H3(children='DeepAero'),
@@ -73,6 +216,31 @@ app.layout = html.Div(children=[
         }
     ),
 
+    html.Button(
+        'Cancel',
+        id='cancel-button',
+        n_clicks=0,
+        style={
+            'padding': '10',
+            'margin': '10px'
+        }
+    ),
+
+    html.Div(id='job-status', style={'margin': '10px'}),
+
+    # Job of this browser session, polled for progress while it runs
+    dcc.Store(id='job-id'),
+    dcc.Store(id='job-result'),
+    dcc.Interval(id='job-interval', interval=1000, disabled=True),
+
+    dcc.Graph(
+        id='progress',
+        figure=go.Figure(),
+        style={
+            'width': '600px',
+        }
+    ),
+
     dcc.Graph(
         id='3Dtraj',
         figure=go.Figure(),
@@ -107,23 +275,16 @@ app.layout = html.Div(children=[
     [dash.dependencies.State('upload-data', 'filename')])
 def load_data(contents, filename):
     if contents is not None:
-        global traj_data, traj_filepath, n_samples, time
-        traj_filepath = "/home/fidel/repos/deepaero/" + filename
+        global traj_data
         content_type, content_string = contents.split(',')
         decoded = base64.b64decode(content_string)
         try:
-            if 'csv' in filename:
-                # Assume that the user uploaded a CSV file
-                df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-            elif 'xls' in filename:
-                # Assume that the user uploaded an excel file
-                df = pd.read_excel(io.BytesIO(decoded))
-            traj_data = df # Store dataset in global variable traj_data
-            traj_data = traj_data.apply(lambda x: np.rad2deg(x) if (x.name == 'roll' or x.name == 'pitch' or x.name == 'yaw' or x.name == 'p' or x.name == 'q' or x.name == 'r') else x)
-            n_samples = df.shape[0] # Store number of samples
-            time = np.linspace(0, n_samples * (1 / 60), n_samples)
+            # Parsed once into the array optimcore uses, with no copy on disk
+            traj_data = TrajectoryStore.fromBytes(decoded, filename)
+            figure_cache.clear()
+            df = traj_data.head(3)
             print(df)
-            optimizer.loadTrajectory(traj_filepath, n_samples)
+            optimizer.setTrajectory(traj_data.trajectory)
         except Exception as e:
             print(e)
             return html.Div([
@@ -166,213 +327,91 @@ def load_data(contents, filename):
         for _ in range(N):
             us += optimizer.getEvaluationTimeInMicroseconds()
         print(f'Microseconds: {us/N}')
-        print(f'Number of samples: {n_samples}')
+        print(f'Number of samples: {traj_data.nsamples}')
         print(f'Number of states: {df.shape[1]}')
         return table1#, table2
 
+@app.callback(
+    [dash.dependencies.Output('job-id', 'data'),
+    dash.dependencies.Output('job-interval', 'disabled')],
+    [dash.dependencies.Input('optimize-button', 'n_clicks'),
+    dash.dependencies.Input('cancel-button', 'n_clicks'),
+    dash.dependencies.Input('job-result', 'data')],
+    [dash.dependencies.State('job-id', 'data')])
+def control_job(optimize_clicks, cancel_clicks, finished_job_id, job_id):
+    # Starts the optimization in the job pool and returns immediately, or cancels the running one.
+    # Polling stops once the job has finished
+    changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
+    if 'job-result' in changed_id:
+        return dash.no_update, finished_job_id is not None
+    if 'optimize-button' in changed_id and optimize_clicks > 0 and traj_data is not None:
+        if job_id is not None:
+            jobs.remove(job_id)
+            job_logs.pop(job_id, None)
+        job_id = jobs.submit(mode='single', trajectory=traj_data.trajectory)
+        job_logs[job_id] = traj_data
+        return job_id, False
+    if 'cancel-button' in changed_id and job_id is not None:
+        jobs.cancel(job_id)
+    return dash.no_update, dash.no_update
+
+@app.callback(
+    [dash.dependencies.Output('progress', 'figure'),
+    dash.dependencies.Output('job-status', 'children'),
+    dash.dependencies.Output('job-result', 'data')],
+    [dash.dependencies.Input('job-interval', 'n_intervals')],
+    [dash.dependencies.State('job-id', 'data'),
+    dash.dependencies.State('job-result', 'data')])
+def poll_job(n_intervals, job_id, finished_job_id):
+    # Best fitness and step size of every generation so far. job-result is set once the job finishes
+    progress = jobs.progress(job_id) if job_id is not None else None
+    if progress is None:
+        return dash.no_update, dash.no_update, dash.no_update
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.05)
+    fig.add_trace(go.Scatter(name='Best fitness', showlegend=False, x=progress['generation'], y=progress['fitness'], line=dict(color="black")), row=1, col=1)
+    fig.add_trace(go.Scatter(name='Sigma', showlegend=False, x=progress['generation'], y=progress['sigma'], line=dict(color="black")), row=2, col=1)
+    fig.update_yaxes(title_text="Best fitness", type="log", row=1, col=1)
+    fig.update_yaxes(title_text="σ", type="log", row=2, col=1)
+    fig.update_xaxes(title_text="Generation", row=2, col=1)
+    fig.update_layout(height=500, margin=dict(l=25, r=25, t=25, b=25))
+    status = f"Job {progress['status']}"
+    if progress['generation']:
+        status += f", generation {progress['generation'][-1]}, best fitness {progress['fitness'][-1]:.6f}"
+    finished = progress['status'] not in ('queued', 'running') and job_id != finished_job_id
+    return fig, status, job_id if finished else dash.no_update
+
 @app.callback(
     [dash.dependencies.Output('3Dtraj', 'figure'),
     dash.dependencies.Output('2Dtraj', 'figure'),],
-    [dash.dependencies.Input('optimize-button', 'n_clicks'),
+    [dash.dependencies.Input('job-result', 'data'),
     dash.dependencies.Input('output-data-upload', 'children')],
     [dash.dependencies.State('3Dtraj', 'figure'),
     dash.dependencies.State('2Dtraj', 'figure')])
-def run_optimization(n_clicks, contents, current_fig_3D, current_fig_2D):
+def run_optimization(job_id, contents, current_fig_3D, current_fig_2D):
     global traj_data
     changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
-    if 'optimize-button' in changed_id:
-        df_optim, df_real = optimizer.optimize(mode='single')
-        df_optim = df_optim.apply(lambda x: np.rad2deg(x) if (x.name == 'roll' or x.name == 'pitch' or x.name == 'yaw' or x.name == 'p' or x.name == 'q' or x.name == 'r') else x)
-        df_real = df_real.apply(lambda x: np.rad2deg(x) if (x.name == 'roll' or x.name == 'pitch' or x.name == 'yaw' or x.name == 'p' or x.name == 'q' or x.name == 'r') else x)
-        fig_3D = go.Figure()
-        fig_3D.add_trace(
-            go.Scatter3d(
-                x=df_real['posNorth'],
-                y=df_real['posEast'],
-                z=-df_real['posDown'],
-                mode='lines',
-                line={"color": 'black'},
-                legendgroup=1,
-                hovertext="Real",
-                showlegend=True,
-                name="Real"
-            )
-        )
-        fig_3D.add_trace(
-            go.Scatter3d(
-                x=df_optim['posNorth'],
-                y=df_optim['posEast'],
-                z=-df_optim['posDown'],
-                mode='lines',
-                line={"color": 'black', "dash": 'dash'},
-                legendgroup=1,
-                hovertext="Optim",
-                showlegend=True,
-                opacity=0.5,
-                name="Solution"
-            )
-        )
-        fig_3D.add_trace(
-            go.Scatter3d(
-                name="",
-                visible=True,
-                showlegend=False,
-                opacity=0,
-                hoverinfo='none',
-                x=[traj_data['posNorth'][0],traj_data['posNorth'][0]],
-                y=[traj_data['posEast'][0],traj_data['posEast'][0]],
-                z=[800,980]
-            )
-        )
-        fig_3D.update_layout(
-            margin=dict(l=25, r=25, t=25, b=25),
-            xaxis=dict(
-                title="North (m)"
-            ),
-            scene=dict(
-                aspectmode="data",
-                xaxis=dict(
-                    title="North (m)"
-                ),
-                yaxis=dict(
-                    title="East (m)"
-                ),
-                zaxis=dict(
-                    title="Altitude (m)"
-                ),
-                camera=dict(
-                    projection=dict(
-                        type="orthographic"
-                    )
-                ),
-                ),
-            paper_bgcolor="White",
-            title_text="3D trajectory",
-        )
-        fig_3D.write_image('images/solution-pos.svg')
-        fig_2D = make_subplots(rows=13, cols=1, 
-                    shared_xaxes=True, 
-                    vertical_spacing=0.02)
-        fig_2D.add_trace(go.Scatter(name='da', showlegend=False, x=time, y=traj_data['da']*200, line=dict(shape='linear', color="black", dash='solid')), row=1, col=1)
-        fig_2D.add_trace(go.Scatter(name='de', showlegend=False, x=time, y=traj_data['de']*200, line=dict(shape='linear', color="black", dash='solid')), row=2, col=1)
-        fig_2D.add_trace(go.Scatter(name='dr', showlegend=False, x=time, y=traj_data['dr']*200, line=dict(shape='linear', color="black", dash='solid')), row=3, col=1)
-        fig_2D.add_trace(go.Scatter(name='dt', showlegend=False, x=time, y=traj_data['dt']*100, line=dict(shape='linear', color="black", dash='solid')), row=4, col=1)
-        fig_2D.add_trace(go.Scatter(name='Real', showlegend=True, x=time, y=df_real['roll'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=5, col=1)
-        fig_2D.add_trace(go.Scatter(name='Solution', showlegend=True, x=time, y=df_optim['roll'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=5, col=1)
-        fig_2D.add_trace(go.Scatter(name='pitch_real', showlegend=False, x=time, y=df_real['pitch'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=6, col=1)
-        fig_2D.add_trace(go.Scatter(name='pitch_optim', showlegend=False, x=time, y=df_optim['pitch'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=6, col=1)
-        fig_2D.add_trace(go.Scatter(name='yaw_real', showlegend=False, x=time, y=df_real['yaw'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=7, col=1)
-        fig_2D.add_trace(go.Scatter(name='yaw_optim', showlegend=False, x=time, y=df_optim['yaw'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=7, col=1)
-        fig_2D.add_trace(go.Scatter(name='vx_real', showlegend=False, x=time, y=df_real['vx'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=8, col=1)
-        fig_2D.add_trace(go.Scatter(name='vx_optim', showlegend=False, x=time, y=df_optim['vx'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=8, col=1)
-        fig_2D.add_trace(go.Scatter(name='vy_real', showlegend=False, x=time, y=df_real['vy'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=9, col=1)
-        fig_2D.add_trace(go.Scatter(name='vy_optim', showlegend=False, x=time, y=df_optim['vy'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=9, col=1)
-        fig_2D.add_trace(go.Scatter(name='vz_real', showlegend=False, x=time, y=df_real['vz'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=10, col=1)
-        fig_2D.add_trace(go.Scatter(name='vz_optim', showlegend=False, x=time, y=df_optim['vz'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=10, col=1)
-        fig_2D.add_trace(go.Scatter(name='p_real', showlegend=False, x=time, y=df_real['p'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=11, col=1)
-        fig_2D.add_trace(go.Scatter(name='p_optim', showlegend=False, x=time, y=df_optim['p'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=11, col=1)
-        fig_2D.add_trace(go.Scatter(name='q_real', showlegend=False, x=time, y=df_real['q'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=12, col=1)
-        fig_2D.add_trace(go.Scatter(name='q_optim', showlegend=False, x=time, y=df_optim['q'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=12, col=1)
-        fig_2D.add_trace(go.Scatter(name='r_real', showlegend=False, x=time, y=df_real['r'], line=dict(shape='linear', color="black", dash='solid'), opacity=1), row=13, col=1)
-        fig_2D.add_trace(go.Scatter(name='r_optim', showlegend=False, x=time, y=df_optim['r'], line=dict(shape='linear', color="black", dash='dash'), opacity=0.5), row=13, col=1)
-        fig_2D.update_layout(height=1000, width=800, title_text="2D trajectories")
-        fig_2D.update_yaxes(title_text="da (%)", row=1, col=1)
-        fig_2D.update_yaxes(title_text="de (%)", row=2, col=1)
-        fig_2D.update_yaxes(title_text="dr (%)", row=3, col=1)
-        fig_2D.update_yaxes(title_text="dt (%)", row=4, col=1)
-        fig_2D.update_yaxes(title_text="φ (°)", row=5, col=1)
-        fig_2D.update_yaxes(title_text="θ (°)", row=6, col=1)
-        fig_2D.update_yaxes(title_text="ψ (°)", row=7, col=1)
-        fig_2D.update_yaxes(title_text="vx (m/s)", row=8, col=1)
-        fig_2D.update_yaxes(title_text="vy (m/s)", row=9, col=1)
-        fig_2D.update_yaxes(title_text="vz (m/s)", row=10, col=1)
-        fig_2D.update_yaxes(title_text="p (°/s)", row=11, col=1)
-        fig_2D.update_yaxes(title_text="q (°/s)", row=12, col=1)
-        fig_2D.update_yaxes(title_text="r (°/s)", row=13, col=1)
-        fig_2D.update_xaxes(title_text="Time (s)", row=13, col=1)
-        fig_2D.write_image('images/solution-states.svg')
-    elif 'output-data-upload' in changed_id and not traj_data.empty:
-        fig_3D = go.Figure()
-        fig_3D.add_trace(
-            go.Scatter3d(
-                x=traj_data['posNorth'],
-                y=traj_data['posEast'],
-                z=-traj_data['posDown'],
-                mode='lines',
-                line={"color": 'black'},
-                legendgroup=1,
-                hovertext="Real",
-                showlegend=True,
-                name="Real",
-            )
-        )
-        fig_3D.add_trace(
-            go.Scatter3d(
-                name="",
-                visible=True,
-                showlegend=False,
-                opacity=0,
-                hoverinfo='none',
-                x=[traj_data['posNorth'][0],traj_data['posNorth'][0]],
-                y=[traj_data['posEast'][0],traj_data['posEast'][0]],
-                z=[800,980]
-            )
-        )
-        fig_3D.update_layout(
-            margin=dict(l=25, r=25, t=25, b=25),
-            scene=dict(
-                xaxis=dict(
-                    title="North (m)"
-                ),
-                yaxis=dict(
-                    title="East (m)"
-                ),
-                zaxis=dict(
-                    title="Altitude (m)"
-                ),
-                aspectmode="data",
-                camera=dict(
-                    projection=dict(
-                        type="orthographic"
-                    )
-                ),
-                ),
-            paper_bgcolor="White",
-            title_text="3D trajectory",
-        )
-        fig_3D.write_image('images/real-pos.svg')
-        fig_2D = make_subplots(rows=13, cols=1, 
-                    shared_xaxes=True, 
-                    vertical_spacing=0.02)
-        fig_2D.add_trace(go.Scatter(name='da', showlegend=False, x=time, y=traj_data['da']*200, line=dict(shape='linear', color="black", dash='solid')), row=1, col=1)
-        fig_2D.add_trace(go.Scatter(name='de', showlegend=False, x=time, y=traj_data['de']*200, line=dict(shape='linear', color="black", dash='solid')), row=2, col=1)
-        fig_2D.add_trace(go.Scatter(name='dr', showlegend=False, x=time, y=traj_data['dr']*200, line=dict(shape='linear', color="black", dash='solid')), row=3, col=1)
-        fig_2D.add_trace(go.Scatter(name='dt', showlegend=False, x=time, y=traj_data['dt']*100, line=dict(shape='linear', color="black", dash='solid')), row=4, col=1)
-        fig_2D.add_trace(go.Scatter(name='Real', showlegend=True, x=time, y=traj_data['roll'], line=dict(shape='linear', color="black", dash='solid')), row=5, col=1)
-        fig_2D.add_trace(go.Scatter(name='pitch', showlegend=False, x=time, y=traj_data['pitch'], line=dict(shape='linear', color="black", dash='solid')), row=6, col=1)
-        fig_2D.add_trace(go.Scatter(name='yaw', showlegend=False, x=time, y=traj_data['yaw'], line=dict(shape='linear', color="black", dash='solid')), row=7, col=1)
-        fig_2D.add_trace(go.Scatter(name='vx', showlegend=False, x=time, y=traj_data['vx'], line=dict(shape='linear', color="black", dash='solid')), row=8, col=1)
-        fig_2D.add_trace(go.Scatter(name='vy', showlegend=False, x=time, y=traj_data['vy'], line=dict(shape='linear', color="black", dash='solid')), row=9, col=1)
-        fig_2D.add_trace(go.Scatter(name='vz', showlegend=False, x=time, y=traj_data['vz'], line=dict(shape='linear', color="black", dash='solid')), row=10, col=1)
-        fig_2D.add_trace(go.Scatter(name='p', showlegend=False, x=time, y=traj_data['p'], line=dict(shape='linear', color="black", dash='solid')), row=11, col=1)
-        fig_2D.add_trace(go.Scatter(name='q', showlegend=False, x=time, y=traj_data['q'], line=dict(shape='linear', color="black", dash='solid')), row=12, col=1)
-        fig_2D.add_trace(go.Scatter(name='r', showlegend=False, x=time, y=traj_data['r'], line=dict(shape='linear', color="black", dash='solid')), row=13, col=1)
-        fig_2D.update_layout(height=1000, width=800, title_text="2D trajectories")
-        fig_2D.update_yaxes(title_text="da (%)", row=1, col=1)
-        fig_2D.update_yaxes(title_text="de (%)", row=2, col=1)
-        fig_2D.update_yaxes(title_text="dr (%)", row=3, col=1)
-        fig_2D.update_yaxes(title_text="dt (%)", row=4, col=1)
-        fig_2D.update_yaxes(title_text="φ (°)", row=5, col=1)
-        fig_2D.update_yaxes(title_text="θ (°)", row=6, col=1)
-        fig_2D.update_yaxes(title_text="ψ (°)", row=7, col=1)
-        fig_2D.update_yaxes(title_text="vx (m/s)", row=8, col=1)
-        fig_2D.update_yaxes(title_text="vy (m/s)", row=9, col=1)
-        fig_2D.update_yaxes(title_text="vz (m/s)", row=10, col=1)
-        fig_2D.update_yaxes(title_text="p (°/s)", row=11, col=1)
-        fig_2D.update_yaxes(title_text="q (°/s)", row=12, col=1)
-        fig_2D.update_yaxes(title_text="r (°/s)", row=13, col=1)
-        fig_2D.update_xaxes(title_text="Time (s)", row=13, col=1)
-        fig_2D.write_image('images/real-states.svg')
+    result = jobs.result(job_id) if job_id is not None else None
+    if 'job-result' in changed_id and result is not None:
+        df_optim, df_real = to_degrees(result[0]), to_degrees(result[1])
+        log = job_logs[job_id]
+        if log is not traj_data:
+            # Finished after another upload, its figures do not belong in the cache of the loaded trajectory
+            figures = (trajectory_figure(df_real, solution=True), states_figure(log.time, log, df_real, solution=True))
+        else:
+            if 'solution' not in figure_cache:
+                # Controls and reference replay only depend on the loaded trajectory, so they are built once
+                figure_cache['solution'] = (trajectory_figure(df_real, solution=True), states_figure(log.time, log, df_real, solution=True))
+            figures = figure_cache['solution']
+        fig_3D = patch_solution(figures[0], df_optim, three_dimensional=True)
+        fig_2D = patch_solution(figures[1], df_optim, log.time)
+        export_svg(fig_3D, 'images/solution-pos.svg')
+        export_svg(fig_2D, 'images/solution-states.svg')
+    elif 'output-data-upload' in changed_id and traj_data is not None:
+        if 'real' not in figure_cache:
+            figure_cache['real'] = (trajectory_figure(traj_data), states_figure(traj_data.time, traj_data, traj_data))
+        fig_3D, fig_2D = figure_cache['real']
+        export_svg(fig_3D, 'images/real-pos.svg')
+        export_svg(fig_2D, 'images/real-states.svg')
     else:
         fig_3D = current_fig_3D
         fig_2D = current_fig_2D
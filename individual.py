@@ -1,4 +1,5 @@
 from modules.dynamic_model import Model
+from modules.batch_model import BatchModel, STATES
 import numpy as np
 import pandas as pd
 
@@ -32,6 +33,25 @@ class Individual():
                 self.fitness += ((self.vehicle.posNorth - traj['posNorth'][idx])**2 + (self.vehicle.posEast - traj['posEast'][idx])**2 + (self.vehicle.alt + traj['posDown'][idx])**2)
             # print(f'{self.vehicle.posNorth} {traj["posNorth"][idx]}')
 
+def evaluatePopulation(aeros, traj):
+    # Fitness of Individual.evaluate for every row of aeros, propagating the whole population at each time step. Values
+    # agree to rounding, not to the last bit: numpy may evaluate sin and cos of arrays with SIMD routines that differ
+    # from the scalar ones of Model, which adds up to about 1e-7 relative over a trajectory
+    vehicles = BatchModel(aeros)
+    columns = {name: traj[name].values for name in traj.columns} # Read each column once instead of indexing the DataFrame per sample
+    initialStates = {'vx': columns['vx'][0], 'vy': columns['vy'][0], 'vz': - columns['vz'][0],
+                     'roll': columns['roll'][0], 'pitch': columns['pitch'][0], 'yaw': columns['yaw'][0],
+                     'p': columns['p'][0], 'q': columns['q'][0], 'r': - columns['r'][0],
+                     'posNorth': columns['posNorth'][0], 'posEast': columns['posEast'][0], 'alt': - columns['posDown'][0]}
+    vehicles.setStates([initialStates[name] for name in STATES])
+    controls = np.column_stack([columns['da'], columns['de'], columns['dr'], columns['dt']])
+    reference = np.column_stack([columns['posNorth'], columns['posEast'], - columns['posDown']])
+    fitness = np.zeros(vehicles.size)
+    for idx in range(1, traj.shape[0]):
+        vehicles.propagate(controls[idx], 1/60)
+        fitness += np.sum((vehicles.states[:, -3:] - reference[idx])**2, axis=1)
+    return fitness
+
 if __name__ == '__main__':
     aero = [0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265]
     ind = Individual(aero)
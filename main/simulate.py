@@ -1,10 +1,10 @@
 import os.path, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)) # Add parent directory to path
 import numpy as np
-import pandas as pd
 import socket
 import pygame
-from utils.repeated_timer import RepeatedTimer
+from utils.realtime_executor import RealTimeExecutor
+from utils.flight_recorder import FlightRecorder, TRAJECTORY_CHANNELS
 from modules.dynamic_model import Model
 
 # Open socket connection
@@ -49,23 +49,11 @@ line1 = []
 iteration = 0
 plot_style = 'state'
 
-# Initialize variables for data recording
-da = []
-de = []
-dr = []
-dt = []
-roll = []
-pitch = []
-yaw = []
-posNorth = []
-posEast = []
-posDown = []
-vx = []
-vy = []
-vz = []
-p = []
-q = []
-r = []
+# Set recording duration (s), None records until interrupted
+recording_time = None
+
+# Recorded channels: identification format followed by air data
+recorder = FlightRecorder('./data.csv', TRAJECTORY_CHANNELS + ['alpha', 'beta', 'TAS'])
 
 def step():
 
@@ -90,34 +78,24 @@ def step():
 	sock.sendto(buffer, (UDP_IP, UDP_PORT))  # Send array to FG
 
 	# Fill in data structure
-	da.append(plane.da)
-	de.append(plane.de)
-	dr.append(plane.dr)
-	dt.append(plane.dt)
-	roll.append(plane.roll)
-	pitch.append(plane.pitch)
-	yaw.append(plane.yaw)
-	posNorth.append(plane.posNorth)
-	posEast.append(plane.posEast)
-	posDown.append(-plane.alt)
-	vx.append(plane.vx)
-	vy.append(plane.vy)
-	vz.append(plane.vz)
-	p.append(plane.p)
-	q.append(plane.q)
-	r.append(plane.r)
+	recorder.record(plane.da, plane.de, plane.dr, plane.dt, plane.roll, plane.pitch, plane.yaw, plane.posNorth, plane.posEast,
+	                -plane.alt, plane.vx, plane.vy, plane.vz, plane.p, plane.q, plane.r, plane.alpha, plane.beta, plane.TAS)
 
 	# Update counter
 	iteration += 1
 
-	# Save data
-	if iteration == update_frequency * 20:
-		df = pd.DataFrame({'da': da, 'de': de, 'dr': dr, 'dt': dt, 'roll': roll, 'pitch': pitch, 'yaw': yaw, 'posNorth': posNorth, 'posEast': posEast, 'posDown': posDown, 'vx': vx, 'vy': vy, 'vz': vz, 'p': p, 'q': q, 'r': r})
-		print(df)
-		df.to_csv(path_or_buf='./data.csv')
+	# Stop recording
+	if recording_time is not None and iteration == update_frequency * recording_time:
 		sys.exit(0)
 
 
-# Start task scheduler
-scheduler = RepeatedTimer(1/update_frequency, step)
+# Start task scheduler, frame timing statistics are written to timing.json on exit
+scheduler = RealTimeExecutor(1/update_frequency, step, statsPath='timing.json')
+try:
+	scheduler.thread.join()
+except KeyboardInterrupt:
+	scheduler.stop()
+finally:
+	recorder.close() # Writes the samples still in memory
+	print(f'{recorder.samples} samples recorded to data.csv')
 
@@ -0,0 +1,47 @@
+import os.path, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)) # Add parent directory to path
+import argparse
+import time
+from utils.batch_simulation import hold, doublet, multistep, sweep, replay, simulate
+from utils.trajectory_io import saveTrajectory
+
+# Headless simulation of scripted manoeuvres, without joystick and faster than real time.
+# Usage examples:
+#   python main/simulate_batch.py data.csv --manoeuvre doublet --axis de --amplitude 0.05
+#   python main/simulate_batch.py data.npy --manoeuvre 3211 --axis da --amplitude 0.1 --duration 30
+#   python main/simulate_batch.py data.csv --manoeuvre sweep --axis dr --amplitude 0.05 --f0 0.1 --f1 3
+#   python main/simulate_batch.py data.csv --replay flight.csv
+
+parser = argparse.ArgumentParser(description='Simulate a control schedule and write it in the identification format.')
+parser.add_argument('output', help='Output trajectory, .csv or .npy')
+parser.add_argument('--manoeuvre', choices=['doublet', '3211', 'sweep'], default='doublet')
+parser.add_argument('--axis', choices=['da', 'de', 'dr', 'dt'], default='de')
+parser.add_argument('--amplitude', type=float, default=0.05)
+parser.add_argument('--start', type=float, default=2.0, help='Start of the manoeuvre (s)')
+parser.add_argument('--width', type=float, default=1.0, help='Pulse width of doublets and 3-2-1-1 (s)')
+parser.add_argument('--f0', type=float, default=0.1, help='Initial sweep frequency (Hz)')
+parser.add_argument('--f1', type=float, default=2.0, help='Final sweep frequency (Hz)')
+parser.add_argument('--duration', type=float, default=20.0, help='Length of the simulation (s)')
+parser.add_argument('--throttle', type=float, default=0.5)
+parser.add_argument('--frequency', type=float, default=60.0)
+parser.add_argument('--replay', help='Replay the controls of a recorded trajectory instead of a manoeuvre')
+args = parser.parse_args()
+
+if args.replay is not None:
+    controls = replay(args.replay)
+else:
+    controls = hold(args.duration, args.frequency, dt=args.throttle)
+    if args.manoeuvre == 'doublet':
+        doublet(controls, args.axis, args.amplitude, args.start, args.width, args.frequency)
+    elif args.manoeuvre == '3211':
+        multistep(controls, args.axis, args.amplitude, args.start, args.width, args.frequency)
+    else:
+        if args.start >= args.duration:
+            parser.error('--start must be before the end of the --duration of the sweep')
+        sweep(controls, args.axis, args.amplitude, args.start, args.duration - args.start, args.f0, args.f1, args.frequency)
+
+start = time.perf_counter()
+trajectory = simulate(controls, args.frequency)
+elapsed = time.perf_counter() - start
+saveTrajectory(args.output, trajectory)
+print(f'{trajectory.shape[1]} samples ({trajectory.shape[1] / args.frequency:.1f} s) simulated in {elapsed * 1e3:.1f} ms, written to {args.output}')
@@ -1,10 +1,10 @@
 import os.path, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)) # Add parent directory to path
 import numpy as np
-import pandas as pd
 import socket
 import pygame
-from utils.repeated_timer import RepeatedTimer
+from utils.realtime_executor import RealTimeExecutor
+from utils.flight_recorder import FlightRecorder, TRAJECTORY_CHANNELS
 from modules.dynamic_model import Model
 import optimcore as optim
 
@@ -16,7 +16,7 @@ sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # AF_INET: Internet  SO
 # Set recording parameters
 update_frequency = 60 # Update frequency (Hz)
 setup_time = 5 # Initial setup time (s)
-recording_time = 20 # Duration of recording process (s)
+recording_time = None # Duration of recording process (s), None records until interrupted
 
 # Create plane object
 plane = optim.Model(update_frequency)
@@ -44,23 +44,8 @@ angular_range_ailerons = 0.25
 angular_range_elevator = 0.25
 angular_range_rudder = 0.25
 
-# Initialize variables for data recording
-da_buf = []
-de_buf = []
-dr_buf = []
-dt_buf = []
-roll_buf = []
-pitch_buf = []
-yaw_buf = []
-posNorth_buf = []
-posEast_buf = []
-posDown_buf = []
-vx_buf = []
-vy_buf = []
-vz_buf = []
-p_buf = []
-q_buf = []
-r_buf = []
+# Recorded channels: identification format followed by air data
+recorder = FlightRecorder('./data.csv', TRAJECTORY_CHANNELS + ['alpha', 'beta', 'TAS'])
 
 def step():
 
@@ -74,6 +59,9 @@ def step():
 	lat = internals[0]
 	lon = internals[1]
 	rotor_rpm = internals[2]
+	TAS = internals[6]
+	alpha = internals[4]
+	beta = internals[5]
 	posNorth = states[0]
 	posEast = states[1]
 	alt = states[2]
@@ -106,22 +94,7 @@ def step():
 
 	# Fill in data structure
 	if iteration >= update_frequency * setup_time:
-		da_buf.append(da)
-		de_buf.append(de)
-		dr_buf.append(dr)
-		dt_buf.append(dt)
-		roll_buf.append(roll)
-		pitch_buf.append(pitch)
-		yaw_buf.append(yaw)
-		posNorth_buf.append(posNorth)
-		posEast_buf.append(posEast)
-		posDown_buf.append(-alt)
-		vx_buf.append(vx)
-		vy_buf.append(vy)
-		vz_buf.append(vz)
-		p_buf.append(p)
-		q_buf.append(q)
-		r_buf.append(r)
+		recorder.record(da, de, dr, dt, roll, pitch, yaw, posNorth, posEast, -alt, vx, vy, vz, p, q, r, alpha, beta, TAS)
 
 	# Get joystick values
 	pygame.event.pump()
@@ -136,29 +109,18 @@ def step():
 	# Update counter
 	iteration += 1
 
-	# Save data
-	if iteration == update_frequency * (recording_time + setup_time):
-		df = pd.DataFrame({'da': da_buf,
-		                   'de': de_buf,
-						   'dr': dr_buf,
-						   'dt': dt_buf,
-						   'roll': roll_buf,
-						   'pitch': pitch_buf,
-						   'yaw': yaw_buf,
-						   'posNorth': posNorth_buf,
-						   'posEast': posEast_buf,
-						   'posDown': posDown_buf,
-						   'vx': vx_buf,
-						   'vy': vy_buf,
-						   'vz': vz_buf,
-						   'p': p_buf,
-						   'q': q_buf,
-						   'r': r_buf})
-		print(df)
-		df.to_csv(path_or_buf='./data.csv')
+	# Stop recording
+	if recording_time is not None and iteration == update_frequency * (recording_time + setup_time):
 		sys.exit(0)
 
 
-# Start task scheduler
-scheduler = RepeatedTimer(1/update_frequency, step)
+# Start task scheduler, frame timing statistics are written to timing.json on exit
+scheduler = RealTimeExecutor(1/update_frequency, step, statsPath='timing.json')
+try:
+	scheduler.thread.join()
+except KeyboardInterrupt:
+	scheduler.stop()
+finally:
+	recorder.close() # Writes the samples still in memory
+	print(f'{recorder.samples} samples recorded to data.csv')
 
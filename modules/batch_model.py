@@ -0,0 +1,230 @@
+import numpy as np
+from modules.dynamic_model import defaultParams, defaultControls, defaultWind, aux1, R, deg2rad, Turbulence
+
+# Column order of the (K, 12) state array, same as the order of defaultStates in dynamic_model
+STATES = ['vx', 'vy', 'vz', 'roll', 'pitch', 'yaw', 'p', 'q', 'r', 'posNorth', 'posEast', 'alt']
+S_VX, S_VY, S_VZ, S_ROLL, S_PITCH, S_YAW, S_P, S_Q, S_R, S_NORTH, S_EAST, S_ALT = range(len(STATES))
+
+
+class BatchModel:
+
+	"""Vectorized version of dynamic_model.Model that propagates K aircraft at once.
+
+	Every aircraft shares params, wind and control inputs but has its own row of
+	aerodynamic coefficients. States are kept in a (K, 12) array with columns ordered
+	as in STATES, so a whole population is advanced with one set of array operations.
+
+	Any entry of params and wind, and the turbulence and response times, may also be a
+	(K,) array instead of a scalar to give each aircraft its own value, as in Monte Carlo
+	dispersions.
+	"""
+
+	def __init__(self, aero, params=defaultParams, controls=defaultControls, wind=defaultWind, turbulenceIntensity=None, servosResponseTime=None, engineResponseTime=None, initVelocity=100, turbulenceSeed=None):
+
+		aero = np.atleast_2d(np.asarray(aero, dtype=np.float64))
+		self.size = aero.shape[0]  # Number of aircraft
+
+		# Set initial parameters
+		self.m = params[0]
+		self.g = params[1]
+		self.rho = params[2]
+		self.S = params[3]
+		self.Tmax = params[4]
+		self.b = params[5]
+		self.c = params[6]
+		self.Ix = params[7]
+		self.Iy = params[8]
+		self.Iz = params[9]
+		self.Ixz = params[10]
+		self.incidence = params[11]*deg2rad  # Angle of incidence (degrees). Calado del ala
+
+		# Set aerodynamic coefficients, one column of shape (K,) per coefficient
+		(self.Cd0, self.K, self.Cdb, self.Cyb, self.Cyda, self.Cydr, self.Cyp, self.Cyr, self.Cl0, self.Cla,
+		 self.Cllb, self.Cllda, self.Clldr, self.Cllp, self.Cllr, self.Cmm0, self.Cmma, self.Cmmda, self.Cmmde,
+		 self.Cmmdr, self.Cmmq, self.Cnnb, self.Cnnda, self.Cnndr, self.Cnnp, self.Cnnr) = aero.T.copy()
+
+		# Set controls
+		self.controls = np.tile(np.asarray(controls, dtype=np.float64), (self.size, 1))
+
+		# For estimation of AoA, pitch and body velocities for level flight
+		self.initVelocity = initVelocity
+		dynamic_pressure = 0.5 * self.rho * self.initVelocity ** 2
+		term1 = np.tan((((self.m*self.g)/(dynamic_pressure*self.S))-self.Cl0)/self.Cla + self.incidence)
+
+		# Set initial states
+		self.states = np.zeros((self.size, len(STATES)))
+		self.states[:, S_VX] = np.sqrt(self.initVelocity**2/(1+term1**2))
+		self.states[:, S_VZ] = self.states[:, S_VX] * term1
+		self.states[:, S_ALT] = 900
+
+		# Set internal variables
+		self.V = np.sqrt(np.sum(self.states[:, S_VX:S_VZ+1]**2, axis=1))
+		self.alpha = np.arctan2(self.states[:, S_VZ], self.states[:, S_VX]) - self.incidence
+		self.beta = np.arcsin(self.states[:, S_VY] / self.V)
+		self.states[:, S_PITCH] = self.alpha + self.incidence  # Same as np.arctan2(vz, vx)
+		self.lon = np.full(self.size, -3.574605617 * deg2rad)  # Madrid Barajas Airport (LEMD)
+		self.lat = np.full(self.size, 40.49187427 * deg2rad)
+		self.total_time = 0
+		self.Xt = self.Tmax*self.controls[:, 3]
+		self.rotor_rpm = np.zeros(self.size)
+		self.servosResponseTime = servosResponseTime
+		self.engineResponseTime = engineResponseTime
+
+		# Set wind
+		self.windVelocity = np.asarray(wind[0])
+		self.windHeading = np.asarray(wind[1]) * deg2rad
+		self.windElevation = np.asarray(wind[2]) * deg2rad
+		self.turbulenceIntensity = turbulenceIntensity
+		self.wind = np.empty((self.size, 3))
+		self.wind[:, 0] = self.windVelocity * np.cos(self.windElevation) * np.cos(self.windHeading)
+		self.wind[:, 1] = self.windVelocity * np.cos(self.windElevation) * np.sin(self.windHeading)
+		self.wind[:, 2] = self.windVelocity * np.sin(self.windElevation)
+		self.meanWind = self.wind.copy()
+
+		# Set turbulence, each aircraft with its own gusts from the generator seeded by turbulenceSeed
+		self.turbulence = Turbulence(self.size, turbulenceSeed) if turbulenceIntensity is not None else None
+
+		# Set true airspeed
+		self.TAS = np.zeros(self.size)
+
+	def setStates(self, states):
+		# Broadcasts a single state vector (12,) or sets one row per aircraft (K, 12)
+		self.states[:] = states
+
+	def propagate(self, controls=defaultControls, dtime=1/60, mode='complete'):
+
+		# Controls, either shared (4,) or one row per aircraft (K, 4)
+		if self.servosResponseTime is None:
+			self.controls[:] = controls
+		else:
+			self.controls += (1/(60*np.reshape(self.servosResponseTime, (-1, 1))))*(np.asarray(controls)-self.controls)
+		da, de, dr, dt = self.controls.T
+
+		# States views
+		vx, vy, vz, roll, pitch, yaw, p, q, r = self.states[:, :S_NORTH].T
+
+		# Euler trigonometry variables
+		cr = np.cos(roll)
+		sr = np.sin(roll)
+		cp = np.cos(pitch)
+		sp = np.sin(pitch)
+		tp = np.tan(pitch)
+		cy = np.cos(yaw)
+		sy = np.sin(yaw)
+
+		# Auxiliary coefficients
+		coeffA = self.b/(2*self.V)
+		coeffB = self.c/(2*self.V)
+
+		# Introduce turbulence
+		if self.turbulenceIntensity is not None:
+			gust = self.turbulence.next(self.TAS*dtime)
+			self.wind = self.meanWind + np.reshape(self.turbulenceIntensity, (-1, 1))*gust
+
+		if mode == 'complete':
+
+			# Force coefficients
+			Cl = self.Cl0 + self.Cla*self.alpha
+			Cd = self.Cd0 + self.K*Cl**2 + self.Cdb*np.abs(self.beta)
+			Cy = self.Cyb*self.beta + self.Cydr*dr + self.Cyda*da + coeffA*(self.Cyp*p+self.Cyr*r)
+
+			# Moment coefficients
+			Cll = self.Cllb*self.beta + self.Cllda*da + self.Clldr*dr + coeffA*(self.Cllp*p + self.Cllr*r)
+			Cmm = self.Cmm0 + self.Cmma*self.alpha + self.Cmmde*de + self.Cmmdr*dr + self.Cmmda*np.abs(da) + coeffB*(self.Cmmq*q)
+			Cnn = self.Cnnb*self.beta + self.Cnnda*da + self.Cnndr*dr + coeffA*(self.Cnnp*p + self.Cnnr*r)
+
+		elif mode == 'longitudinal':
+
+			# Force coefficients
+			Cl = self.Cl0 + self.Cla*self.alpha
+			Cd = self.Cd0 + self.K*Cl**2 + self.Cdb*np.abs(self.beta)
+			Cy = np.zeros(self.size)
+
+			# Moment coefficients
+			Cll = np.zeros(self.size)
+			Cmm = self.Cmm0 + self.Cmma*self.alpha + self.Cmmde*de + coeffB*(self.Cmmq*q)
+			Cnn = np.zeros(self.size)
+
+		# Auxiliary variables
+		qd_times_S = 0.5*self.rho*self.TAS**2*self.S
+		qd_times_S_times_b = qd_times_S*self.b
+		qd_times_S_times_c = qd_times_S*self.c
+
+		# Dynamic forces
+		D = qd_times_S*Cd
+		Y = qd_times_S*Cy
+		L = qd_times_S*Cl
+
+		# Dynamic moments
+		LL = qd_times_S_times_b*Cll
+		MM = qd_times_S_times_c*Cmm
+		NN = qd_times_S_times_b*Cnn
+
+		# Aerodynamic angles trigonometry variables
+		ca = np.cos(self.alpha)
+		sa = np.sin(self.alpha)
+		cb = np.cos(self.beta)
+		sb = np.sin(self.beta)
+
+		# Transform forces to body-axes
+		Xa = -ca*cb*D-ca*sb*Y+sa*L
+		Ya = -sb*D+cb*Y
+		Za = -sa*cb*D-sa*sb*Y-ca*L
+		if self.engineResponseTime is None:
+			self.Xt = self.Tmax*dt
+		else:
+			self.Xt = self.Xt + (1/(60*self.engineResponseTime))*(self.Tmax*dt-self.Xt)
+		self.rotor_rpm = self.Xt*400/self.Tmax
+
+		# State derivatives, same column order as the states
+		aux = self.Ix*self.Iz-self.Ixz**2
+		derivatives = np.empty_like(self.states)
+
+		# Linear accelerations in body-axes
+		derivatives[:, S_VX] = r*vy-q*vz-self.g*sp+(Xa+self.Xt)/self.m
+		derivatives[:, S_VY] = -r*vx+p*vz+self.g*sr*cp+Ya/self.m
+		derivatives[:, S_VZ] = q*vx-p*vy+self.g*cr*cp+Za/self.m
+
+		# Euler rates
+		derivatives[:, S_ROLL] = p+tp*(q*sr+r*cr)
+		derivatives[:, S_PITCH] = q*cr-r*sr
+		derivatives[:, S_YAW] = (q*sr+r*cr)/cp
+
+		# Angular accelerations in body-axes
+		derivatives[:, S_P] = (self.Ixz*(self.Ix-self.Iy+self.Iz)*p*q-(self.Iz*(self.Iz-self.Iy)+self.Ixz**2)*q*r+self.Iz*LL+self.Ixz*NN)/aux
+		derivatives[:, S_Q] = ((self.Iz-self.Ix)*p*r-self.Ixz*(p**2-r**2)+MM)/self.Iy
+		derivatives[:, S_R] = (((self.Ix-self.Iy)*self.Ix+self.Ixz**2)*p*q-self.Ixz*(self.Ix-self.Iy+self.Iz)*q*r+self.Ixz*LL+self.Ix*NN)/aux
+
+		# Linear velocities in NED axes
+		derivatives[:, S_NORTH] = vx*cp*cy+vy*(-cr*sy+sr*sp*cy)+vz*(sr*sy+cr*sp*cy)
+		derivatives[:, S_EAST] = vx*cp*sy+vy*(cr*cy+sr*sp*sy)+vz*(-sr*cy+cr*sp*sy)
+		derivatives[:, S_ALT] = vx*sp-vy*sr*cp-vz*cr*cp
+
+		# Propagate states
+		self.states += derivatives * dtime
+
+		# Transform flat earth position to LLA
+		aux2 = np.sin(self.lat)**2
+		RN = R/np.sqrt(1-aux1*aux2)
+		RM = RN*((1-aux1)/(1-aux1*aux2))
+		self.lon += np.arctan2(1, RN * np.cos(self.lat)) * derivatives[:, S_EAST] * dtime
+		self.lat += np.arctan2(1, RM) * derivatives[:, S_NORTH] * dtime
+
+		# Real velocity
+		self.V = np.sqrt(np.sum(self.states[:, S_VX:S_VZ+1]**2, axis=1))
+
+		# True Airspeed
+		TAS_North = derivatives[:, S_NORTH] - self.wind[:, 0]
+		TAS_East = derivatives[:, S_EAST] - self.wind[:, 1]
+		TAS_Up = derivatives[:, S_ALT] - self.wind[:, 2]
+		self.TAS = np.sqrt(TAS_North**2 + TAS_East**2 + TAS_Up**2)
+		TAS_x = cp*cy*TAS_North + cp*sy*TAS_East - sp*(-TAS_Up)  # Transform from flat-Earth axes to body-axes
+		TAS_y = (sr*sp*cy-cr*sy)*TAS_North + (sr*sp*sy+cr*cy)*TAS_East + sr*cp*(-TAS_Up)
+		TAS_z = (cr*sp*cy+sr*sy)*TAS_North + (cr*sp*sy-sr*cy)*TAS_East + cr*cp*(-TAS_Up)
+
+		# Aerodynamic angles
+		self.alpha = np.arctan2(TAS_z, TAS_x) - self.incidence
+		self.beta = np.arcsin(TAS_y/self.TAS)
+
+		# Accumulate time
+		self.total_time += dtime
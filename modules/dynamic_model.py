@@ -15,10 +15,70 @@ m2ft = 3.28084
 rad2deg = 180/np.pi
 deg2rad = np.pi/180
 
+# Integration methods of Model.propagate
+INTEGRATORS = ['euler', 'rk4', 'rk45']
+
+# Dormand-Prince 5(4) coefficients, the last row of DP_A gives the fifth order solution
+DP_A = [[1/5],
+		[3/40, 9/40],
+		[44/45, -56/15, 32/9],
+		[19372/6561, -25360/2187, 64448/6561, -212/729],
+		[9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+		[35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+DP_E = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])  # Fifth minus fourth order weights
+
+# Dryden turbulence: scale length of the three gust components above 2000 ft (MIL-F-8785C), distance between gust
+# samples and number of samples generated at a time
+TURBULENCE_SCALE = 533.4  # [m]
+TURBULENCE_SPACING = 1.0  # [m]
+TURBULENCE_BLOCK = 4096
+
+
+class Turbulence:
+
+	"""Dryden gusts of one or more aircraft, drawn from their own seedable generator.
+
+	Gusts are a field frozen along the flight path: unit variance first order Gauss-Markov sequences over distance,
+	which is the Dryden spectrum of the longitudinal component and is used for all three components since their scale
+	lengths are equal above 2000 ft. Each aircraft generates TURBULENCE_BLOCK samples at a time and reads them by the
+	distance it travels, so its gusts only depend on the seed and its path.
+	"""
+
+	def __init__(self, size=1, seed=None):
+		self.rng = np.random.default_rng(seed)
+		self.a = np.exp(-TURBULENCE_SPACING/TURBULENCE_SCALE)
+		self.b = np.sqrt(1-self.a**2)
+		self.blocks = np.empty((size, TURBULENCE_BLOCK+1, 3))
+		self.blocks[:, -1] = self.rng.standard_normal((size, 3))  # Stationary initial gust
+		self.distance = np.full(size, float(TURBULENCE_BLOCK))  # Position in the block, in samples
+		self.refill(np.arange(size))
+
+	def refill(self, rows):
+		# Next block of the given aircraft, continuing from the last sample of their current one
+		noise = self.b*self.rng.standard_normal((len(rows), TURBULENCE_BLOCK, 3))
+		blocks = self.blocks[rows]
+		blocks[:, 0] = blocks[:, -1]
+		for i in range(TURBULENCE_BLOCK):
+			blocks[:, i+1] = self.a*blocks[:, i] + noise[:, i]
+		self.blocks[rows] = blocks
+		self.distance[rows] -= TURBULENCE_BLOCK
+
+	def next(self, step):
+		# (size, 3) unit gusts after travelling step meters, a scalar or one per aircraft
+		self.distance += np.asarray(step)/TURBULENCE_SPACING
+		rows = np.flatnonzero(self.distance >= TURBULENCE_BLOCK)
+		while rows.size:
+			self.refill(rows)
+			rows = np.flatnonzero(self.distance >= TURBULENCE_BLOCK)
+		i = self.distance.astype(int)
+		f = (self.distance - i)[:, np.newaxis]
+		aircraft = np.arange(len(i))
+		return (1-f)*self.blocks[aircraft, i] + f*self.blocks[aircraft, i+1]
+
 
 class Model:
 
-	def __init__(self, states=defaultStates, params=defaultParams, aero=defaultAero, controls=defaultControls, wind=defaultWind, turbulenceIntensity=None, servosResponseTime=None, engineResponseTime=None, initVelocity=100):
+	def __init__(self, states=defaultStates, params=defaultParams, aero=defaultAero, controls=defaultControls, wind=defaultWind, turbulenceIntensity=None, servosResponseTime=None, engineResponseTime=None, initVelocity=100, integrator='euler', tolerance=1e-4, turbulenceSeed=None):
 
 		# Set initial parameters
 		self.m = params[0]
@@ -118,10 +178,26 @@ class Model:
 		self.windNorth = self.windVelocity * np.cos(self.windElevation) * np.cos(self.windHeading)
 		self.windEast = self.windVelocity * np.cos(self.windElevation) * np.sin(self.windHeading)
 		self.windUp = self.windVelocity * np.sin(self.windElevation)
+		self.meanWind = (self.windNorth, self.windEast, self.windUp)
+
+		# Set turbulence, with RMS gusts of turbulenceIntensity (m/s) over the mean wind
+		self.turbulence = Turbulence(seed=turbulenceSeed) if turbulenceIntensity != None else None
 
 		# Set true airspeed
 		self.TAS_North = self.TAS_East = self.TAS_Up = self.TAS = self.TAS_x = self.TAS_y = self.TAS_z = 0
 
+		# Set integrator
+		self.setIntegrator(integrator, tolerance)
+
+	def setIntegrator(self, integrator='euler', tolerance=1e-4):
+		# 'rk45' sub-steps each propagation as needed to keep the estimated error of every state below
+		# tolerance * (1 + |state|)
+		if integrator not in INTEGRATORS:
+			raise ValueError('integrator must be one of ' + str(INTEGRATORS))
+		self.integrator = integrator
+		self.tolerance = tolerance
+		self.substep = None
+
 	def propagate(self, controls=defaultControls, dtime=1/60, mode='complete'):
 
 		# Controls
@@ -151,11 +227,15 @@ class Model:
 
 		# Introduce turbulence
 		if self.turbulenceIntensity != None:
-			turb = self.turbulenceIntensity * 10
-			turbulenceCoeff = 1/np.max((np.min((-1.08*self.TAS+120, 0.1)), 100))
-			self.windNorth += turbulenceCoeff*((np.random.rand()*turb-turb/2))
-			self.windEast += turbulenceCoeff*((np.random.rand()*turb-turb/2))
-			self.windUp += turbulenceCoeff*((np.random.rand()*turb-turb/2))
+			gust = self.turbulenceIntensity*self.turbulence.next(self.TAS*dtime)[0]
+			self.windNorth = self.meanWind[0] + gust[0]
+			self.windEast = self.meanWind[1] + gust[1]
+			self.windUp = self.meanWind[2] + gust[2]
+
+		if self.integrator != 'euler':
+			self.integrate(dtime, mode)
+			self.total_time += dtime
+			return
 
 		if mode == 'complete':
 
@@ -272,3 +352,146 @@ class Model:
 
 		# Accumulate time
 		self.total_time += dtime
+
+	def getStateVector(self):
+		return np.array([self.vx, self.vy, self.vz, self.roll, self.pitch, self.yaw, self.p, self.q, self.r, self.posNorth, self.posEast, self.alt])
+
+	def setStateVector(self, x):
+		self.vx, self.vy, self.vz, self.roll, self.pitch, self.yaw, self.p, self.q, self.r, self.posNorth, self.posEast, self.alt = x
+
+	def derivatives(self, x, mode='complete'):
+		# Rates of the state vector x. Unlike the Euler integrator, airspeed and aerodynamic angles are those of x
+		self.setStateVector(x)
+
+		# Euler trigonometry variables
+		cr = np.cos(self.roll)
+		sr = np.sin(self.roll)
+		cp = np.cos(self.pitch)
+		sp = np.sin(self.pitch)
+		tp = np.tan(self.pitch)
+		cy = np.cos(self.yaw)
+		sy = np.sin(self.yaw)
+
+		# Linear velocities in NED axes
+		self.posNorth_dot = self.vx*cp*cy+self.vy*(-cr*sy+sr*sp*cy)+self.vz*(sr*sy+cr*sp*cy)
+		self.posEast_dot = self.vx*cp*sy+self.vy*(cr*cy+sr*sp*sy)+self.vz*(-sr*cy+cr*sp*sy)
+		self.alt_dot = self.vx*sp-self.vy*sr*cp-self.vz*cr*cp
+
+		# Real velocity, true airspeed and aerodynamic angles
+		self.V = np.sqrt(self.vx**2+self.vy**2+self.vz**2)
+		self.TAS_North = self.posNorth_dot - self.windNorth
+		self.TAS_East = self.posEast_dot - self.windEast
+		self.TAS_Up = self.alt_dot - self.windUp
+		self.TAS = np.sqrt(self.TAS_North**2 + self.TAS_East**2 + self.TAS_Up**2)
+		self.TAS_x = cp*cy*self.TAS_North + cp*sy*self.TAS_East - sp*(-self.TAS_Up)  # Transform from flat-Earth axes to body-axes
+		self.TAS_y = (sr*sp*cy-cr*sy)*self.TAS_North + (sr*sp*sy+cr*cy)*self.TAS_East + sr*cp*(-self.TAS_Up)
+		self.TAS_z = (cr*sp*cy+sr*sy)*self.TAS_North + (cr*sp*sy-sr*cy)*self.TAS_East + cr*cp*(-self.TAS_Up)
+		self.alpha = np.arctan2(self.TAS_z, self.TAS_x) - self.incidence
+		self.beta = np.arcsin(self.TAS_y/self.TAS)
+
+		# Auxiliary coefficients
+		coeffA = self.b/(2*self.V)
+		coeffB = self.c/(2*self.V)
+
+		# Force and moment coefficients
+		self.Cl = self.Cl0 + self.Cla * self.alpha
+		self.Cd = self.Cd0 + self.K*self.Cl**2 + self.Cdb*np.abs(self.beta)
+		self.Cmm = self.Cmm0 + self.Cmma*self.alpha + self.Cmmde*self.de + coeffB*(self.Cmmq*self.q)
+		if mode == 'complete':
+			self.Cy = self.Cyb*self.beta + self.Cydr*self.dr + self.Cyda*self.da + coeffA*(self.Cyp*self.p+self.Cyr*self.r)
+			self.Cll = self.Cllb*self.beta + self.Cllda*self.da + self.Clldr*self.dr + coeffA*(self.Cllp*self.p + self.Cllr*self.r)
+			self.Cmm += self.Cmmdr*self.dr + self.Cmmda*np.abs(self.da)
+			self.Cnn = self.Cnnb*self.beta + self.Cnnda*self.da + self.Cnndr*self.dr + coeffA*(self.Cnnp*self.p + self.Cnnr*self.r)
+		elif mode == 'longitudinal':
+			self.Cy = self.Cll = self.Cnn = 0
+
+		# Dynamic forces and moments
+		qd_times_S = 0.5*self.rho*self.TAS**2*self.S
+		self.D = qd_times_S*self.Cd
+		self.Y = qd_times_S*self.Cy
+		self.L = qd_times_S*self.Cl
+		self.LL = qd_times_S*self.b*self.Cll
+		self.MM = qd_times_S*self.c*self.Cmm
+		self.NN = qd_times_S*self.b*self.Cnn
+
+		# Transform forces to body-axes
+		ca = np.cos(self.alpha)
+		sa = np.sin(self.alpha)
+		cb = np.cos(self.beta)
+		sb = np.sin(self.beta)
+		self.Xa = -ca*cb*self.D-ca*sb*self.Y+sa*self.L
+		self.Ya = -sb*self.D+cb*self.Y
+		self.Za = -sa*cb*self.D-sa*sb*self.Y-ca*self.L
+
+		# Linear accelerations in body-axes
+		self.vx_dot = self.r*self.vy-self.q*self.vz-self.g*sp+(self.Xa+self.Xt)/self.m
+		self.vy_dot = -self.r*self.vx+self.p*self.vz+self.g*sr*cp+self.Ya/self.m
+		self.vz_dot = self.q*self.vx-self.p*self.vy+self.g*cr*cp+self.Za/self.m
+
+		# Euler rates
+		self.roll_dot = self.p+tp*(self.q*sr+self.r*cr)
+		self.pitch_dot = self.q*cr-self.r*sr
+		self.yaw_dot = (self.q*sr+self.r*cr)/cp
+
+		# Angular accelerations in body-axes
+		aux = self.Ix*self.Iz-self.Ixz**2
+		self.p_dot = (self.Ixz*(self.Ix-self.Iy+self.Iz)*self.p*self.q-(self.Iz*(self.Iz-self.Iy)+self.Ixz**2)*self.q*self.r+self.Iz*self.LL+self.Ixz*self.NN)/aux
+		self.q_dot = ((self.Iz-self.Ix)*self.p*self.r-self.Ixz*(self.p**2-self.r**2)+self.MM)/self.Iy
+		self.r_dot = (((self.Ix-self.Iy)*self.Ix+self.Ixz**2)*self.p*self.q-self.Ixz*(self.Ix-self.Iy+self.Iz)*self.q*self.r+self.Ixz*self.LL+self.Ix*self.NN)/aux
+
+		return np.array([self.vx_dot, self.vy_dot, self.vz_dot, self.roll_dot, self.pitch_dot, self.yaw_dot,
+						 self.p_dot, self.q_dot, self.r_dot, self.posNorth_dot, self.posEast_dot, self.alt_dot])
+
+	def integrate(self, dtime, mode='complete'):
+		# Advances dtime with the Runge-Kutta integrator. Thrust does not depend on states, so it is updated once
+		if self.engineResponseTime == None:
+			self.Xt = self.Tmax*self.dt
+		else:
+			self.Xt += (1/(60*self.engineResponseTime))*(self.Tmax*self.dt-self.Xt)
+		self.rotor_rpm = self.Xt*400/self.Tmax
+
+		x0 = self.getStateVector()
+		if self.integrator == 'rk4':
+			k1 = self.derivatives(x0, mode)
+			k2 = self.derivatives(x0 + 0.5*dtime*k1, mode)
+			k3 = self.derivatives(x0 + 0.5*dtime*k2, mode)
+			k4 = self.derivatives(x0 + dtime*k3, mode)
+			x = x0 + dtime/6*(k1 + 2*k2 + 2*k3 + k4)
+			self.derivatives(x, mode)  # Airspeed and aerodynamic angles of the accepted states, not of the last stage
+		else:
+			# Dormand-Prince with error control, starting from the substep accepted in the previous call
+			x = x0
+			h = dtime if self.substep is None else min(self.substep, dtime)
+			minimumSubstep = dtime*1e-3
+			elapsed = 0
+			k = [self.derivatives(x, mode)]
+			while elapsed < dtime:
+				h = min(h, dtime - elapsed)
+				for stage in range(1, 7):
+					k.append(self.derivatives(x + h*np.dot(DP_A[stage-1], k[:stage]), mode))
+				candidate = x + h*np.dot(DP_A[5], k[:6])
+				error = h*np.dot(DP_E, k)
+				errorRatio = np.max(np.abs(error)/(self.tolerance*(1 + np.maximum(np.abs(x), np.abs(candidate)))))
+				accepted = errorRatio <= 1 or h <= minimumSubstep or np.isnan(errorRatio)
+				if accepted:
+					x = candidate
+					elapsed = dtime if h >= dtime - elapsed else elapsed + h
+					k = [k[6]]  # Last stage is evaluated at the new states
+				else:
+					k = [k[0]]
+				factor = 0.9*errorRatio**-0.2 if errorRatio > 0 else 5
+				h = max(h*min(5, max(0.2, factor)), minimumSubstep)
+				if accepted and np.isnan(errorRatio):
+					break
+			self.substep = h
+		self.setStateVector(x)
+
+		# Transform flat earth position to LLA
+		aux2 = np.sin(self.lat)**2
+		RN = R/np.sqrt(1-aux1*aux2)
+		RM = RN*((1-aux1)/(1-aux1*aux2))
+		self.lon += np.arctan2(1, RN * np.cos(self.lat)) * (self.posEast - x0[10])
+		self.lat += np.arctan2(1, RM) * (self.posNorth - x0[9])
+
+		# Real velocity
+		self.V = np.sqrt(self.vx**2+self.vy**2+self.vz**2)
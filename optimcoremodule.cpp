@@ -1,5 +1,8 @@
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
 #include <Python.h>
+#include <numpy/arrayobject.h>
 #include "OptimCore/include/dynamicModel.hpp"
+#include <system_error>
 
 #define MODULE_DOC "Evolutionary optimization library for parameter estimation."
 
@@ -7,8 +10,27 @@ typedef struct
 {
     PyObject_HEAD
     Model * ptrObj;
+    PyThread_type_lock lock; // Serializes evaluations, which run with the GIL released
 } PyModel;
 
+static void releaseTrajectoryOwner(PyObject * owner)
+// Drops the reference a Trajectory holds on the Python object owning its samples
+{
+    PyGILState_STATE state = PyGILState_Ensure(); // Trajectories may be released with the GIL released
+    Py_DECREF(owner);
+    PyGILState_Release(state);
+}
+
+static void destroyTrajectoryCapsule(PyObject * capsule)
+{
+    delete (std::shared_ptr<const Trajectory> *)PyCapsule_GetPointer(capsule, NULL);
+}
+
+// Columns of the arrays returned by simulate, in the order of States_t
+#define N_STATE_NAMES (sizeof(States_t) / sizeof(float))
+#define MAX_THREADS 1024
+static const char * stateNames[N_STATE_NAMES] = {"roll", "pitch", "yaw", "p", "q", "r", "posNorth", "posEast", "alt", "vx", "vy", "vz"};
+
 
 static int PyModel_init(PyModel *self, PyObject *args, PyObject *kwds)
 // initialize PyModel Object
@@ -21,6 +43,12 @@ static int PyModel_init(PyModel *self, PyObject *args, PyObject *kwds)
     }
 
     self->ptrObj = new Model(freq);
+    self->lock = PyThread_allocate_lock();
+    if (self->lock == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
 
     return 0;
 }
@@ -29,6 +57,10 @@ static void PyModel_dealloc(PyModel * self)
 // destruct the object
 {
     delete self->ptrObj;
+    if (self->lock != NULL)
+    {
+        PyThread_free_lock(self->lock);
+    }
     Py_TYPE(self)->tp_free(self);
 }
 
@@ -58,11 +90,172 @@ static PyObject * PyModel_loadTrajectory(PyModel* self, PyObject* args)
         return NULL;
     }
 
-    (self->ptrObj)->loadTrajectory((std::string)file, nsamples);
+    bool success;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    success = (self->ptrObj)->loadTrajectory((std::string)file, nsamples);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    if (!success)
+    {
+        PyErr_Format(PyExc_OSError, "Could not read trajectory from %s", file);
+        return NULL;
+    }
+
+    return Py_BuildValue("i", 0);
+}
+
+static std::shared_ptr<const Trajectory> trajectoryFromArray(PyObject * trajectoryObj)
+// Wraps a (17, N) array as a Trajectory, returns NULL with an exception set on failure
+{
+    // A C-contiguous float32 array (including np.memmap) is used in place, anything else is converted once
+    PyArrayObject * trajectory = (PyArrayObject *)PyArray_FROMANY(trajectoryObj, NPY_FLOAT32, 2, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (trajectory == NULL)
+    {
+        return NULL;
+    }
+    if (PyArray_DIM(trajectory, 0) != N_states)
+    {
+        PyErr_Format(PyExc_ValueError, "trajectory must have shape (%d, N)", N_states);
+        Py_DECREF(trajectory);
+        return NULL;
+    }
+
+    // The array stays alive until no model uses the trajectory anymore
+    return Trajectory::wrap((const float *)PyArray_DATA(trajectory), (uint32_t)PyArray_DIM(trajectory, 1),
+                            (uint32_t)PyArray_DIM(trajectory, 1),
+                            [trajectory]() { releaseTrajectoryOwner((PyObject *)trajectory); });
+}
+
+static PyObject * PyModel_setTrajectory(PyModel* self, PyObject* args)
+{
+    PyObject * trajectoryObj;
+
+    if (!PyArg_ParseTuple(args, "O", &trajectoryObj))
+    {
+        return NULL;
+    }
+
+    std::shared_ptr<const Trajectory> shared = trajectoryFromArray(trajectoryObj);
+    if (!shared)
+    {
+        return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->setTrajectory(shared);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("i", 0);
+}
+
+static PyObject * PyModel_addSegment(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"first", "n_samples", "trajectory", NULL};
+    uint32_t first = 0;
+    uint32_t nsamples = 0;
+    PyObject * trajectoryObj = Py_None;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|IIO", (char **)kwlist, &first, &nsamples, &trajectoryObj))
+    {
+        return NULL;
+    }
+
+    // Segments are taken from the trajectory in use unless another (17, N) array is given
+    std::shared_ptr<const Trajectory> shared;
+    if (trajectoryObj != Py_None)
+    {
+        shared = trajectoryFromArray(trajectoryObj);
+        if (!shared)
+        {
+            return NULL;
+        }
+    }
+    bool success;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    success = (self->ptrObj)->addSegment(shared, first, nsamples);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    if (!success)
+    {
+        PyErr_SetString(PyExc_IndexError, "segment starts after the end of the trajectory");
+        return NULL;
+    }
+
+    return Py_BuildValue("I", (self->ptrObj)->getNumberOfSegments());
+}
+
+static PyObject * PyModel_clearSegments(PyModel* self, PyObject* args)
+{
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->clearSegments();
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("i", 0);
+}
+
+static PyObject * PyModel_getNumberOfSegments(PyModel* self, PyObject* args)
+{
+    return Py_BuildValue("I", (self->ptrObj)->getNumberOfSegments());
+}
+
+static PyObject * PyModel_shareTrajectory(PyModel* self, PyObject* args)
+{
+    PyObject * otherObj;
+
+    if (!PyArg_ParseTuple(args, "O!", Py_TYPE(self), &otherObj))
+    {
+        return NULL;
+    }
+
+    // Both models read the same samples, whichever way the other one got them
+    PyModel * other = (PyModel *)otherObj;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(other->lock, WAIT_LOCK);
+    std::shared_ptr<const Trajectory> shared = (other->ptrObj)->getTrajectory();
+    PyThread_release_lock(other->lock);
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->setTrajectory(shared);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
 
     return Py_BuildValue("i", 0);
 }
 
+static PyObject * PyModel_getTrajectory(PyModel* self, PyObject* args)
+{
+    std::shared_ptr<const Trajectory> shared = (self->ptrObj)->getTrajectory();
+    if (!shared)
+    {
+        npy_intp dims[2] = {N_states, 0};
+        return PyArray_ZEROS(2, dims, NPY_FLOAT32, 0);
+    }
+
+    // Read-only (17, N) view of the trajectory in use, which keeps the samples alive
+    npy_intp dims[2] = {N_states, (npy_intp)(self->ptrObj)->getNumberOfSamples()};
+    npy_intp strides[2] = {(npy_intp)(shared->stride() * sizeof(float)), (npy_intp)sizeof(float)};
+    PyObject * trajectory = PyArray_New(&PyArray_Type, 2, dims, NPY_FLOAT32, strides, (void *)shared->data(),
+                                        0, 0, NULL);
+    if (trajectory == NULL)
+    {
+        return NULL;
+    }
+    PyObject * owner = PyCapsule_New(new std::shared_ptr<const Trajectory>(shared), NULL, destroyTrajectoryCapsule);
+    if ((owner == NULL) || (PyArray_SetBaseObject((PyArrayObject *)trajectory, owner) < 0))
+    {
+        Py_DECREF(trajectory);
+        return NULL;
+    }
+
+    return trajectory;
+}
+
 static PyObject * PyModel_getTrajectorySample(PyModel* self, PyObject* args)
 {
     uint32_t idx;
@@ -73,13 +266,125 @@ static PyObject * PyModel_getTrajectorySample(PyModel* self, PyObject* args)
     }
 
     float states[17];
-    (self->ptrObj)->getTrajectorySample(states, idx);
+    if (!(self->ptrObj)->getTrajectorySample(states, idx))
+    {
+        PyErr_SetString(PyExc_IndexError, "trajectory sample out of range");
+        return NULL;
+    }
 
     return Py_BuildValue("fffffffffffffffff", states[0], states[1], states[2], states[3], states[4], states[5],
                                               states[6], states[7], states[8], states[9], states[10], states[11],
                                               states[12], states[13], states[14], states[15], states[16]);
 }
 
+static PyObject * PyModel_simulate(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"controls", "record", NULL};
+    PyObject * controlsObj = Py_None;
+    PyObject * recordObj = Py_None;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OO", (char **)kwlist, &controlsObj, &recordObj))
+    {
+        return NULL;
+    }
+
+    // (4, N) da, de, dr, dt, or the controls of the loaded trajectory if None
+    PyArrayObject * controls = NULL;
+    const float * controlsData = NULL;
+    uint32_t N_steps = (self->ptrObj)->getNumberOfSamples();
+    if (controlsObj != Py_None)
+    {
+        controls = (PyArrayObject *)PyArray_FROMANY(controlsObj, NPY_FLOAT32, 2, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+        if (controls == NULL)
+        {
+            return NULL;
+        }
+        if (PyArray_DIM(controls, 0) != 4)
+        {
+            PyErr_SetString(PyExc_ValueError, "controls must have shape (4, N)");
+            Py_DECREF(controls);
+            return NULL;
+        }
+        controlsData = (const float *)PyArray_DATA(controls);
+        N_steps = (uint32_t)PyArray_DIM(controls, 1);
+    }
+
+    // Recorded states, every one of them in the order of optimcore.STATES by default
+    std::vector<uint32_t> columns;
+    if (recordObj == Py_None)
+    {
+        for (uint32_t j = 0 ; j < N_STATE_NAMES ; j++)
+        {
+            columns.push_back(j);
+        }
+    }
+    else
+    {
+        PyObject * record = PySequence_Fast(recordObj, "record must be a sequence of state names");
+        if (record == NULL)
+        {
+            Py_XDECREF(controls);
+            return NULL;
+        }
+        for (Py_ssize_t k = 0 ; k < PySequence_Fast_GET_SIZE(record) ; k++)
+        {
+            const char * name = PyUnicode_AsUTF8(PySequence_Fast_GET_ITEM(record, k));
+            uint32_t j = 0;
+            while ((name != NULL) && (j < N_STATE_NAMES) && (strcmp(name, stateNames[j]) != 0))
+            {
+                j++;
+            }
+            if ((name == NULL) || (j == N_STATE_NAMES))
+            {
+                if (name != NULL)
+                {
+                    PyErr_Format(PyExc_ValueError, "unknown state '%s'", name);
+                }
+                Py_DECREF(record);
+                Py_XDECREF(controls);
+                return NULL;
+            }
+            columns.push_back(j);
+        }
+        Py_DECREF(record);
+    }
+
+    npy_intp dims[2] = {(npy_intp)N_steps + 1, (npy_intp)columns.size()};
+    PyObject * result = PyArray_SimpleNew(2, dims, NPY_FLOAT32);
+    if (result == NULL)
+    {
+        Py_XDECREF(controls);
+        return NULL;
+    }
+    float * output = (float *)PyArray_DATA((PyArrayObject *)result);
+
+    // Full records are written straight into the result, selected columns go through a temporary history
+    std::vector<States_t> history;
+    bool fullRecord = (recordObj == Py_None);
+    if (!fullRecord)
+    {
+        history.resize(N_steps + 1);
+    }
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->simulate(controlsData, N_steps, N_steps, fullRecord ? (States_t *)output : history.data());
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+    if (!fullRecord)
+    {
+        for (uint32_t i = 0 ; i <= N_steps ; i++)
+        {
+            for (size_t k = 0 ; k < columns.size() ; k++)
+            {
+                output[i * columns.size() + k] = ((const float *)&history[i])[columns[k]];
+            }
+        }
+    }
+
+    Py_XDECREF(controls);
+    return result;
+}
+
 static PyObject * PyModel_evaluate(PyModel* self, PyObject* args)
 {
     float coefs[26];
@@ -101,11 +406,395 @@ static PyObject * PyModel_evaluate(PyModel* self, PyObject* args)
                          coefs[12], coefs[13], coefs[14], coefs[15], coefs[16], coefs[17],
                          coefs[18], coefs[19], coefs[20], coefs[21], coefs[22], coefs[23],
                          coefs[24], coefs[25]};
-    float retval = (self->ptrObj)->evaluate(aero, useLinVels, numberOfSamplesToUse);
+    float retval;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    retval = (self->ptrObj)->evaluate(aero, useLinVels, numberOfSamplesToUse);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
 
     return Py_BuildValue("f", retval);
 }
 
+static PyObject * PyModel_evaluate_bounded(PyModel* self, PyObject* args)
+{
+    float coefs[26];
+    int useLinVels;
+    int32_t numberOfSamplesToUse;
+    float abortAbove;
+
+    if (!PyArg_ParseTuple(args, "ffffffffffffffffffffffffffpif",
+                          &coefs[0], &coefs[1], &coefs[2], &coefs[3], &coefs[4], &coefs[5],
+                          &coefs[6], &coefs[7], &coefs[8], &coefs[9], &coefs[10], &coefs[11],
+                          &coefs[12], &coefs[13], &coefs[14], &coefs[15], &coefs[16], &coefs[17],
+                          &coefs[18], &coefs[19], &coefs[20], &coefs[21], &coefs[22], &coefs[23],
+                          &coefs[24], &coefs[25], &useLinVels, &numberOfSamplesToUse, &abortAbove))
+    {
+        return NULL;
+    }
+
+    AeroCoeffs_t aero;
+    memcpy(&aero, coefs, sizeof(AeroCoeffs_t));
+    float retval;
+    uint32_t samplesUsed;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    retval = (self->ptrObj)->evaluate(aero, useLinVels, numberOfSamplesToUse, abortAbove, &samplesUsed);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("fI", retval, samplesUsed);
+}
+
+static PyObject * PyModel_evaluate_with_gradient(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"coeffs", "use_lin_vels", "n_samples", NULL};
+    PyObject * coeffsObj;
+    int useLinVels;
+    int32_t numberOfSamplesToUse;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "Opi", (char **)kwlist, &coeffsObj, &useLinVels, &numberOfSamplesToUse))
+    {
+        return NULL;
+    }
+
+    PyArrayObject * coeffs = (PyArrayObject *)PyArray_FROMANY(coeffsObj, NPY_FLOAT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (coeffs == NULL)
+    {
+        return NULL;
+    }
+    if (PyArray_DIM(coeffs, 0) != N_aero)
+    {
+        PyErr_Format(PyExc_ValueError, "coeffs must have shape (%d,)", N_aero);
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    npy_intp N_gradient = N_aero;
+    PyArrayObject * gradient = (PyArrayObject *)PyArray_SimpleNew(1, &N_gradient, NPY_FLOAT32);
+    if (gradient == NULL)
+    {
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    // Fitness and its derivatives with respect to the 26 coefficients in a single integration
+    AeroCoeffs_t aero;
+    memcpy(&aero, PyArray_DATA(coeffs), sizeof(aero));
+    Py_DECREF(coeffs);
+    float fitness;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    fitness = (self->ptrObj)->evaluateWithGradient(aero, useLinVels, numberOfSamplesToUse, (float *)PyArray_DATA(gradient));
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("fN", fitness, gradient);
+}
+
+static PyObject * PyModel_evaluate_batch(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"coeffs", "use_lin_vels", "n_samples", "abort_above", "steps", NULL};
+    PyObject * coeffsObj;
+    int useLinVels;
+    int32_t numberOfSamplesToUse;
+    float abortAbove = INFINITY;
+    PyObject * stepsObj = Py_None;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "Opi|fO", (char **)kwlist, &coeffsObj, &useLinVels,
+                                     &numberOfSamplesToUse, &abortAbove, &stepsObj))
+    {
+        return NULL;
+    }
+
+    // Candidates are stored row by row as a contiguous [N, 26] float buffer
+    PyArrayObject * coeffs = (PyArrayObject *)PyArray_FROMANY(coeffsObj, NPY_FLOAT32, 2, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (coeffs == NULL)
+    {
+        return NULL;
+    }
+    if (PyArray_DIM(coeffs, 1) != N_aero)
+    {
+        PyErr_Format(PyExc_ValueError, "coeffs must have shape (N, %d)", N_aero);
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    npy_intp N_candidates = PyArray_DIM(coeffs, 0);
+
+    // Optional output array receiving the number of samples integrated for each candidate
+    uint32_t * samplesUsed = NULL;
+    if (stepsObj != Py_None)
+    {
+        PyArrayObject * steps = (PyArrayObject *)stepsObj;
+        if (!PyArray_Check(stepsObj) || PyArray_TYPE(steps) != NPY_UINT32 || !PyArray_IS_C_CONTIGUOUS(steps) ||
+            !PyArray_ISWRITEABLE(steps) || PyArray_SIZE(steps) != N_candidates)
+        {
+            PyErr_SetString(PyExc_ValueError, "steps must be a writeable contiguous uint32 array with one element per candidate");
+            Py_DECREF(coeffs);
+            return NULL;
+        }
+        samplesUsed = (uint32_t *)PyArray_DATA(steps);
+    }
+
+    PyArrayObject * fitness = (PyArrayObject *)PyArray_SimpleNew(1, &N_candidates, NPY_FLOAT32);
+    if (fitness == NULL)
+    {
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    // Candidates are spread over the thread pool of the model while other Python threads keep running
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->evaluateBatch((const float *)PyArray_DATA(coeffs), (uint32_t)N_candidates, useLinVels,
+                                  numberOfSamplesToUse, (float *)PyArray_DATA(fitness), abortAbove, samplesUsed);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+    Py_DECREF(coeffs);
+
+    return (PyObject *)fitness;
+}
+
+static PyObject * PyModel_sweep_grid(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"coeffs", "param_indices", "ranges", "resolution", "use_lin_vels", "n_samples", NULL};
+    PyObject * coeffsObj;
+    PyObject * indicesObj;
+    PyObject * rangesObj;
+    PyObject * resolutionObj;
+    int useLinVels = 0;
+    int32_t numberOfSamplesToUse = -1;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OOOO|pi", (char **)kwlist, &coeffsObj, &indicesObj, &rangesObj,
+                                     &resolutionObj, &useLinVels, &numberOfSamplesToUse))
+    {
+        return NULL;
+    }
+
+    // Base coefficients, indices of the swept ones, their (lower, upper) bounds and number of values of each
+    PyArrayObject * coeffs = (PyArrayObject *)PyArray_FROMANY(coeffsObj, NPY_FLOAT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    PyArrayObject * indices = (PyArrayObject *)PyArray_FROMANY(indicesObj, NPY_INT64, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    PyArrayObject * ranges = (PyArrayObject *)PyArray_FROMANY(rangesObj, NPY_FLOAT32, 2, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    PyArrayObject * resolutionArray = (PyArrayObject *)PyArray_FROMANY(resolutionObj, NPY_INT64, 0, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    PyObject * result = NULL;
+    uint32_t N_params = 0;
+    if ((coeffs == NULL) || (indices == NULL) || (ranges == NULL) || (resolutionArray == NULL))
+    {
+        goto done;
+    }
+    N_params = (uint32_t)PyArray_DIM(indices, 0);
+    if (PyArray_DIM(coeffs, 0) != N_aero)
+    {
+        PyErr_Format(PyExc_ValueError, "coeffs must have shape (%d,)", N_aero);
+        goto done;
+    }
+    if ((N_params == 0) || (N_params > N_aero) || (PyArray_DIM(ranges, 0) != N_params) || (PyArray_DIM(ranges, 1) != 2))
+    {
+        PyErr_SetString(PyExc_ValueError, "ranges must have one (lower, upper) pair per parameter index");
+        goto done;
+    }
+    if ((PyArray_NDIM(resolutionArray) == 1) && (PyArray_DIM(resolutionArray, 0) != N_params))
+    {
+        PyErr_SetString(PyExc_ValueError, "resolution must be an integer or have one value per parameter index");
+        goto done;
+    }
+
+    {
+        uint32_t paramIndices[N_aero];
+        uint32_t resolution[N_aero];
+        float lower[N_aero];
+        float upper[N_aero];
+        npy_intp dims[N_aero];
+        for (uint32_t j = 0 ; j < N_params ; j++)
+        {
+            int64_t index = ((int64_t *)PyArray_DATA(indices))[j];
+            int64_t values = ((int64_t *)PyArray_DATA(resolutionArray))[(PyArray_NDIM(resolutionArray) == 1) ? j : 0];
+            if ((index < 0) || (index >= N_aero) || (values < 1))
+            {
+                PyErr_Format(PyExc_ValueError, "parameter indices must be in [0, %d) and resolution positive", N_aero);
+                goto done;
+            }
+            paramIndices[j] = (uint32_t)index;
+            resolution[j] = (uint32_t)values;
+            lower[j] = ((float *)PyArray_DATA(ranges))[2 * j];
+            upper[j] = ((float *)PyArray_DATA(ranges))[2 * j + 1];
+            dims[j] = values;
+        }
+
+        // One fitness value per grid point, shaped as the grid
+        result = PyArray_SimpleNew(N_params, dims, NPY_FLOAT32);
+        if (result == NULL)
+        {
+            goto done;
+        }
+        AeroCoeffs_t aero;
+        memcpy(&aero, PyArray_DATA(coeffs), sizeof(aero));
+        Py_BEGIN_ALLOW_THREADS
+        PyThread_acquire_lock(self->lock, WAIT_LOCK);
+        (self->ptrObj)->sweepGrid(aero, paramIndices, lower, upper, resolution, N_params, useLinVels,
+                                  numberOfSamplesToUse, (float *)PyArray_DATA((PyArrayObject *)result));
+        PyThread_release_lock(self->lock);
+        Py_END_ALLOW_THREADS
+    }
+
+done:
+    Py_XDECREF(coeffs);
+    Py_XDECREF(indices);
+    Py_XDECREF(ranges);
+    Py_XDECREF(resolutionArray);
+    return result;
+}
+
+static PyObject * PyModel_evaluate_segments(PyModel* self, PyObject* args, PyObject* kwds)
+{
+    static const char * kwlist[] = {"coeffs", "use_lin_vels", NULL};
+    PyObject * coeffsObj;
+    int useLinVels;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "Op", (char **)kwlist, &coeffsObj, &useLinVels))
+    {
+        return NULL;
+    }
+
+    PyArrayObject * coeffs = (PyArrayObject *)PyArray_FROMANY(coeffsObj, NPY_FLOAT32, 2, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (coeffs == NULL)
+    {
+        return NULL;
+    }
+    if (PyArray_DIM(coeffs, 1) != N_aero)
+    {
+        PyErr_Format(PyExc_ValueError, "coeffs must have shape (N, %d)", N_aero);
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    npy_intp N_candidates = PyArray_DIM(coeffs, 0);
+    PyArrayObject * fitness = (PyArrayObject *)PyArray_SimpleNew(1, &N_candidates, NPY_FLOAT32);
+    if (fitness == NULL)
+    {
+        Py_DECREF(coeffs);
+        return NULL;
+    }
+
+    // Every segment of every candidate is spread over the thread pool of the model
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->evaluateSegmentsBatch((const float *)PyArray_DATA(coeffs), (uint32_t)N_candidates, useLinVels,
+                                          (float *)PyArray_DATA(fitness));
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+    Py_DECREF(coeffs);
+
+    return (PyObject *)fitness;
+}
+
+static PyObject * PyModel_setIntegrator(PyModel* self, PyObject* args)
+{
+    int integrator;
+    float tolerance = 1e-4F;
+
+    if (!PyArg_ParseTuple(args, "i|f", &integrator, &tolerance))
+    {
+        return NULL;
+    }
+    if ((integrator < INTEGRATOR_TRAPEZOIDAL) || (integrator > INTEGRATOR_RK45))
+    {
+        PyErr_SetString(PyExc_ValueError, "integrator must be INTEGRATOR_TRAPEZOIDAL, INTEGRATOR_RK4 or INTEGRATOR_RK45");
+        return NULL;
+    }
+    if (!(tolerance > 0.0F))
+    {
+        PyErr_SetString(PyExc_ValueError, "tolerance must be positive");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->setIntegrator((Integrator_t)integrator, tolerance);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("i", 0);
+}
+
+static PyObject * PyModel_getIntegrator(PyModel* self, PyObject* args)
+{
+    return Py_BuildValue("i", (int)(self->ptrObj)->getIntegrator());
+}
+
+static PyObject * PyModel_getTolerance(PyModel* self, PyObject* args)
+{
+    return Py_BuildValue("f", (self->ptrObj)->getTolerance());
+}
+
+static PyObject * PyModel_getFrequency(PyModel* self, PyObject* args)
+{
+    return Py_BuildValue("f", (self->ptrObj)->getFrequency());
+}
+
+static PyObject * PyModel_setThreads(PyModel* self, PyObject* args)
+{
+    int nthreads;
+    bool failed = false;
+
+    if (!PyArg_ParseTuple(args, "i", &nthreads))
+    {
+        return NULL;
+    }
+    if (nthreads < 0 || nthreads > MAX_THREADS)
+    {
+        PyErr_Format(PyExc_ValueError, "number of threads must be between 0 (all cores) and %d", MAX_THREADS);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    try
+    {
+        (self->ptrObj)->setNumberOfThreads((uint32_t)nthreads); // 0 uses every available core
+    }
+    catch (const std::system_error &)
+    {
+        failed = true; // The model keeps its previous threads
+    }
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    if (failed)
+    {
+        PyErr_Format(PyExc_RuntimeError, "could not start %d threads", nthreads);
+        return NULL;
+    }
+
+    return Py_BuildValue("I", (self->ptrObj)->getNumberOfThreads());
+}
+
+static PyObject * PyModel_setTurbulence(PyModel* self, PyObject* args)
+{
+    float intensity;
+    unsigned long long seed = 0;
+
+    if (!PyArg_ParseTuple(args, "f|K", &intensity, &seed))
+    {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    (self->ptrObj)->setTurbulence(intensity, (uint64_t)seed);
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
+
+    Py_RETURN_NONE;
+}
+
+static PyObject * PyModel_getTurbulence(PyModel* self, PyObject* args)
+{
+    const Turbulence & turbulence = (self->ptrObj)->getTurbulence();
+    return Py_BuildValue("fK", turbulence.getIntensity(), (unsigned long long)turbulence.getSeed());
+}
+
 static PyObject * PyModel_getStates(PyModel* self, PyObject* args)
 {
     States_t states;
@@ -130,8 +819,8 @@ static PyObject * PyModel_getInternals(PyModel* self, PyObject* args)
     Internals_t internals;
     (self->ptrObj)->getInternals(&internals);
 
-    return Py_BuildValue("ffffff", internals.lat, internals.lon, internals.rotor_rpm,
-                                   internals.V, internals.alpha, internals.beta);
+    return Py_BuildValue("fffffff", internals.lat, internals.lon, internals.rotor_rpm,
+                                    internals.V, internals.alpha, internals.beta, internals.TAS);
 }
 
 static PyObject * PyModel_getAeroCoeffs(PyModel* self, PyObject* args)
@@ -249,11 +938,30 @@ static PyMethodDef PyModel_methods[] =
 {
     {"propagate", (PyCFunction)PyModel_propagate, METH_VARARGS, "Propagates model"},
     {"loadTrajectory", (PyCFunction)PyModel_loadTrajectory, METH_VARARGS, "Loads trajectory"},
+    {"setTrajectory", (PyCFunction)PyModel_setTrajectory, METH_VARARGS, "Uses a (17, N) float32 array as trajectory without copying it"},
+    {"shareTrajectory", (PyCFunction)PyModel_shareTrajectory, METH_VARARGS, "Uses the trajectory of another Model without copying it"},
+    {"getTrajectory", (PyCFunction)PyModel_getTrajectory, METH_VARARGS, "Gets a read-only (17, N) view of the trajectory"},
     {"getTrajectorySample", (PyCFunction)PyModel_getTrajectorySample, METH_VARARGS, "Gets trajectory sample"},
+    {"simulate", (PyCFunction)PyModel_simulate, METH_VARARGS | METH_KEYWORDS, "Propagate through (4, N) controls, or those of the trajectory, returning the (N + 1, states) history"},
     {"evaluate", (PyCFunction)PyModel_evaluate, METH_VARARGS, "Evaluate"},
+    {"evaluate_bounded", (PyCFunction)PyModel_evaluate_bounded, METH_VARARGS, "Evaluate, stopping once fitness exceeds abort_above. Returns (fitness, steps)"},
+    {"evaluate_with_gradient", (PyCFunction)PyModel_evaluate_with_gradient, METH_VARARGS | METH_KEYWORDS, "Evaluate, also returning the gradient of fitness with respect to the 26 coefficients"},
+    {"evaluate_batch", (PyCFunction)PyModel_evaluate_batch, METH_VARARGS | METH_KEYWORDS, "Evaluate a population given as an (N, 26) array"},
+    {"addSegment", (PyCFunction)PyModel_addSegment, METH_VARARGS | METH_KEYWORDS, "Registers samples [first, first + n_samples) of a trajectory as a segment"},
+    {"clearSegments", (PyCFunction)PyModel_clearSegments, METH_VARARGS, "Removes every segment"},
+    {"getNumberOfSegments", (PyCFunction)PyModel_getNumberOfSegments, METH_VARARGS, "Gets number of segments"},
+    {"sweep_grid", (PyCFunction)PyModel_sweep_grid, METH_VARARGS | METH_KEYWORDS, "Evaluate a regular grid over some coefficients, returned as an array shaped as the grid"},
+    {"evaluate_segments", (PyCFunction)PyModel_evaluate_segments, METH_VARARGS | METH_KEYWORDS, "Evaluate an (N, 26) population over every segment, weighted by length"},
+    {"setIntegrator", (PyCFunction)PyModel_setIntegrator, METH_VARARGS, "Set integration method (INTEGRATOR_*) and, for INTEGRATOR_RK45, its tolerance"},
+    {"getIntegrator", (PyCFunction)PyModel_getIntegrator, METH_VARARGS, "Get integration method"},
+    {"getTolerance", (PyCFunction)PyModel_getTolerance, METH_VARARGS, "Get tolerance of INTEGRATOR_RK45"},
+    {"getFrequency", (PyCFunction)PyModel_getFrequency, METH_VARARGS, "Get propagation frequency (Hz)"},
+    {"setThreads", (PyCFunction)PyModel_setThreads, METH_VARARGS, "Set number of threads used by evaluate_batch (0 = all cores)"},
+    {"setTurbulence", (PyCFunction)PyModel_setTurbulence, METH_VARARGS, "Set RMS gust velocity (m/s, 0 disables turbulence) and seed of the Dryden turbulence"},
+    {"getTurbulence", (PyCFunction)PyModel_getTurbulence, METH_VARARGS, "Get turbulence intensity and seed"},
     {"getStates", (PyCFunction)PyModel_getStates, METH_VARARGS, "Get states"},
     {"getControls", (PyCFunction)PyModel_getControls, METH_VARARGS, "Get controls"},
-    {"getInternals", (PyCFunction)PyModel_getInternals, METH_VARARGS, "Get internals"},
+    {"getInternals", (PyCFunction)PyModel_getInternals, METH_VARARGS, "Get internals: lat, lon, rotor_rpm, V, alpha, beta, TAS"},
     {"getAeroCoeffs", (PyCFunction)PyModel_getAeroCoeffs, METH_VARARGS, "Get aerodynamic coefficients"},
     {"setStates", (PyCFunction)PyModel_setStates, METH_VARARGS, "Set states"},
     {"setControls", (PyCFunction)PyModel_setControls, METH_VARARGS, "Set controls"},
@@ -283,6 +991,8 @@ PyMODINIT_FUNC PyInit_optimcore(void)
 {
     PyObject* m;
 
+    import_array();
+
     PyModelType.tp_new = PyType_GenericNew;
     PyModelType.tp_basicsize = sizeof(PyModel);
     PyModelType.tp_dealloc = (destructor) PyModel_dealloc;
@@ -305,5 +1015,14 @@ PyMODINIT_FUNC PyInit_optimcore(void)
 
     Py_INCREF(&PyModelType);
     PyModule_AddObject(m, "Model", (PyObject *)&PyModelType); // Add Model object to the module
+    PyModule_AddIntConstant(m, "INTEGRATOR_TRAPEZOIDAL", INTEGRATOR_TRAPEZOIDAL);
+    PyModule_AddIntConstant(m, "INTEGRATOR_RK4", INTEGRATOR_RK4);
+    PyModule_AddIntConstant(m, "INTEGRATOR_RK45", INTEGRATOR_RK45);
+    PyObject * states = PyTuple_New(N_STATE_NAMES);
+    for (uint32_t j = 0 ; j < N_STATE_NAMES ; j++)
+    {
+        PyTuple_SET_ITEM(states, j, PyUnicode_FromString(stateNames[j]));
+    }
+    PyModule_AddObject(m, "STATES", states); // Column names of simulate
     return m;
 }
\ No newline at end of file
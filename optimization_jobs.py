@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import queue
+import uuid
+import os
+from optimize_cpp_cmaes import Optimizer, OptimizationCancelled
+
+class JobManager():
+    # Runs Optimizer.optimize in a process pool, so that long identifications do not block the caller.
+    # Each job streams its best fitness and step size after every generation and can be cancelled
+
+    def __init__(self, processes=2):
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(max_workers=processes)
+        self.manager = multiprocessing.Manager()
+        self.jobs = {}
+
+    def submit(self, trajFile='', nsamples=0, mode='single', trajectory=None):
+        # The trajectory is read from trajFile, or taken from a (17, N) array if given
+        jobId = uuid.uuid4().hex
+        job = {'progress': self.manager.Queue(), 'cancel': self.manager.Event(),
+               'generation': [], 'useLinVels': [], 'fitness': [], 'sigma': []}
+        # Jobs share the cores, instead of every model using all of them
+        threads = max(1, (os.cpu_count() or 1) // self.processes)
+        job['future'] = self.pool.submit(runJob, trajFile, nsamples, trajectory, mode, threads, job['progress'], job['cancel'])
+        self.jobs[jobId] = job
+        return jobId
+
+    def cancel(self, jobId):
+        job = self.jobs.get(jobId)
+        if job is not None:
+            job['cancel'].set()
+            job['future'].cancel() # Only succeeds while it is still queued
+
+    def status(self, jobId):
+        job = self.jobs.get(jobId)
+        if job is None:
+            return 'unknown'
+        future = job['future']
+        if future.cancelled():
+            return 'cancelled'
+        if not future.done():
+            return 'running' if future.running() else 'queued'
+        if isinstance(future.exception(), OptimizationCancelled):
+            return 'cancelled'
+        if future.exception() is not None:
+            return 'failed'
+        return 'done'
+
+    def progress(self, jobId):
+        # Generations reported since the job started, as lists of generation, phase, best fitness and sigma
+        job = self.jobs.get(jobId)
+        if job is None:
+            return None
+        while True:
+            try:
+                generation, useLinVels, fitness, sigma = job['progress'].get_nowait()
+            except queue.Empty:
+                break
+            job['generation'].append(generation)
+            job['useLinVels'].append(useLinVels)
+            job['fitness'].append(fitness)
+            job['sigma'].append(sigma)
+        return {'status': self.status(jobId), 'generation': job['generation'], 'useLinVels': job['useLinVels'],
+                'fitness': job['fitness'], 'sigma': job['sigma']}
+
+    def result(self, jobId):
+        # Solution and reference trajectories of a finished job, as returned by Optimizer.optimize
+        if self.status(jobId) != 'done':
+            return None
+        return self.jobs[jobId]['future'].result()
+
+    def remove(self, jobId):
+        self.cancel(jobId)
+        self.jobs.pop(jobId, None)
+
+    def shutdown(self):
+        for jobId in list(self.jobs):
+            self.cancel(jobId)
+        self.pool.shutdown(wait=True)
+        self.manager.shutdown()
+
+def runJob(trajFile, nsamples, trajectory, mode, threads, progress, cancel):
+    optimizer = Optimizer(threads)
+    if trajectory is not None:
+        optimizer.setTrajectory(trajectory)
+    else:
+        optimizer.loadTrajectory(trajFile, nsamples)
+
+    def report(es):
+        progress.put((es.countiter, optimizer.useLinVels, float(es.result[1]), float(es.sigma)))
+        return cancel.is_set()
+
+    optimizer.callback = report
+    return optimizer.optimize(mode)
@@ -2,6 +2,8 @@ import optimcore as optim
 from scipy import optimize as opt
 import numpy as np
 import pandas as pd
+from utils.fitness_cache import FitnessCache, modelSettings
+from utils.trajectory_io import contentHash
 
 GRADIENT = 0
 DIFFERENTIAL = 1
@@ -9,15 +11,39 @@ DUAL_ANNEALING = 2
 SHGO = 3
 BASIN_HOPPING = 4
 
-model = optim.Model()
-model.loadTrajectory()
+frequency = 60.0
+trajFile = 'data.csv'
+useLinVels = True
+
+model = optim.Model(frequency)
+model.loadTrajectory(trajFile, 0)
+
+# Fitness values already computed for this trajectory and model settings, kept across runs
+cache = FitnessCache('fitness_cache.sqlite', quantization=1e-7)
+cacheContext = (contentHash(model.getTrajectory()), useLinVels, -1) + modelSettings(model)
 
 optimizer = DIFFERENTIAL
 
 def fitness(aero):
+    return cache.evaluate(evaluate, aero, cacheContext)
+
+def fitnessPopulation(population):
+    # differential_evolution with vectorized=True passes the whole population as the columns of population. It is
+    # scored in this process by the threads of the model, so that every value reaches the cache
+    return cache.evaluateBatch(evaluateBatch, np.asarray(population).T, cacheContext)
+
+def evaluateBatch(solutions):
+    return model.evaluate_batch(np.ascontiguousarray(solutions), useLinVels, -1)
+
+def evaluate(aero):
     return model.evaluate(aero[0], aero[1], aero[2], aero[3], aero[4], aero[5], aero[6], aero[7], aero[8], aero[9],
                           aero[10], aero[11], aero[12], aero[13], aero[14], aero[15], aero[16], aero[17], aero[18], aero[19],
-                          aero[20], aero[21], aero[22], aero[23], aero[24], aero[25])
+                          aero[20], aero[21], aero[22], aero[23], aero[24], aero[25], useLinVels, -1)
+
+def fitnessAndGradient(aero):
+    # Fitness and its gradient from a single integration, instead of finite differences
+    fitness, gradient = model.evaluate_with_gradient(aero, useLinVels, -1)
+    return fitness, gradient.astype(np.float64)
 
 def callback(xk, convergence):
     # xk is the current value of x0. convergence represents the fractional value of the population convergence.
@@ -25,32 +51,14 @@ def callback(xk, convergence):
     # is halted (any polishing is still carried out).
     pass
 
-period = 1.0 / 60.0 
 def getTrajectory(aero):
-    vismodel = optim.Model()
-    vismodel.loadTrajectory()
+    vismodel = optim.Model(frequency)
+    vismodel.shareTrajectory(model)
     vismodel.setAeroCoeffs(aero[0], aero[1], aero[2], aero[3], aero[4], aero[5], aero[6], aero[7], aero[8],
                            aero[9], aero[10], aero[11], aero[12], aero[13], aero[14], aero[15], aero[16], aero[17],
                            aero[18], aero[19], aero[20], aero[21], aero[22], aero[23], aero[24], aero[25])
-    posNorth = []
-    posEast = []
-    posDown = []
-    states = vismodel.getStates()
-    posNorth.append(states[0])
-    posEast.append(states[1])
-    posDown.append(-states[2])
-    for idx in range(1200):
-        traj = vismodel.getTrajectorySample(idx)
-        da = traj[1]
-        de = traj[2]
-        dr = traj[3]
-        dt = traj[4]
-        vismodel.propagate(da, de, dr, dt, period)
-        states = vismodel.getStates()
-        posNorth.append(states[0])
-        posEast.append(states[1])
-        posDown.append(-states[2])
-    return pd.DataFrame({'north': posNorth, 'east': posEast, 'down': posDown})
+    states = vismodel.simulate(record=('posNorth', 'posEast', 'alt'))
+    return pd.DataFrame({'north': states[:, 0], 'east': states[:, 1], 'down': -states[:, 2]})
 
 def optimize():
     defaultAero = [0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265]
@@ -66,9 +74,9 @@ def optimize():
     # print((lower < upper))
 
     if optimizer == GRADIENT:
-        result = opt.minimize(fun=fitness, x0=x0, args=(), method='SLSQP', bounds=bounds, tol=1e-2, options={'maxiter': 3000})
+        result = opt.minimize(fun=fitnessAndGradient, x0=x0, args=(), method='SLSQP', jac=True, bounds=bounds, tol=1e-2, options={'maxiter': 3000})
     elif optimizer == DIFFERENTIAL:
-        result = opt.differential_evolution(func=fitness, args=(), bounds=bounds, maxiter=1000, popsize=15, polish=True, workers=-1, callback=callback)
+        result = opt.differential_evolution(func=fitnessPopulation, args=(), bounds=bounds, maxiter=1000, popsize=15, polish=True, vectorized=True, updating='deferred', callback=callback)
     elif optimizer == DUAL_ANNEALING:
         result = opt.dual_annealing(func=fitness, args=(), bounds=bounds)
     elif optimizer == SHGO:
@@ -80,5 +88,7 @@ def optimize():
     print(f'Best fitness: {result["fun"]}')
     print(f'Number of function evaluations: {result["nfev"]}')
     print(f'Cause of termination: {result["message"]}')
+    cache.flush()
+    print(f'Fitness cache: {cache.stats()}')
 
     return getTrajectory(result["x"]), getTrajectory(defaultAero)
\ No newline at end of file
@@ -1,128 +1,204 @@
 from scipy.spatial.distance import cdist
+from concurrent.futures import ProcessPoolExecutor
 import optimcore as optim
 import numpy as np
 import pandas as pd
 import datetime
+import pickle
+import os
 import cma
+from utils.fitness_cache import FitnessCache, modelSettings
+from utils.trajectory_io import contentHash
 
 frequency = 60.0
+defaultAero = [0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265]
+initialAero = [0.1, 0.1, 0.1, -0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 1, 0.1, -0.1, 0.1, -1, 0.1, 0.1, -1, 0, -1, 0, -1, 0.1, -0.1, -0.1, -0.1, -0.1]
+
+class OptimizationCancelled(Exception):
+    pass
 
 class Optimizer():
 
-    def __init__(self):
+    def __init__(self, threads=0):
         self.model = optim.Model(frequency)
+        self.model.setThreads(threads) # Evaluate generations on every available core by default
         self.useLinVels = False
         self.trajFile = ''
+        self.trajectory = None
+        self.segments = []
         self.nsamples = 0
         self.numberOfSamplesToUse = -1
+        self.earlyAbort = False # Stop integrating candidates that cannot reach the selection cutoff of the previous generation
+        self.abortAbove = np.inf
+        self.cache = None
+        self.cacheSettings = None
+        self.callback = None # Called with the strategy after every generation, returning True cancels the optimization
+        self.trajectoryHash = None
+        self.segmentKeys = []
+
+    def useCache(self, path=None, quantization=1e-7, maxEntries=100000):
+        # Memoize fitness values, in memory and in the sqlite file at path if given, so that restarts and repeated
+        # jobs on the same trajectory do not evaluate the same coefficients again
+        self.cacheSettings = (path, quantization, maxEntries)
+        self.cache = FitnessCache(*self.cacheSettings)
+
+    def cacheContext(self):
+        # Everything besides the coefficients that the fitness depends on
+        if self.trajectoryHash is None:
+            self.trajectoryHash = contentHash(self.model.getTrajectory())
+        return (self.trajectoryHash, self.segmentKeys, self.useLinVels, self.numberOfSamplesToUse) + modelSettings(self.model)
+
+    def modelSettings(self):
+        # Integration and turbulence settings of the model, to configure other models the same way
+        return (self.model.getIntegrator(), self.model.getTolerance(), self.model.getTurbulence())
+
+    def applyModelSettings(self, settings):
+        integrator, tolerance, (intensity, seed) = settings
+        self.model.setIntegrator(integrator, tolerance)
+        self.model.setTurbulence(intensity, seed)
 
     def fitness(self, aero):
+        if self.cache is not None:
+            return self.cache.evaluate(self.evaluate, aero, self.cacheContext())
+        return self.evaluate(aero)
+
+    def evaluate(self, aero):
         return self.model.evaluate(aero[0], aero[1], aero[2], aero[3], aero[4], aero[5], aero[6], aero[7], aero[8], aero[9],
                                    aero[10], aero[11], aero[12], aero[13], aero[14], aero[15], aero[16], aero[17], aero[18], aero[19],
                                    aero[20], aero[21], aero[22], aero[23], aero[24], aero[25],
                                    self.useLinVels, self.numberOfSamplesToUse)
-    
+
+    def fitnessBatch(self, solutions):
+        if self.cache is not None:
+            # Only the solutions missing from the cache reach optimcore
+            fitness = self.cache.evaluateBatch(self.evaluateBatch, solutions, self.cacheContext(), self.abortAbove)
+        else:
+            fitness = self.evaluateBatch(solutions)
+        if self.earlyAbort and self.model.getNumberOfSegments() == 0:
+            # Next cutoff is the median of this generation. If the median is an aborted candidate, the old cutoff stays
+            median = float(np.sort(fitness)[len(fitness) // 2])
+            if median <= self.abortAbove:
+                self.abortAbove = median
+        return fitness.tolist()
+
+    def evaluateBatch(self, solutions):
+        if self.model.getNumberOfSegments() > 0:
+            # Joint fitness over every registered segment, weighted by length
+            return self.model.evaluate_segments(np.asarray(solutions), self.useLinVels)
+        # Evaluate a whole generation in one call to optimcore
+        if not np.isfinite(self.abortAbove):
+            return self.model.evaluate_batch(np.asarray(solutions), self.useLinVels, self.numberOfSamplesToUse)
+        steps = np.zeros(len(solutions), dtype=np.uint32)
+        fitness = self.model.evaluate_batch(np.asarray(solutions), self.useLinVels, self.numberOfSamplesToUse, self.abortAbove, steps)
+        # An aborted candidate only has a lower bound of its fitness, which would rank it by how long it took to abort
+        # below candidates that finished. Instead it gets cutoff + 1 + fraction of samples left, so aborted candidates
+        # rank below every finished one and among themselves by how far they got. Being above the cutoff, these values
+        # are not cached either
+        N = self.model.getTrajectory().shape[1]
+        if self.numberOfSamplesToUse >= 0:
+            N = min(N, self.numberOfSamplesToUse)
+        aborted = (steps < N) & np.isfinite(fitness)
+        fitness = fitness.astype(np.float64)
+        fitness[aborted] = self.abortAbove + 1.0 + (1.0 - steps[aborted] / N)
+        return fitness
+
     def loadTrajectory(self, trajFile, nsamples):
         self.trajFile = trajFile
+        self.trajectory = None
+        self.trajectoryHash = None
         self.nsamples = nsamples
+        self.segments = [] # optimcore drops the segments of the previous trajectory
+        self.segmentKeys = []
         self.model.loadTrajectory(trajFile, nsamples)
 
+    def setTrajectory(self, trajectory):
+        # (17, N) float32 array, used by optimcore without copying
+        self.trajFile = ''
+        self.trajectory = trajectory
+        self.trajectoryHash = None
+        self.nsamples = trajectory.shape[1]
+        self.segments = [] # optimcore drops the segments of the previous trajectory
+        self.segmentKeys = []
+        self.model.setTrajectory(trajectory)
+
+    def addSegment(self, first, nsamples, trajectory=None):
+        # Samples [first, first + nsamples) of the loaded trajectory, or of another (17, N) array, fitted jointly with
+        # the rest of segments. Each one starts from its own first sample
+        self.segments.append((first, nsamples, trajectory))
+        self.segmentKeys.append((first, nsamples, None if trajectory is None else contentHash(trajectory)))
+        return self.model.addSegment(first, nsamples, trajectory)
+
+    def clearSegments(self):
+        self.segments = []
+        self.segmentKeys = []
+        self.model.clearSegments()
+
     def getTrajectory(self, aero):
-        period = 1.0 / frequency
         vismodel = optim.Model(frequency)
-        vismodel.loadTrajectory(self.trajFile, self.nsamples)
+        vismodel.shareTrajectory(self.model) # Shares the loaded trajectory instead of parsing it again
         vismodel.setAeroCoeffs(*aero)
-        roll = []
-        pitch = []
-        yaw = []
-        p = []
-        q = []
-        r = []
-        posNorth = []
-        posEast = []
-        posDown = []
-        vx = []
-        vy = []
-        vz = []
-        states = vismodel.getStates()
-        roll.append(states[3])
-        pitch.append(states[4])
-        yaw.append(states[5])
-        p.append(states[6])
-        q.append(states[7])
-        r.append(states[8])
-        posNorth.append(states[0])
-        posEast.append(states[1])
-        posDown.append(-states[2])
-        vx.append(states[9])
-        vy.append(states[10])
-        vz.append(states[11])
-        for idx in range(self.nsamples):
-            traj = vismodel.getTrajectorySample(idx)
-            da = traj[1]
-            de = traj[2]
-            dr = traj[3]
-            dt = traj[4]
-            vismodel.propagate(da, de, dr, dt, period)
-            states = vismodel.getStates()
-            roll.append(states[3])
-            pitch.append(states[4])
-            yaw.append(states[5])
-            p.append(states[6])
-            q.append(states[7])
-            r.append(states[8])
-            posNorth.append(states[0])
-            posEast.append(states[1])
-            posDown.append(-states[2])
-            vx.append(states[9])
-            vy.append(states[10])
-            vz.append(states[11])
-        return pd.DataFrame({'posNorth': posNorth, 'posEast': posEast, 'posDown': posDown, 'roll': roll, 'pitch': pitch, 'yaw': yaw,
-                             'vx': vx, 'vy': vy, 'vz': vz, 'p': p, 'q': q, 'r': r})
-
-    def optimize(self, mode='single'):
-        MBF = 0
-        MSD = 0
-        FSR = 0
-        DSR = 0
-        AES = 0
+        # Replays the controls of the whole trajectory in optimcore, one row per state
+        states = pd.DataFrame(vismodel.simulate(), columns=optim.STATES)
+        return pd.DataFrame({'posNorth': states['posNorth'], 'posEast': states['posEast'], 'posDown': -states['alt'],
+                             'roll': states['roll'], 'pitch': states['pitch'], 'yaw': states['yaw'],
+                             'vx': states['vx'], 'vy': states['vy'], 'vz': states['vz'], 'p': states['p'], 'q': states['q'], 'r': states['r']})
+
+    def optimize(self, mode='single', checkpoint=None, checkpointInterval=10):
+        # With a checkpoint path, the state of the job is saved there every checkpointInterval generations and after
+        # every run. If the file already exists the job continues from it instead of starting over, as long as it was
+        # saved by a job with the same mode, trajectory, segments and model settings
+        metrics = (0, 0, 0, 0, 0)
+        firstRun = 0
+        resumed = None
+        sol_encoded = None
+        if checkpoint is not None and os.path.exists(checkpoint):
+            resumed = self.loadCheckpoint(checkpoint)
+            if resumed['mode'] != mode:
+                raise ValueError('Checkpoint ' + checkpoint + " was saved by a '" + resumed['mode'] + "' job, not '" + mode + "'")
+            firstRun = resumed['run']
+            metrics = tuple(resumed['metrics'])
+            sol_encoded = resumed['solution']
+            print('Resuming run ' + str(firstRun) + ' from ' + checkpoint)
+            if resumed['es'] is None:
+                resumed = None # Checkpoint taken between runs
+        save = lambda: self.saveCheckpoint(checkpoint, mode, run, es, metrics, sol_encoded)
         if mode == 'single':
             N_runs = 1
         elif mode == 'eval':
             N_runs = 10
-        defaultAero = [0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265]
         defaultAero_encoded = defaultAero.copy()
         defaultAero_encoded[9] /= 100
         defaultAero_encoded[20] /= 100
-        for run in range(N_runs):
-            x0 = [0.1, 0.1, 0.1, -0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 1, 0.1, -0.1, 0.1, -1, 0.1, 0.1, -1, 0, -1, 0, -1, 0.1, -0.1, -0.1, -0.1, -0.1]
+        for run in range(firstRun, N_runs):
+            x0 = initialAero.copy()
             x0_encoded = x0.copy()
             x0_encoded[9] /= 100 
             x0_encoded[20] /= 100
             for pop_size in [13]:
-                self.useLinVels = False
                 self.numberOfSamplesToUse = -1
-                es = cma.CMAEvolutionStrategy(x0_encoded, 0.2, {'popsize': pop_size})
+                if resumed is not None:
+                    es = resumed['es']
+                    self.useLinVels = resumed['useLinVels']
+                    self.abortAbove = resumed['abortAbove']
+                    resumed = None
+                else:
+                    self.useLinVels = False
+                    self.abortAbove = np.inf
+                    es = cma.CMAEvolutionStrategy(x0_encoded, 0.2, {'popsize': pop_size})
                 print('POPSIZE = ' + str(pop_size))
-                # es.optimize(self.fitness)
-                while not es.stop():
-                # for _ in range(5):
-                    solutions = es.ask()
-                    es.tell(solutions, [self.fitness(s) for s in solutions])
-                    es.disp()
-                es.result_pretty()
-                res = es.result
-                x0_encoded = [element for element in res[0]]
-                self.useLinVels = True
-                es._set_x0(x0_encoded)
+                if not self.useLinVels:
+                    # es.optimize(self.fitness)
+                    self.evolve(es, save if checkpoint is not None else None, checkpointInterval)
+                    es.result_pretty()
+                    res = es.result
+                    x0_encoded = [element for element in res[0]]
+                    self.useLinVels = True
+                    self.abortAbove = np.inf # Fitness scale changes with linear velocities
+                    es._set_x0(x0_encoded)
                 # sigma0 = 0.01
                 # es.__init__(x0_encoded, sigma0)
                 # es.optimize(self.fitness)
-                while not es.stop():
-                # for _ in range(5):
-                    solutions = es.ask()
-                    es.tell(solutions, [self.fitness(s) for s in solutions])
-                    es.disp()
+                self.evolve(es, save if checkpoint is not None else None, checkpointInterval)
                 es.result_pretty()
                 res = es.result
                 x0_encoded = [element for element in res[0]]
@@ -131,49 +207,151 @@ class Optimizer():
                 x0[20] *= 100
                 pd.options.display.float_format = '{:,.5f}'.format
                 print(pd.DataFrame({'real': defaultAero, 'optim': x0}))
-            ref_array = np.expand_dims(np.array(defaultAero), axis=1).T
-            sol_array = np.expand_dims(np.array(x0), axis=1).T
             sol_encoded = res[0]
             # self.useLinVels = True # Fitness for metric has to always be in (v+w) mode
             # BF = self.fitness(sol_encoded) # Also available in res[1] if fitness was (v+w) in last execution
-            BF = res[1]
-            SD = cdist(ref_array, sol_array, metric='cityblock')[0][0] # Calculate Manhattan distance
-            FS = int(BF < 1e-2)
-            DS = int(SD < 5)
-            ES = res[2]
-            FSR += FS
-            DSR += DS
-            print('Metrics of run number ' + str(run))
-            print('Best fitness: ' + str(BF))
-            print('Manhattan distance: ' + str(SD))
-            print('Fitness success: ' + str(FS))
-            print('Distance success: ' + str(DS))
-            print('Number of evaluations: ' + str(ES))
-            if not DS:
-                continue
-            MBF += BF
-            MSD += SD
-            AES += ES
+            metrics = self.addRunMetrics(metrics, run, res)
+            if checkpoint is not None:
+                # Next run starts from scratch
+                self.saveCheckpoint(checkpoint, mode, run + 1, None, metrics, sol_encoded)
         if mode == 'eval':
-            FSR /= N_runs
-            DSR /= N_runs
-            successfulRuns = N_runs * DSR
-            if successfulRuns > 0.0:
-                MBF /= successfulRuns
-                MSD /= successfulRuns
-                AES /= successfulRuns
-                print('Metrics after ' + str(N_runs) + ' runs')
-                print('Mean best fitness: ' + str(MBF))
-                print('Mean manhattan distance: ' + str(MSD))
-                print('Fitness success rate: ' + str(FSR))
-                print('Distance success rate: ' + str(DSR))
-                print('Average number of evaluations: ' + str(AES))
-            else:
-                print('No successful runs')
+            if not self.printMeanMetrics(metrics, N_runs):
                 import sys
                 sys.exit(0)
+        if self.cache is not None:
+            self.cache.flush()
+            print('Fitness cache: ' + str(self.cache.stats()))
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint) # Job finished, nothing left to resume
         return self.getTrajectory(sol_encoded), self.getTrajectory(defaultAero_encoded)
 
+    def resume(self, checkpoint, checkpointInterval=10):
+        # Continues the job saved in checkpoint, with the same mode it was started with
+        return self.optimize(self.loadCheckpoint(checkpoint)['mode'], checkpoint, checkpointInterval)
+
+    def evolve(self, es, save=None, checkpointInterval=10):
+        # Runs a CMA-ES phase until its stop criteria are met, calling save every checkpointInterval generations
+        while not es.stop():
+        # for _ in range(5):
+            solutions = es.ask()
+            es.tell(solutions, self.fitnessBatch(solutions))
+            es.disp()
+            if save is not None and es.countiter % checkpointInterval == 0:
+                save()
+            if self.callback is not None and self.callback(es):
+                raise OptimizationCancelled('Cancelled at generation ' + str(es.countiter))
+
+    def saveCheckpoint(self, path, mode, run, es, metrics, solution):
+        # CMA-ES samples from the global NumPy generator, so its state is needed to continue the same search
+        state = {'mode': mode, 'context': self.jobContext(), 'run': run, 'es': es, 'metrics': metrics, 'solution': solution, 'useLinVels': self.useLinVels,
+                 'abortAbove': self.abortAbove, 'generation': None if es is None else es.countiter,
+                 'best': None if es is None else (np.array(es.result[0]), es.result[1]),
+                 'randomState': np.random.get_state()}
+        # Written next to the old checkpoint and renamed, so a job killed while saving keeps a valid file
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def loadCheckpoint(self, path):
+        # Only checkpoints of a job on the same data and model settings can be continued
+        with open(path, 'rb') as file:
+            state = pickle.load(file)
+        if state.get('context') != self.jobContext():
+            raise ValueError('Checkpoint ' + path + ' was saved with another trajectory, segments or model settings')
+        np.random.set_state(state['randomState'])
+        return state
+
+    def jobContext(self):
+        # Same as cacheContext without the fitness flags, which change between the phases of a job
+        trajectoryHash, segmentKeys, _, _, *settings = self.cacheContext()
+        return (trajectoryHash, list(segmentKeys)) + tuple(settings)
+
+    def optimizeParallel(self, N_runs=10, migrationInterval=0, N_migrants=1, pop_size=13, processes=None):
+        # Runs N_runs CMA-ES strategies in a process pool, each process with its own optimcore model.
+        # With migrationInterval = 0 they are independent restarts, as the 'eval' mode of optimize. Otherwise they are
+        # islands in a ring: every migrationInterval generations each island receives the best N_migrants solutions of
+        # the previous one
+        if not self.trajFile and self.trajectory is None:
+            raise ValueError('No trajectory loaded, call loadTrajectory or setTrajectory before optimizeParallel')
+        if processes is None:
+            processes = min(N_runs, os.cpu_count() or 1)
+        x0_encoded = initialAero.copy()
+        x0_encoded[9] /= 100
+        x0_encoded[20] /= 100
+        islands = [Island(x0_encoded, 0.2, pop_size, seed) for seed in range(1, N_runs + 1)]
+        generations = migrationInterval if migrationInterval > 0 else 1000000
+        with ProcessPoolExecutor(max_workers=processes, initializer=initWorker,
+                                 initargs=(self.trajFile, self.nsamples, self.trajectory, self.segments, self.earlyAbort,
+                                           self.cacheSettings, self.modelSettings())) as pool:
+            while not all(island.finished for island in islands):
+                islands = list(pool.map(evolveIsland, islands, [generations] * len(islands)))
+                if migrationInterval > 0:
+                    migrants = [island.best(N_migrants) for island in islands]
+                    for idx, island in enumerate(islands):
+                        if not island.finished:
+                            island.es.inject(migrants[idx - 1])
+                print('Generations: ' + str([island.es.countiter for island in islands]) +
+                      ' Best fitness: ' + str([island.es.result[1] for island in islands]))
+
+        # Same statistics as optimize in 'eval' mode, over every run
+        metrics = (0, 0, 0, 0, 0)
+        for run, island in enumerate(islands):
+            metrics = self.addRunMetrics(metrics, run, island.es.result)
+        self.printMeanMetrics(metrics, N_runs)
+        best = min(islands, key=lambda island: island.es.result[1])
+        defaultAero_encoded = defaultAero.copy()
+        defaultAero_encoded[9] /= 100
+        defaultAero_encoded[20] /= 100
+        return self.getTrajectory(best.es.result[0]), self.getTrajectory(defaultAero_encoded)
+
+    def addRunMetrics(self, metrics, run, res):
+        # Prints the metrics of a run from its CMA-ES result and adds them to the (MBF, MSD, FSR, DSR, AES) sums.
+        # Best fitness, distance and evaluations only count for runs that found the real coefficients
+        MBF, MSD, FSR, DSR, AES = metrics
+        x0 = list(res[0])
+        x0[9] *= 100
+        x0[20] *= 100
+        ref_array = np.expand_dims(np.array(defaultAero), axis=1).T
+        sol_array = np.expand_dims(np.array(x0), axis=1).T
+        BF = res[1]
+        SD = cdist(ref_array, sol_array, metric='cityblock')[0][0] # Calculate Manhattan distance
+        FS = int(BF < 1e-2)
+        DS = int(SD < 5)
+        ES = res[2]
+        FSR += FS
+        DSR += DS
+        print('Metrics of run number ' + str(run))
+        print('Best fitness: ' + str(BF))
+        print('Manhattan distance: ' + str(SD))
+        print('Fitness success: ' + str(FS))
+        print('Distance success: ' + str(DS))
+        print('Number of evaluations: ' + str(ES))
+        if DS:
+            MBF += BF
+            MSD += SD
+            AES += ES
+        return MBF, MSD, FSR, DSR, AES
+
+    def printMeanMetrics(self, metrics, N_runs):
+        # Prints the metrics summed by addRunMetrics averaged over N_runs. Returns False if no run was successful
+        MBF, MSD, FSR, DSR, AES = metrics
+        FSR /= N_runs
+        DSR /= N_runs
+        successfulRuns = N_runs * DSR
+        if successfulRuns > 0.0:
+            MBF /= successfulRuns
+            MSD /= successfulRuns
+            AES /= successfulRuns
+            print('Metrics after ' + str(N_runs) + ' runs')
+            print('Mean best fitness: ' + str(MBF))
+            print('Mean manhattan distance: ' + str(MSD))
+            print('Fitness success rate: ' + str(FSR))
+            print('Distance success rate: ' + str(DSR))
+            print('Average number of evaluations: ' + str(AES))
+            return True
+        print('No successful runs')
+        return False
+
     def getEvaluationTimeInMicroseconds(self):
         now = datetime.datetime.now()
         self.model.evaluate(0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021,
@@ -181,6 +359,67 @@ class Optimizer():
         ellapsed = datetime.datetime.now() - now
         return int(ellapsed.total_seconds() * 1e6) # microseconds
 
+class Island():
+    # One CMA-ES strategy of optimizeParallel, moved between processes as a whole
+
+    def __init__(self, x0, sigma0, pop_size, seed):
+        # Each island samples from its own generator, pickled with it. By default CMA-ES keeps a reference to the
+        # global numpy one, and every island sent to the pool would carry a copy of it in the same state
+        self.es = cma.CMAEvolutionStrategy(x0, sigma0, {'popsize': pop_size, 'seed': seed, 'verbose': -9,
+                                                        'randn': np.random.RandomState(seed).randn})
+        self.useLinVels = False
+        self.abortAbove = np.inf
+        self.finished = False
+
+    def best(self, N):
+        # Best N solutions of the last generation
+        if self.es.countiter == 0:
+            return []
+        return [np.array(x) for x in self.es.pop_sorted[:N]]
+
+workerOptimizer = None
+
+def initWorker(trajFile, nsamples, trajectory, segments, earlyAbort, cacheSettings=None, modelSettings=None):
+    # Runs once in every process of the pool: one single-threaded model, since processes already use every core,
+    # configured as the model of the parent
+    global workerOptimizer
+    workerOptimizer = Optimizer(threads=1)
+    workerOptimizer.earlyAbort = earlyAbort
+    if modelSettings is not None:
+        workerOptimizer.applyModelSettings(modelSettings)
+    if cacheSettings is not None:
+        workerOptimizer.useCache(*cacheSettings)
+    if trajectory is not None:
+        workerOptimizer.setTrajectory(trajectory)
+    else:
+        workerOptimizer.loadTrajectory(trajFile, nsamples)
+    for first, segmentSamples, segmentTrajectory in segments:
+        workerOptimizer.addSegment(first, segmentSamples, segmentTrajectory)
+
+def evolveIsland(island, generations):
+    # Advances an island up to the given number of generations, with the same two phases as optimize
+    optimizer = workerOptimizer
+    optimizer.useLinVels = island.useLinVels
+    optimizer.abortAbove = island.abortAbove
+    for _ in range(generations):
+        if island.es.stop():
+            if island.useLinVels:
+                island.finished = True
+                break
+            island.useLinVels = True
+            optimizer.useLinVels = True
+            optimizer.abortAbove = np.inf # Fitness scale changes with linear velocities
+            island.es._set_x0([element for element in island.es.result[0]])
+            if island.es.stop():
+                island.finished = True
+                break
+        solutions = island.es.ask()
+        island.es.tell(solutions, optimizer.fitnessBatch(solutions))
+    island.abortAbove = optimizer.abortAbove
+    if optimizer.cache is not None:
+        optimizer.cache.flush()
+    return island
+
 if __name__ == "__main__":
     optimizer = Optimizer()
     optimizer.optimize("/home/fidel/repos/DeepAero/data.csv")
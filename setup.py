@@ -1,13 +1,25 @@
 # For installation: "python setup.py install"
 from distutils.core import setup, Extension
+import numpy
+import sys
+
+# Fitness evaluations run on a pool of std::thread workers
+thread_args = [] if sys.platform == 'win32' else ['-pthread']
 
 # Nombre del módulo y archivos que contienen el código fuente.
 module1 = Extension("optimcore",
                     define_macros=[('MAJOR_VERSION', '0'),
                                    ('MINOR_VERSION', '1')],
-                    include_dirs = ['OptimCore/include'],
+                    include_dirs = ['OptimCore/include', numpy.get_include()],
+                    extra_compile_args=thread_args,
+                    extra_link_args=thread_args,
                     sources=["optimcoremodule.cpp", 
-                             "OptimCore/source/dynamicModel.cpp"])
+                             "OptimCore/source/dynamicModel.cpp",
+                             "OptimCore/source/threadPool.cpp",
+                             "OptimCore/source/laneModel.cpp",
+                             "OptimCore/source/trajectory.cpp",
+                             "OptimCore/source/sensitivityModel.cpp",
+                             "OptimCore/source/turbulence.cpp"])
 
 # Nombre del paquete, versión, descripción y una lista con las extensiones.
 setup(name="optimcore",
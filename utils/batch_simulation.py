@@ -0,0 +1,76 @@
+import os.path, sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.trajectory_io import COLUMNS, loadTrajectory
+import optimcore as optim
+
+# Rows of a (4, N) control schedule
+CONTROLS = ['da', 'de', 'dr', 'dt']
+
+# Control schedules. hold creates one, the manoeuvres add their input on top of it and return it
+def hold(duration, frequency=60.0, da=0.0, de=0.0, dr=0.0, dt=0.5):
+    controls = np.empty((len(CONTROLS), int(round(duration * frequency))), dtype=np.float32)
+    controls[:] = np.array([[da], [de], [dr], [dt]], dtype=np.float32)
+    return controls
+
+def pulses(controls, axis, amplitude, start, widths, frequency=60.0):
+    # Consecutive pulses of the given widths (s) with alternating sign, starting at start (s)
+    row = controls[CONTROLS.index(axis)]
+    first = int(round(start * frequency))
+    sign = 1.0
+    for width in widths:
+        last = first + int(round(width * frequency))
+        row[first:last] += sign * amplitude
+        first = last
+        sign = -sign
+    return controls
+
+def doublet(controls, axis, amplitude, start, width=1.0, frequency=60.0):
+    return pulses(controls, axis, amplitude, start, [width, width], frequency)
+
+def multistep(controls, axis, amplitude, start, width=0.5, frequency=60.0):
+    # 3-2-1-1: pulses of 3, 2, 1 and 1 times width
+    return pulses(controls, axis, amplitude, start, [3 * width, 2 * width, width, width], frequency)
+
+def sweep(controls, axis, amplitude, start, duration, f0=0.1, f1=2.0, frequency=60.0):
+    # Logarithmic frequency sweep from f0 to f1 Hz over duration (s), a constant frequency sine if f0 == f1
+    if duration <= 0:
+        raise ValueError(f'Sweep duration must be positive, got {duration} s')
+    if f0 <= 0 or f1 <= 0:
+        raise ValueError(f'Sweep frequencies must be positive, got {f0} and {f1} Hz')
+    first = int(round(start * frequency))
+    t = np.arange(int(round(duration * frequency))) / frequency
+    if f0 == f1:
+        phase = 2 * np.pi * f0 * t
+    else:
+        k = (f1 / f0) ** (1.0 / duration)
+        phase = 2 * np.pi * f0 * (k ** t - 1) / np.log(k)
+    row = controls[CONTROLS.index(axis)]
+    row[first:first + len(t)] += amplitude * np.sin(phase[:len(row) - first])
+    return controls
+
+def replay(path):
+    # Controls of a logged trajectory, in any format loadTrajectory reads
+    trajectory = loadTrajectory(path)
+    return np.ascontiguousarray(trajectory[[COLUMNS.index(name) for name in CONTROLS]], dtype=np.float32)
+
+def simulate(controls, frequency=60.0, aero=None, model=None):
+    """Runs a control schedule through optimcore as fast as possible. Returns the (17, N) trajectory.
+
+    Each sample holds the controls of one step and the states after it, as the real-time simulators record them.
+    aero, if given, is the coefficient vector to simulate (with the parameter encoding of setAeroCoeffs).
+    """
+    if model is None:
+        model = optim.Model(frequency)
+    if aero is not None:
+        model.setAeroCoeffs(*aero)
+    states = model.simulate(controls)[1:]
+    trajectory = np.empty((len(COLUMNS), controls.shape[1]), dtype=np.float32)
+    trajectory[0] = np.arange(controls.shape[1])
+    trajectory[1:5] = controls
+    for name in COLUMNS[5:]:
+        if name == 'posDown':
+            trajectory[COLUMNS.index(name)] = -states[:, optim.STATES.index('alt')]
+        else:
+            trajectory[COLUMNS.index(name)] = states[:, optim.STATES.index(name)]
+    return trajectory
@@ -0,0 +1,116 @@
+import hashlib, os, sqlite3
+from collections import OrderedDict
+import numpy as np
+
+# Version of the fitness definition, part of every context so that values of older versions are not reused
+SCHEMA_VERSION = 2
+
+def modelSettings(model):
+    # Settings of an optimcore model that its evaluations depend on, besides trajectory and coefficients
+    return (SCHEMA_VERSION, model.getFrequency(), model.getIntegrator(), model.getTolerance(), model.getTurbulence())
+
+class FitnessCache():
+
+    """Memoizes fitness values in memory (LRU) and, optionally, in a sqlite file shared by every run.
+
+    Entries are keyed by a context (trajectory hash, fitness flags...) and by the coefficient vector rounded to
+    multiples of quantization, so vectors closer than that share their fitness.
+    """
+
+    def __init__(self, path=None, quantization=1e-7, maxEntries=100000):
+        self.path = path
+        self.quantization = quantization
+        self.maxEntries = maxEntries
+        self.memory = OrderedDict()
+        self.memoryHits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._pendingWrites = 0
+
+    def key(self, aero, context):
+        digest = hashlib.sha1(repr(context).encode())
+        digest.update(np.round(np.asarray(aero, dtype=np.float64) / self.quantization).astype(np.int64).tobytes())
+        return digest.digest()
+
+    def _database(self):
+        # Connections cannot cross a fork, so processes of a pool open their own one
+        if self.path is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS fitness (key BLOB PRIMARY KEY, value REAL)')
+            self._pid = os.getpid()
+            self._pendingWrites = 0
+        return self._connection
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memoryHits += 1
+            return self.memory[key]
+        database = self._database()
+        if database is not None:
+            row = database.execute('SELECT value FROM fitness WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.diskHits += 1
+                self._remember(key, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        database = self._database()
+        if database is not None:
+            database.execute('INSERT OR REPLACE INTO fitness VALUES (?, ?)', (key, float(value)))
+            self._pendingWrites += 1
+            if self._pendingWrites >= 256:
+                self.flush()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxEntries:
+            self.memory.popitem(last=False)
+
+    def evaluate(self, function, aero, context):
+        """Cached function(aero)."""
+        key = self.key(aero, context)
+        value = self.get(key)
+        if value is None:
+            value = float(function(aero))
+            self.put(key, value)
+        return value
+
+    def evaluateBatch(self, function, solutions, context, abortAbove=np.inf):
+        """Cached function(solutions), only called with the solutions that are not in the cache.
+
+        Values above abortAbove come from aborted integrations and are not stored.
+        """
+        keys = [self.key(aero, context) for aero in solutions]
+        fitness = np.array([self.get(key) for key in keys], dtype=np.float64) # None becomes nan
+        missing = np.flatnonzero(np.isnan(fitness))
+        if missing.size > 0:
+            fitness[missing] = function(np.asarray(solutions)[missing])
+            for idx in missing:
+                if fitness[idx] <= abortAbove:
+                    self.put(keys[idx], fitness[idx])
+        return fitness
+
+    def flush(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.commit()
+            self._pendingWrites = 0
+
+    def close(self):
+        self.flush()
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def stats(self):
+        lookups = self.memoryHits + self.diskHits + self.misses
+        return {'lookups': lookups, 'memoryHits': self.memoryHits, 'diskHits': self.diskHits, 'misses': self.misses,
+                'hitRate': (self.memoryHits + self.diskHits) / lookups if lookups > 0 else 0.0}
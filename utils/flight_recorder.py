@@ -0,0 +1,93 @@
+import queue
+import time
+from threading import Thread
+
+import numpy as np
+import pandas as pd
+
+
+# Channels of the identification format, in the column order optimcore reads
+TRAJECTORY_CHANNELS = ['da', 'de', 'dr', 'dt', 'roll', 'pitch', 'yaw', 'posNorth', 'posEast', 'posDown', 'vx', 'vy', 'vz', 'p', 'q', 'r']
+
+
+class FlightRecorder:
+
+    """Record samples of named channels into preallocated chunks, appended to a CSV file by a background thread.
+
+    record() only writes one row into the current chunk. Full chunks are handed to the writer thread and recycled
+    once written, so memory stays bounded however long the session is and the caller never waits for the disk.
+    If the writer falls behind, new chunks are allocated instead of blocking (counted in `overflows`).
+    The file has the layout of DataFrame.to_csv: an index column, then one column per channel.
+    """
+
+    def __init__(self, path, channels=TRAJECTORY_CHANNELS, chunkSize=3600, buffers=4):
+        self.path = path
+        self.channels = list(channels)
+        self.dtype = np.dtype([(name, np.float32) for name in self.channels])
+        self.chunkSize = chunkSize
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty(chunkSize, dtype=self.dtype))
+        self.full = queue.Queue()
+        self.chunk = self.free.get()
+        self.count = 0
+        self.samples = 0
+        self.overflows = 0
+        self.closed = False
+        self.thread = Thread(target=self._write)
+        self.thread.start()
+
+    def record(self, *values):
+        # One value per channel, in the order given to the constructor
+        self.chunk[self.count] = values
+        self.count += 1
+        self.samples += 1
+        if self.count == self.chunkSize:
+            self._handOff()
+
+    def _handOff(self):
+        self.full.put((self.chunk, self.count))
+        try:
+            self.chunk = self.free.get_nowait()
+        except queue.Empty:
+            self.chunk = np.empty(self.chunkSize, dtype=self.dtype)
+            self.overflows += 1
+        self.count = 0
+
+    def _write(self):
+        first = 0
+        with open(self.path, 'w', newline='') as file:
+            while True:
+                item = self.full.get()
+                if item is None:
+                    break
+                chunk, count = item
+                # Formatted in short slices, releasing the GIL in between so that record() never waits long for it
+                for start in range(0, count, 256):
+                    end = min(start + 256, count)
+                    rows = pd.DataFrame(chunk[start:end], index=pd.RangeIndex(first + start, first + end))
+                    rows.to_csv(path_or_buf=file, header=(first + start == 0))
+                    time.sleep(0)
+                file.flush()
+                first += count
+                self.free.put(chunk)
+
+    def flush(self):
+        # Hands the samples recorded so far to the writer, without waiting for them to be written
+        if self.count > 0:
+            self._handOff()
+
+    def close(self):
+        # Writes every pending sample and stops the writer thread
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self.full.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
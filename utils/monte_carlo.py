@@ -0,0 +1,190 @@
+import os.path, sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.dynamic_model import defaultParams, defaultAero
+from modules.batch_model import BatchModel, S_ROLL, S_YAW, S_NORTH, S_ALT
+from utils.batch_simulation import hold, doublet
+
+# Default spread of each dispersed parameter. mass and inertia are relative standard deviations of a normal scale
+# factor (inertia scales Ix, Iy, Iz and Ixz together), the others uniform ranges. Response times must stay above one
+# step (1/60 s), the first order lags of BatchModel diverge below it
+DISPERSIONS = {
+    'mass': 0.05,
+    'inertia': 0.10,
+    'windVelocity': (0.0, 10.0),         # [m/s]
+    'windHeading': (0.0, 360.0),         # [deg]
+    'windElevation': (-5.0, 5.0),        # [deg]
+    'turbulenceIntensity': (0.0, 3.0),   # RMS gust [m/s]
+    'servosResponseTime': (0.02, 0.1),   # [s]
+    'engineResponseTime': (0.1, 0.5),    # [s]
+}
+
+# Errors with respect to the nominal run tracked by DispersionStatistics, with the range of their histogram bins
+QUANTITIES = {
+    'position': (1e-3, 1e5),   # Distance to the nominal position [m]
+    'attitude': (1e-5, 1e1),   # Norm of the wrapped roll, pitch and yaw differences [rad]
+}
+
+def sampleDispersions(N, rng, dispersions=DISPERSIONS):
+    samples = {}
+    for name, spread in dispersions.items():
+        if name in ('mass', 'inertia'):
+            samples[name] = np.maximum(1.0 + spread * rng.standard_normal(N), 0.1)
+        else:
+            samples[name] = rng.uniform(spread[0], spread[1], N)
+    return samples
+
+def buildBatch(aero, N, samples, params=defaultParams, seed=None):
+    # BatchModel of N aircraft flying aero, each with its own dispersion of samples. Parameters missing from samples
+    # keep their nominal value
+    params = list(params)
+    params[0] = params[0] * samples.get('mass', 1.0)
+    for i in range(7, 11):
+        params[i] = params[i] * samples.get('inertia', 1.0)
+    wind = [samples.get('windVelocity', 0.0), samples.get('windHeading', 0.0), samples.get('windElevation', 0.0)]
+    return BatchModel(np.tile(aero, (N, 1)), params=params, wind=wind,
+                      turbulenceIntensity=samples.get('turbulenceIntensity'),
+                      servosResponseTime=samples.get('servosResponseTime'),
+                      engineResponseTime=samples.get('engineResponseTime'), turbulenceSeed=seed)
+
+def nominalStates(aero, controls, frequency=60.0, params=defaultParams):
+    # (N, 12) states of the undispersed aircraft after each column of controls
+    vehicle = BatchModel(aero, params=params)
+    states = np.empty((controls.shape[1], vehicle.states.shape[1]))
+    for i in range(controls.shape[1]):
+        vehicle.propagate(controls[:, i], 1 / frequency)
+        states[i] = vehicle.states[0]
+    return states
+
+
+class DispersionStatistics():
+
+    """Streaming statistics of the errors of dispersed runs, per time step.
+
+    Runs are folded in as they finish, so memory does not grow with their number. For every quantity of QUANTITIES
+    and step it keeps count, sum and sum of squares, the envelope (min and max) and a histogram over log-spaced bins,
+    from which percentiles are read with the relative resolution of one bin (about 7% with the default 256 bins).
+    Statistics of parallel batches are combined with merge.
+    """
+
+    def __init__(self, N_steps, quantities=QUANTITIES, bins=256):
+        self.N_steps = N_steps
+        self.quantities = dict(quantities)
+        self.edges = {name: np.geomspace(low, high, bins + 1) for name, (low, high) in self.quantities.items()}
+        shape = (len(self.quantities), N_steps)
+        self.count = 0
+        self.sum = np.zeros(shape)
+        self.sumSquares = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.histogram = np.zeros(shape + (bins + 2,), dtype=np.int32)  # First and last bins hold values out of range
+
+    def update(self, errors):
+        # errors maps every quantity to a (runs, N_steps) array
+        for q, name in enumerate(self.quantities):
+            values = np.asarray(errors[name], dtype=np.float64)
+            self.sum[q] += values.sum(axis=0)
+            self.sumSquares[q] += (values * values).sum(axis=0)
+            np.minimum(self.minimum[q], values.min(axis=0), out=self.minimum[q])
+            np.maximum(self.maximum[q], values.max(axis=0), out=self.maximum[q])
+            bins = np.searchsorted(self.edges[name], values) + np.arange(self.N_steps) * self.histogram.shape[2]
+            self.histogram[q] += np.bincount(bins.ravel(), minlength=self.histogram[q].size).reshape(self.histogram[q].shape).astype(np.int32)
+        self.count += len(values)
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.sumSquares += other.sumSquares
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.histogram += other.histogram
+        return self
+
+    def mean(self, name):
+        return self.sum[self.index(name)] / self.count
+
+    def std(self, name):
+        q = self.index(name)
+        return np.sqrt(np.maximum(self.sumSquares[q] / self.count - (self.sum[q] / self.count) ** 2, 0.0))
+
+    def envelope(self, name):
+        q = self.index(name)
+        return self.minimum[q], self.maximum[q]
+
+    def percentile(self, name, p):
+        # Geometric centre of the bin holding the p-th percentile at every step, clipped to the envelope
+        q = self.index(name)
+        cumulative = np.cumsum(self.histogram[q], axis=1)
+        bins = np.argmax(cumulative >= np.ceil(p / 100 * self.count), axis=1)
+        edges = self.edges[name]
+        centres = np.concatenate([[edges[0]], np.sqrt(edges[:-1] * edges[1:]), [edges[-1]]])
+        return np.clip(centres[bins], self.minimum[q], self.maximum[q])
+
+    def summary(self, percentiles=(5, 50, 95)):
+        summary = {'runs': self.count}
+        for name in self.quantities:
+            low, high = self.envelope(name)
+            summary[name] = {'mean': self.mean(name), 'std': self.std(name), 'min': low, 'max': high}
+            summary[name].update({f'p{p:g}': self.percentile(name, p) for p in percentiles})
+        return summary
+
+    def index(self, name):
+        return list(self.quantities).index(name)
+
+
+def runBatch(aero, controls, nominal, N, seed, dispersions=DISPERSIONS, frequency=60.0):
+    # Propagates N dispersed aircraft together and returns their DispersionStatistics
+    rng = np.random.default_rng(seed)
+    vehicles = buildBatch(aero, N, sampleDispersions(N, rng, dispersions), seed=rng)
+    errors = {name: np.empty((N, controls.shape[1])) for name in QUANTITIES}
+    for i in range(controls.shape[1]):
+        vehicles.propagate(controls[:, i], 1 / frequency)
+        errors['position'][:, i] = np.linalg.norm(vehicles.states[:, S_NORTH:S_ALT + 1] - nominal[i, S_NORTH:S_ALT + 1], axis=1)
+        angles = vehicles.states[:, S_ROLL:S_YAW + 1] - nominal[i, S_ROLL:S_YAW + 1]
+        errors['attitude'][:, i] = np.linalg.norm((angles + np.pi) % (2 * np.pi) - np.pi, axis=1)
+    statistics = DispersionStatistics(controls.shape[1])
+    statistics.update(errors)
+    return statistics
+
+def runDispersions(aero, controls, N_runs=1000, batchSize=250, processes=None, seed=0, dispersions=DISPERSIONS, frequency=60.0, callback=None):
+    """Monte Carlo dispersion of the aircraft flying aero (coefficients as in modules.dynamic_model) through a (4, N)
+    control schedule.
+
+    Runs are propagated batchSize at a time by BatchModel, with batches spread over processes worker processes. Each
+    batch comes back as a DispersionStatistics that is merged into the result as soon as it finishes, and callback,
+    if given, is called with the result so far. Every batch has its own child of seed, so results only depend on seed,
+    N_runs and batchSize.
+    """
+    aero = np.asarray(aero, dtype=np.float64)
+    nominal = nominalStates(aero, controls, frequency)
+    sizes = [min(batchSize, N_runs - first) for first in range(0, N_runs, batchSize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    statistics = DispersionStatistics(controls.shape[1])
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(runBatch, aero, controls, nominal, N, s, dispersions, frequency) for N, s in zip(sizes, seeds)]
+        for future in as_completed(futures):
+            statistics.merge(future.result())
+            if callback is not None:
+                callback(statistics)
+    return statistics
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo dispersion of an elevator doublet.')
+    parser.add_argument('--runs', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=250)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--aero', help='Text file with the 26 coefficients to disperse, the defaults otherwise')
+    args = parser.parse_args()
+
+    aero = np.loadtxt(args.aero) if args.aero is not None else defaultAero
+    controls = doublet(hold(args.duration), 'de', 0.05, 2.0)
+    statistics = runDispersions(aero, controls, args.runs, args.batch, args.processes, args.seed,
+                                callback=lambda s: print(f'{s.count}/{args.runs} runs', flush=True))
+    summary = statistics.summary()
+    for name in QUANTITIES:
+        final = {key: value[-1] for key, value in summary[name].items()}
+        print(f'Final {name} error: ' + ', '.join(f'{key} {value:.4g}' for key, value in final.items()))
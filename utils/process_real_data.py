@@ -2,8 +2,9 @@ from scipy.spatial.transform import Rotation as R
 from scipy.interpolate import interp1d
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-plt.close("all")
+import sys, os.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.trajectory_io import COLUMNS
 
 # Function definitions
 def ResamplePacket(packet, frequency=None, numberOfSamples=None, timeReference='totalTime'):
@@ -27,49 +28,148 @@ def ResamplePacket(packet, frequency=None, numberOfSamples=None, timeReference='
 def TrimPacket(packet, timeStart, timeEnd, timeReference='totalTime'):
     return packet[(packet[timeReference] >= timeStart) & (packet[timeReference] <= timeEnd)].reset_index()
 
-data = pd.read_csv('real_data.csv') # Read real data from file
-data = TrimPacket(data, 1400, 1420, timeReference='time') # Trim packet to desired time range
-data = ResamplePacket(data, frequency=60, timeReference='time') # Resample packet to 60 Hz frequency
-
-# Transform LLA to NED coordinates
-RT = 6378000
-data['posNorth'] = np.deg2rad(data['lat'] - data['lat'][0]) * RT
-data['posEast'] = np.deg2rad(data['lon'] - data['lon'][0]) * np.cos(np.deg2rad(data['lat'][0])) * RT
-data['posDown'] = - data['alt']
-
-# Rotate velocities from NED to body axes
-r = R.from_euler('ZYX', np.swapaxes([data['yaw'].values, data['pitch'].values, data['roll'].values], 0, 1), degrees=True)
-dcm = r.as_matrix()
-vned = np.moveaxis(np.expand_dims([data['vn'].values, data['ve'].values, data['vd'].values], 1), -1, 0)
-print(dcm.shape)
-print(vned.shape)
-vbody = np.matmul(np.linalg.inv(dcm), vned)
-print(vbody.shape)
-data['vx'] = vbody[:, 0, 0]
-data['vy'] = vbody[:, 1, 0]
-data['vz'] = vbody[:, 2, 0]
-
-# Set units
-data['roll'] = np.deg2rad(data['roll'])
-data['pitch'] = np.deg2rad(data['pitch'])
-data['yaw'] = np.deg2rad(data['yaw'])
-data['p'] = np.deg2rad(data['p'])
-data['q'] = np.deg2rad(data['q'])
-data['r'] = np.deg2rad(data['r'])
-data['vn'] /= 3.6
-data['ve'] /= 3.6
-data['vd'] /= 3.6
-data['vx'] /= 3.6
-data['vy'] /= 3.6
-data['vz'] /= 3.6
-
-# Plot vels and attitude
-data.plot(x='time', y=['vx', 'vy', 'vz'])
-data.plot(x='time', y=['roll', 'pitch', 'yaw'])
-data.plot(x='time', y=['vn', 've', 'vd'])
-plt.show()
-
-# Save data to file
-data.to_csv(path_or_buf='data_real_processed.csv',
-            columns=('da','de','dr','dt','roll','pitch','yaw','posNorth','posEast','posDown','vx','vy','vz','p','q','r'),
-            header=True)
\ No newline at end of file
+# Streaming pipeline: every stage takes an iterator of DataFrame chunks and yields processed chunks, so logs of any
+# size are processed with the memory of a few chunks
+EARTH_RADIUS = 6378000
+
+def ReadChunks(path, chunkSize=100000, timeStart=None, timeEnd=None, timeReference='time'):
+    # Chunks of a CSV log within [timeStart, timeEnd]. Reading stops after timeEnd, logs are sorted by time
+    for chunk in pd.read_csv(path, chunksize=chunkSize):
+        time = chunk[timeReference]
+        if timeStart is not None:
+            chunk = chunk[time >= timeStart]
+        if timeEnd is not None:
+            chunk = chunk[chunk[timeReference] <= timeEnd]
+            if time.iloc[-1] > timeEnd:
+                if len(chunk) > 0:
+                    yield chunk
+                break
+        if len(chunk) > 0:
+            yield chunk
+
+def ResampleChunks(chunks, frequency, timeReference='time'):
+    # Linear interpolation at multiples of 1 / frequency from the first sample, as ResamplePacket. The last sample of
+    # each chunk is kept to interpolate across the boundary with the next one
+    carry = None
+    time0 = None
+    k = 0
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        time = chunk[timeReference].values
+        if time0 is None:
+            time0 = time[0]
+        N = int(np.ceil((time[-1] - time0) * frequency)) - k # Samples strictly before the last time of the chunk
+        if N > 0:
+            newTime = time0 + np.arange(k, k + N) / frequency
+            newData = {name: np.interp(newTime, time, chunk[name].values) for name in chunk.columns if name != timeReference}
+            newData[timeReference] = newTime
+            k += N
+            yield pd.DataFrame(newData)
+        carry = chunk.iloc[-1:]
+
+def NedChunks(chunks, earthRadius=EARTH_RADIUS):
+    # Position relative to the first sample, in NED axes, from latitude, longitude and altitude
+    origin = None
+    for data in chunks:
+        if origin is None:
+            origin = (data['lat'].iloc[0], data['lon'].iloc[0])
+        data = data.copy()
+        data['posNorth'] = np.deg2rad(data['lat'] - origin[0]) * earthRadius
+        data['posEast'] = np.deg2rad(data['lon'] - origin[1]) * np.cos(np.deg2rad(origin[0])) * earthRadius
+        data['posDown'] = - data['alt']
+        yield data
+
+def BodyChunks(chunks):
+    # Velocities rotated from NED to body axes. The DCM is orthonormal, so its transpose is its inverse
+    for data in chunks:
+        r = R.from_euler('ZYX', np.column_stack([data['yaw'].values, data['pitch'].values, data['roll'].values]), degrees=True)
+        dcm = r.as_matrix()
+        vned = np.column_stack([data['vn'].values, data['ve'].values, data['vd'].values])
+        vbody = np.einsum('nji,nj->ni', dcm, vned)
+        data = data.copy()
+        data['vx'] = vbody[:, 0]
+        data['vy'] = vbody[:, 1]
+        data['vz'] = vbody[:, 2]
+        yield data
+
+def UnitChunks(chunks):
+    # Angles and rates from degrees to radians, velocities from km/h to m/s
+    for data in chunks:
+        data = data.copy()
+        for name in ['roll', 'pitch', 'yaw', 'p', 'q', 'r']:
+            data[name] = np.deg2rad(data[name])
+        for name in ['vn', 've', 'vd', 'vx', 'vy', 'vz']:
+            data[name] /= 3.6
+        yield data
+
+def TrajectoryChunks(chunks):
+    # The 17 columns of the trajectory format, with the sample index running across chunks
+    first = 0
+    for data in chunks:
+        trajectory = data[COLUMNS[1:]].set_index(pd.RangeIndex(first, first + len(data)))
+        first += len(data)
+        yield trajectory
+
+def WriteCsv(chunks, path):
+    # Same layout as DataFrame.to_csv with the index: a header row with an empty first name
+    nsamples = 0
+    for idx, chunk in enumerate(chunks):
+        chunk.to_csv(path_or_buf=path, mode='w' if idx == 0 else 'a', header=(idx == 0))
+        nsamples += len(chunk)
+    return nsamples
+
+class ChunkPlotter():
+
+    """Pipeline stage that passes chunks through, keeping up to maxPoints evenly spaced samples of the plotted columns.
+
+    Call show() once the pipeline has been consumed.
+    """
+
+    def __init__(self, chunks, timeReference='time', maxPoints=100000):
+        self.chunks = chunks
+        self.timeReference = timeReference
+        self.maxPoints = maxPoints
+        self.samples = []
+        self.count = 0
+        self.step = 1
+
+    def __iter__(self):
+        for data in self.chunks:
+            self.samples.append(data[[self.timeReference, 'vx', 'vy', 'vz', 'roll', 'pitch', 'yaw', 'vn', 've', 'vd']].iloc[::self.step])
+            self.count += len(self.samples[-1])
+            if self.count > self.maxPoints:
+                # Halve the resolution of everything kept so far
+                self.samples = [sample.iloc[::2] for sample in self.samples]
+                self.count = sum(len(sample) for sample in self.samples)
+                self.step *= 2
+            yield data
+
+    def show(self):
+        import matplotlib.pyplot as plt
+        plt.close("all")
+        data = pd.concat(self.samples)
+        data.plot(x=self.timeReference, y=['vx', 'vy', 'vz'])
+        data.plot(x=self.timeReference, y=['roll', 'pitch', 'yaw'])
+        data.plot(x=self.timeReference, y=['vn', 've', 'vd'])
+        plt.show()
+
+def ProcessLog(inputPath, outputPath, frequency=60, timeStart=None, timeEnd=None, chunkSize=100000, plot=False):
+    # Raw telemetry CSV to a trajectory CSV, chunk by chunk. Returns the number of samples written
+    chunks = ReadChunks(inputPath, chunkSize, timeStart, timeEnd)
+    chunks = ResampleChunks(chunks, frequency)
+    chunks = UnitChunks(BodyChunks(NedChunks(chunks)))
+    plotter = None
+    if plot:
+        plotter = ChunkPlotter(chunks)
+        chunks = iter(plotter)
+    nsamples = WriteCsv(TrajectoryChunks(chunks), outputPath)
+    if plotter is not None:
+        plotter.show()
+    return nsamples
+
+if __name__ == '__main__':
+    # Usage: python utils/process_real_data.py [real_data.csv] [data_real_processed.csv]
+    inputPath = sys.argv[1] if len(sys.argv) > 1 else 'real_data.csv'
+    outputPath = sys.argv[2] if len(sys.argv) > 2 else 'data_real_processed.csv'
+    ProcessLog(inputPath, outputPath, frequency=60, timeStart=1400, timeEnd=1420, plot=True) # Trim to desired time range, resample to 60 Hz
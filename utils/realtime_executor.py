@@ -0,0 +1,117 @@
+import json
+import time
+from threading import Event, Thread
+
+import numpy as np
+
+
+class RealTimeExecutor:
+
+    """Run `function` every `interval` seconds against monotonic deadlines, recording latency and jitter.
+
+    Frame k is due at start + k * interval, so timing errors do not accumulate. The thread sleeps until `spin`
+    seconds before each deadline and busy-waits the rest, trading CPU for lower jitter (spin=0 only sleeps).
+    When frames overrun, `overrun` selects what happens to the frames that were missed:
+
+    - 'catch-up': run them back to back, at most `maxCatchUp` per frame, dropping the rest.
+    - 'substep': call `substep` (e.g. a physics-only step, defaults to `function`) once per missed frame, then
+      `function` once.
+    - 'skip': drop them, as RepeatedTimer did, but count them.
+
+    Jitter is how late each frame starts with respect to its deadline, and latency is how long `function` takes.
+    stats() summarizes both, and they are written to `statsPath` as JSON when the executor stops.
+    """
+
+    def __init__(self, interval, function, *args, spin=0.001, overrun='catch-up', maxCatchUp=5, substep=None,
+                 statsPath=None, **kwargs):
+        if overrun not in ('catch-up', 'substep', 'skip'):
+            raise ValueError(f"overrun must be 'catch-up', 'substep' or 'skip', got {overrun!r}")
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.spin = spin
+        self.overrun = overrun
+        self.maxCatchUp = maxCatchUp
+        self.substep = substep if substep is not None else function
+        self.statsPath = statsPath
+        self.latency = []
+        self.jitter = []
+        self.overruns = 0 # Frames whose function took longer than interval
+        self.substeps = 0 # Missed frames run by catch-up or substepping
+        self.dropped = 0 # Missed frames never run
+        self.event = Event()
+        self.start = time.perf_counter()
+        self.thread = Thread(target=self._target)
+        self.thread.start()
+
+    def _target(self):
+        frame = 0
+        try:
+            while not self.event.is_set():
+                deadline = self.start + frame * self.interval
+                if self._wait(deadline):
+                    break
+                began = time.perf_counter()
+                self.function(*self.args, **self.kwargs)
+                finished = time.perf_counter()
+                self.jitter.append(began - deadline)
+                self.latency.append(finished - began)
+                if finished - began > self.interval:
+                    self.overruns += 1
+                frame += 1
+                missed = int((finished - self.start) / self.interval) - frame + 1
+                if missed > 0:
+                    frame += self._recover(missed)
+        finally:
+            if self.statsPath is not None:
+                self.export(self.statsPath)
+
+    def _wait(self, deadline):
+        # Sleeps until the deadline, spinning over its last part. Returns True if stopped meanwhile
+        remaining = deadline - self.spin - time.perf_counter()
+        if remaining > 0 and self.event.wait(remaining):
+            return True
+        while time.perf_counter() < deadline:
+            pass
+        return self.event.is_set()
+
+    def _recover(self, missed):
+        # Handles frames whose deadline passed while the previous one ran. Returns how many frames were consumed
+        if self.overrun == 'skip':
+            self.dropped += missed
+            return missed
+        if self.overrun == 'substep':
+            for _ in range(missed - 1):
+                self.substep(*self.args, **self.kwargs)
+            self.substeps += missed - 1
+            return missed - 1 # The last missed frame runs function, immediately
+        run = min(missed, self.maxCatchUp)
+        self.substeps += run
+        self.dropped += missed - run
+        for _ in range(run):
+            self.function(*self.args, **self.kwargs)
+        return missed
+
+    def stats(self, bins=50):
+        # Percentiles and histograms of latency and jitter, in seconds
+        summary = {'interval': self.interval, 'frames': len(self.latency), 'overruns': self.overruns,
+                   'substeps': self.substeps, 'dropped': self.dropped}
+        for name, values in (('latency', self.latency), ('jitter', self.jitter)):
+            values = np.array(values)
+            if values.size == 0:
+                summary[name] = None
+                continue
+            counts, edges = np.histogram(values, bins=bins)
+            summary[name] = {'p50': float(np.percentile(values, 50)), 'p99': float(np.percentile(values, 99)),
+                             'max': float(values.max()), 'mean': float(values.mean()),
+                             'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()}}
+        return summary
+
+    def export(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def stop(self):
+        self.event.set()
+        self.thread.join()
@@ -0,0 +1,133 @@
+import json, os.path, sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.trajectory_io import COLUMNS, loadTrajectory
+
+# Control surface driving each rate, one identification axis per pair
+AXES = [('da', 'p'), ('de', 'q'), ('dr', 'r')]
+
+def slidingRms(x, window, hop):
+    # RMS deviation of x from its median (trim) over windows starting every hop samples, from a cumulative sum.
+    # Unlike the standard deviation, it also captures sustained inputs such as a steady roll
+    x = np.asarray(x, dtype=np.float64)
+    x = x - np.median(x)
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    starts = np.arange(0, len(x) - window + 1, hop)
+    return starts, np.sqrt((s2[starts + window] - s2[starts]) / window)
+
+def windowMetrics(trajectory, frequency=60.0, window=2.0, hop=0.5):
+    """Excitation of every window of a (17, N) trajectory.
+
+    For each axis, the RMS deviations from trim of the control and of the rate it drives are divided by their median over
+    the log, and the axis score is their geometric mean. The score of a window is the sum over the three axes, so
+    windows where controls and response both move more than usual stand out.
+    """
+    window = int(round(window * frequency))
+    hop = max(1, int(round(hop * frequency)))
+    metrics = {}
+    score = 0.0
+    for control, rate in AXES:
+        starts, controlRms = slidingRms(trajectory[COLUMNS.index(control)], window, hop)
+        _, rateRms = slidingRms(trajectory[COLUMNS.index(rate)], window, hop)
+        metrics[control] = controlRms
+        metrics[rate] = rateRms
+        score = score + np.sqrt(controlRms / (np.median(controlRms) + 1e-9) * rateRms / (np.median(rateRms) + 1e-9))
+    metrics['score'] = score
+    table = pd.DataFrame(metrics)
+    table.insert(0, 'start', starts)
+    table.insert(1, 'end', starts + window)
+    return table
+
+def classify(trajectory, start, end, frequency=60.0):
+    # Full rotations about x or y are rolls and loops. Otherwise a control with a few large reversals is a doublet
+    # (or a 3-2-1-1), and anything else is generic excitation
+    if abs(np.sum(trajectory[COLUMNS.index('p'), start:end])) / frequency > 1.5 * np.pi:
+        return 'roll'
+    if abs(np.sum(trajectory[COLUMNS.index('q'), start:end])) / frequency > 1.5 * np.pi:
+        return 'loop'
+    for control, _ in AXES:
+        deviation = trajectory[COLUMNS.index(control), start:end] - np.median(trajectory[COLUMNS.index(control), start:end])
+        large = deviation[np.abs(deviation) > 0.5 * np.max(np.abs(deviation))] if np.any(deviation) else deviation[:0]
+        reversals = np.count_nonzero(np.diff(np.sign(large)) != 0)
+        if 1 <= reversals <= 4:
+            return 'doublet'
+    return 'excitation'
+
+def findSegments(trajectory, frequency=60.0, window=2.0, hop=0.5, threshold=4.0, maxDuration=20.0):
+    """Segments of consecutive windows scoring above threshold, best first.
+
+    Each segment carries the mean score of its windows and their peak RMS of every control and rate.
+
+    Segments longer than maxDuration seconds are split, so that each one can be fitted on its own. The pieces do not
+    overlap: each one starts where the previous one ends, so no sample is counted twice when they are fitted jointly.
+    """
+    windows = windowMetrics(trajectory, frequency, window, hop)
+    maxSamples = int(round(maxDuration * frequency))
+    segments = []
+    active = windows[windows['score'] > threshold]
+    start = end = None
+    members = []
+    for idx, first, last in zip(active.index, active['start'], active['end']):
+        if start is not None and first <= end and last - start <= maxSamples:
+            end = last
+            members.append(idx)
+            continue
+        if start is not None:
+            segments.append((start, end, members))
+        start = first if start is None else max(first, end)
+        end = last
+        members = [idx]
+    if start is not None:
+        segments.append((start, end, members))
+
+    rows = []
+    for start, end, members in segments:
+        inside = windows.loc[members]
+        row = {'start': int(start), 'end': int(end), 'duration': (end - start) / frequency,
+               'kind': classify(trajectory, start, end, frequency), 'score': float(inside['score'].mean())}
+        for control, rate in AXES:
+            row[control] = float(inside[control].max())
+            row[rate] = float(inside[rate].max())
+        rows.append(row)
+    columns = ['start', 'end', 'duration', 'kind', 'score'] + [name for axis in AXES for name in axis]
+    return pd.DataFrame(rows, columns=columns).sort_values('score', ascending=False, ignore_index=True)
+
+def indexPath(logPath):
+    return os.path.splitext(logPath)[0] + '.segments.csv'
+
+def buildIndex(logPath, frequency=60.0, window=2.0, hop=0.5, threshold=4.0, maxDuration=20.0):
+    # Scans a processed log once and stores its segments next to it, after a comment line with the settings used.
+    # Returns the index
+    settings = {'frequency': frequency, 'window': window, 'hop': hop, 'threshold': threshold, 'maxDuration': maxDuration}
+    index = findSegments(loadTrajectory(logPath), **settings)
+    with open(indexPath(logPath), 'w', newline='') as file:
+        file.write('# ' + json.dumps(settings) + '\n')
+        index.to_csv(file, index=False)
+    return index
+
+def loadIndex(logPath, frequency=60.0, window=2.0, hop=0.5, threshold=4.0, maxDuration=20.0):
+    # Index of a log, built on first use, when the log is newer than it or when it was built with other settings
+    settings = {'frequency': frequency, 'window': window, 'hop': hop, 'threshold': threshold, 'maxDuration': maxDuration}
+    path = indexPath(logPath)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(logPath):
+        with open(path) as file:
+            header = file.readline()
+        if header.startswith('# ') and json.loads(header[2:]) == settings:
+            return pd.read_csv(path, skiprows=1)
+    return buildIndex(logPath, **settings)
+
+def addSegments(optimizer, index, N=None, minScore=0.0, kinds=None):
+    # Registers the N best segments of an index in an Optimizer, to be fitted jointly
+    selected = index[index['score'] >= minScore]
+    if kinds is not None:
+        selected = selected[selected['kind'].isin(kinds)]
+    if N is not None:
+        selected = selected.head(N)
+    for start, end in zip(selected['start'], selected['end']):
+        optimizer.addSegment(int(start), int(end - start))
+    return selected
+
+if __name__ == '__main__':
+    # Usage: python utils/segment_index.py data.csv
+    print(buildIndex(sys.argv[1]).to_string())
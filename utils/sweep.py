@@ -0,0 +1,40 @@
+import hashlib, os.path, sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.trajectory_io import contentHash
+from utils.fitness_cache import modelSettings
+
+def trajectoryHash(model):
+    """SHA-1 of the trajectory samples currently loaded in an optimcore model."""
+    return contentHash(model.getTrajectory())
+
+def gridAxes(ranges, resolution):
+    """Values taken by each swept coefficient, as sweep_grid spaces them."""
+    resolution = np.broadcast_to(resolution, (len(ranges),))
+    return [np.linspace(lower, upper, n, dtype=np.float32) for (lower, upper), n in zip(ranges, resolution)]
+
+def sweepGrid(model, coeffs, paramIndices, ranges, resolution, useLinVels=False, numberOfSamplesToUse=-1, cacheDir=None):
+    """Fitness over a regular grid of the coefficients in paramIndices, the others fixed to coeffs.
+
+    The grid is evaluated in parallel by the native Model.sweep_grid and returned with one axis per swept
+    coefficient. With cacheDir, results are stored there as .npy files keyed by the trajectory hash, the
+    coefficient vector, the sweep settings and the model settings, and reused on later calls with the same inputs.
+    """
+    coeffs = np.ascontiguousarray(coeffs, dtype=np.float32)
+    paramIndices = np.ascontiguousarray(paramIndices, dtype=np.int64)
+    ranges = np.ascontiguousarray(ranges, dtype=np.float32).reshape(len(paramIndices), 2)
+    resolution = np.ascontiguousarray(np.broadcast_to(resolution, paramIndices.shape), dtype=np.int64)
+    path = None
+    if cacheDir is not None:
+        key = hashlib.sha1(trajectoryHash(model).encode())
+        for array in (coeffs, paramIndices, ranges, resolution):
+            key.update(array.tobytes())
+        key.update(repr((bool(useLinVels), int(numberOfSamplesToUse)) + modelSettings(model)).encode())
+        path = os.path.join(cacheDir, key.hexdigest() + '.npy')
+        if os.path.exists(path):
+            return np.load(path)
+    z = model.sweep_grid(coeffs, paramIndices, ranges, resolution, useLinVels, numberOfSamplesToUse)
+    if path is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        np.save(path, z)
+    return z
@@ -0,0 +1,119 @@
+import hashlib, io, os.path, sys
+import numpy as np
+import pandas as pd
+
+# Rows of the (17, N) trajectory array used by optimcore, same order as the columns of the CSV logs
+COLUMNS = ['index', 'da', 'de', 'dr', 'dt', 'roll', 'pitch', 'yaw', 'posNorth', 'posEast', 'posDown', 'vx', 'vy', 'vz', 'p', 'q', 'r']
+# Columns stored in radians or rad/s, shown in degrees
+ANGLES = ['roll', 'pitch', 'yaw', 'p', 'q', 'r']
+
+def fromDataFrame(df):
+    """Builds a C-contiguous float32 (17, N) trajectory from a DataFrame with the log columns."""
+    trajectory = np.empty((len(COLUMNS), df.shape[0]), dtype=np.float32)
+    trajectory[0] = np.arange(df.shape[0])
+    for row, name in enumerate(COLUMNS[1:], start=1):
+        trajectory[row] = df[name].values
+    return trajectory
+
+def toDataFrame(trajectory):
+    return pd.DataFrame({name: trajectory[row] for row, name in enumerate(COLUMNS) if row > 0})
+
+def readCsv(path):
+    return fromDataFrame(pd.read_csv(path, dtype=np.float32))
+
+def saveNpy(path, trajectory):
+    """Stores a trajectory as a .npy file that optimcore and NumPy can read or memory-map directly."""
+    trajectory = np.ascontiguousarray(trajectory, dtype=np.float32)
+    if trajectory.ndim != 2 or trajectory.shape[0] != len(COLUMNS):
+        raise ValueError(f'Trajectory must have shape ({len(COLUMNS)}, N), got {trajectory.shape}')
+    np.save(path, trajectory)
+
+def loadNpy(path, mmap=True):
+    trajectory = np.load(path, mmap_mode='r' if mmap else None)
+    if trajectory.dtype != np.float32 or trajectory.ndim != 2 or trajectory.shape[0] != len(COLUMNS):
+        raise ValueError(f'{path} does not hold a float32 ({len(COLUMNS)}, N) trajectory')
+    return trajectory
+
+def contentHash(trajectory):
+    """SHA-1 of the samples of a trajectory, independent of where they were loaded from."""
+    return hashlib.sha1(np.ascontiguousarray(trajectory, dtype=np.float32).tobytes()).hexdigest()
+
+def loadTrajectory(path, mmap=True):
+    # .npy files are memory-mapped, anything else is parsed as a CSV log
+    if path.endswith('.npy'):
+        return loadNpy(path, mmap)
+    return readCsv(path)
+
+def saveTrajectory(path, trajectory):
+    # .npy files are stored as they are, anything else as a CSV log
+    if path.endswith('.npy'):
+        saveNpy(path, trajectory)
+    else:
+        toDataFrame(trajectory).to_csv(path_or_buf=path)
+
+def csvToNpy(csvPath, npyPath=None):
+    if npyPath is None:
+        npyPath = os.path.splitext(csvPath)[0] + '.npy'
+    saveNpy(npyPath, readCsv(csvPath))
+    return npyPath
+
+class TrajectoryStore():
+
+    """A log parsed once into the float32 (17, N) array that optimcore uses without copying, plus its metadata.
+
+    Indexing by column name gives display units (angles and rates in degrees). These views and the time vector
+    are computed on first use and cached.
+    """
+
+    def __init__(self, trajectory, frequency=60.0, name=''):
+        self.trajectory = np.ascontiguousarray(trajectory, dtype=np.float32)
+        if self.trajectory.ndim != 2 or self.trajectory.shape[0] != len(COLUMNS):
+            raise ValueError(f'Trajectory must have shape ({len(COLUMNS)}, N), got {self.trajectory.shape}')
+        self.frequency = frequency
+        self.name = name
+        self._views = {}
+        self._time = None
+
+    @classmethod
+    def fromBytes(cls, data, filename, frequency=60.0):
+        # Uploaded file contents: a .npy trajectory, an Excel sheet or a CSV log
+        if filename.endswith('.npy'):
+            trajectory = np.load(io.BytesIO(data))
+        elif 'xls' in filename:
+            trajectory = fromDataFrame(pd.read_excel(io.BytesIO(data), dtype=np.float32))
+        else:
+            trajectory = fromDataFrame(pd.read_csv(io.BytesIO(data), dtype=np.float32))
+        return cls(trajectory, frequency, filename)
+
+    @property
+    def nsamples(self):
+        return self.trajectory.shape[1]
+
+    @property
+    def metadata(self):
+        return {'name': self.name, 'frequency': self.frequency, 'nsamples': self.nsamples, 'columns': COLUMNS}
+
+    @property
+    def time(self):
+        if self._time is None:
+            self._time = np.arange(self.nsamples, dtype=np.float32) / np.float32(self.frequency)
+        return self._time
+
+    def column(self, name):
+        # Row of the trajectory as stored, without copying
+        return self.trajectory[COLUMNS.index(name)]
+
+    def __getitem__(self, name):
+        if name not in ANGLES:
+            return self.column(name)
+        if name not in self._views:
+            self._views[name] = np.rad2deg(self.column(name))
+        return self._views[name]
+
+    def head(self, N=5):
+        # First samples in display units, as a table
+        return pd.DataFrame({name: self[name][:N] for name in COLUMNS[1:]})
+
+if __name__ == '__main__':
+    # Usage: python utils/trajectory_io.py data.csv [data.npy]
+    print(csvToNpy(*sys.argv[1:3]))
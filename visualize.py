@@ -3,16 +3,16 @@ from matplotlib.colors import BoundaryNorm
 from matplotlib.ticker import MaxNLocator
 import optimcore as optim
 import numpy as np
-import pandas as pd
+from utils.sweep import sweepGrid, gridAxes
 
 plt.rc('text', usetex=True)
 plt.rc('font', family='serif')
 
 frequency = 60.0
 trajFile = "/home/fidel/repos/deepaero/data_clean.csv"
-nsamples = pd.read_csv(trajFile).shape[0]
 model = optim.Model(frequency)
-model.loadTrajectory(trajFile, nsamples)
+model.loadTrajectory(trajFile, 0)
+model.setThreads(0)
 NP = 100
 MIN = 0.5
 MAX = 1.5
@@ -20,9 +20,7 @@ NROWS = 4
 NCOLS = 2
 useLinVels = False
 numberOfSamplesToUse = -1
-
-# make these smaller to increase the resolution
-dx, dy = 1 / NP, 1 / NP
+cacheDir = 'sweep_cache' # grids already computed for this trajectory are loaded from here
 
 aero = [0.05, 0.01, 0.15, -0.4, 0, 0.19, 0, 0.4, 0.1205, 5.7, -0.0002, -0.33, 0.021, -0.79, 0.075, 0, -1.23, 0, -1.1, 0, -7.34, 0.21, -0.014, -0.11, -0.024, -0.265]
 aero[9] /= 100 # parameter encoding
@@ -45,39 +43,11 @@ for row in range(NROWS):
         np.random.shuffle(param_idx_list)
         PARAM1 = param_idx_list[0]
         PARAM2 = param_idx_list[1]
-        orig1 = orig[PARAM1]
-        orig2 = orig[PARAM2]
-        x = []
-        y = []
-        z = []
-        for x_scale in range(NP):
-            x_row = []
-            y_row = []
-            z_row = []
-            for y_scale in range(NP):
-                xval = ((MAX - MIN) * x_scale / NP + MIN)
-                yval = ((MAX - MIN) * y_scale / NP + MIN)
-                aero[PARAM1] = orig1 * xval
-                aero[PARAM2] = orig2 * yval
-                x_row.append(xval)
-                y_row.append(yval)
-                z_row.append(model.evaluate(aero[0], aero[1], aero[2], aero[3],
-                                            aero[4], aero[5], aero[6], aero[7],
-                                            aero[8], aero[9], aero[10], aero[11],
-                                            aero[12], aero[13], aero[14], aero[15],
-                                            aero[16], aero[17], aero[18], aero[19],
-                                            aero[20], aero[21], aero[22], aero[23],
-                                            aero[24], aero[25], useLinVels, numberOfSamplesToUse))
-            x.append(x_row)
-            y.append(y_row)
-            z.append(z_row)
-        x = np.array(x)
-        y = np.array(y)
-        z = np.array(z)
+        ranges = [(orig[PARAM1] * MIN, orig[PARAM1] * MAX), (orig[PARAM2] * MIN, orig[PARAM2] * MAX)]
+        z = sweepGrid(model, aero, [PARAM1, PARAM2], ranges, NP, useLinVels, numberOfSamplesToUse, cacheDir)
+        # Scale factors of both coefficients at each grid point
+        x, y = np.meshgrid(*gridAxes([(MIN, MAX), (MIN, MAX)], NP), indexing='ij')
 
-        # x and y are bounds, so z should be the value *inside* those bounds.
-        # Therefore, remove the last value from the z array.
-        z = z[:-1, :-1]
         levels = MaxNLocator(nbins=50).tick_values(z.min(), z.max())
 
         # pick the desired colormap, sensible levels, and define a normalization
@@ -89,11 +59,7 @@ for row in range(NROWS):
         ax.set_xlabel(names[PARAM1], fontsize=16)
         ax.set_ylabel(names[PARAM2], fontsize=16)
 
-        # contours are *point* based plots, so convert our bound into point
-        # centers
-        cf = ax.contourf(x[:-1, :-1] + dx/2.,
-                        y[:-1, :-1] + dy/2., z, levels=levels,
-                        cmap=cmap)
+        cf = ax.contourf(x, y, z, levels=levels, cmap=cmap)
         fig.colorbar(cf, ax=ax)
         ax.set_aspect('equal', adjustable='box')
         print(f'Graph {1 + col + NCOLS * row}/{NROWS * NCOLS} generated.')